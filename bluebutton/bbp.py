@@ -8,6 +8,11 @@ import os, sys
 # from bluebutton.parse import *
 from parse import *
 from cms_parser import *
+from cms_batch import cms_batch, print_summary
+from cms_sections import cms_section_index, cms_section_parse
+from cms_parallel import cms_parallel_parse
+from cms_cache import CACHE_ENV, ParseCache
+from cms_incremental import cms_incremental_parse, load_state, save_state
 
 if __name__ == "__main__":
     """
@@ -19,39 +24,61 @@ if __name__ == "__main__":
         infile = sys.argv[2]
         outfile = sys.argv[3]
         if len(sys.argv) == 5:
-            level = int(sys.argv[4])
+            if outtype == "CMSSECTIONS":
+                sections = sys.argv[4].split(",")
+            elif outtype == "CMSINCREMENTAL":
+                statefile = sys.argv[4]
+            else:
+                level = int(sys.argv[4])
     except IndexError:
         print "You must supply an an infile and an outfile."
         print "Example: bbp.py ",
         print "[all|bp|wt|mds|green|segments|bluebutton|CMS|CMSFILE]", \
               "bluebutton_infile.txt ",\
               "bluebutton_outfile.json [level]"
+        print "Batch: bbp.py CMSBATCH", \
+              "[infile_dir|'infile_glob'|manifest.txt]", \
+              "outfile_dir [workers]"
+        print "Sections: bbp.py CMSSECTIONS bluebutton_infile.txt", \
+              "bluebutton_outfile.json [patient,medications,claims]"
+        print "Parallel: bbp.py CMSPARALLEL bluebutton_infile.txt", \
+              "bluebutton_outfile.json [workers]"
+        print "Incremental: bbp.py CMSINCREMENTAL bluebutton_infile.txt", \
+              "bluebutton_outfile.json [statefile]"
+        print "Set %s to a directory to cache CMSFILE and" % CACHE_ENV, \
+              "CMSBATCH results"
         exit(1)
 
     try:
-        items = simple_parse(infile)
+        if outtype in ["all", "bp", "wt", "mds", "d"]:
+            items = simple_parse(infile)
 
         if outtype == "green":
             green_parse(infile, outfile, level)
 
         if outtype == "all":
-            print tojson(items)
+            write_json(items, sys.stdout)
+            print
 
         if outtype == "bp":
             bpdictlist = build_bp_readings(items)
-            print tojson(bpdictlist)
+            write_json(bpdictlist, sys.stdout)
+            print
 
         if outtype == "wt":
             wtdictlist = build_wt_readings(items)
-            print tojson(wtdictlist)
+            write_json(wtdictlist, sys.stdout)
+            print
 
         if outtype == "mds":
             mdsdictlist = build_mds_readings(items)
-            print tojson(mdsdictlist)
+            write_json(mdsdictlist, sys.stdout)
+            print
 
         if outtype == "d":
             demodict = build_simple_demographics_readings(items)
-            print tojson(demodict)
+            write_json(demodict, sys.stdout)
+            print
 
         if outtype == "segments":
             demodict = section_parse(infile)
@@ -69,16 +96,65 @@ if __name__ == "__main__":
             result = write_file(demodict, outfile)
 
         if outtype == "CMSFILE":
-            demodict = cms_file_read(infile)
-            outdict = parse_lines(demodict)
+            # single pass: same result as parse_lines(cms_file_read())
+            if os.environ.get(CACHE_ENV):
+                outdict = ParseCache(os.environ[CACHE_ENV]).parse(infile)
+            else:
+                outdict = cms_stream_parse(infile)
             result = write_file(outdict, outfile)
 
         if outtype == "CMSDICT":
             # Det the interim file
-            demodict = cms_file_read(infile)
+            demodict = cms_file_read(infile).to_f_lines()
 
             result = write_file(demodict, outfile)
 
+        if outtype == "CMSBATCH":
+            # infile = directory, glob or manifest. outfile = output dir
+            # level (optional) = number of worker processes
+            cache_dir = os.environ.get(CACHE_ENV) or None
+            if len(sys.argv) == 5:
+                summary = cms_batch(infile, outfile, level,
+                                    cache_dir=cache_dir)
+            else:
+                summary = cms_batch(infile, outfile, cache_dir=cache_dir)
+            print_summary(summary)
+
+        if outtype == "CMSSECTIONS":
+            # Only parse the sections named (out_dict keys)
+            # With no names write the section index instead
+            if len(sys.argv) == 5:
+                outdict = cms_section_parse(infile, sections)
+            else:
+                outdict = cms_section_index(infile)
+            result = write_file(outdict, outfile)
+
+        if outtype == "CMSPARALLEL":
+            # One large file parsed a section (or run of claims) per
+            # worker. level (optional) = number of worker processes
+            if len(sys.argv) == 5:
+                outdict = cms_parallel_parse(infile, level)
+            else:
+                outdict = cms_parallel_parse(infile)
+            result = write_file(outdict, outfile)
+
+        if outtype == "CMSINCREMENTAL":
+            # Only re-parse the sections that changed since the run that
+            # wrote statefile (default: outfile.state)
+            if len(sys.argv) != 5:
+                statefile = outfile + ".state"
+            outdict, state, report = cms_incremental_parse(
+                infile, load_state(statefile))
+            result = write_file(outdict, outfile)
+            save_state(state, statefile)
+            reused = []
+            for r in report:
+                if r["reused"] and r["name"] not in reused:
+                    reused.append(r["name"])
+            print "Re-used %d of %d sections:" % (
+                len([r for r in report if r["reused"]]), len(report)), \
+                ", ".join(reused)
+
     except():
         print "An unexpected error occurred. Here is the post-mortem:"
         print sys.exc_info()
\ No newline at end of file
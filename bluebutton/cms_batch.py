@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+"""
+python-bluebutton
+FILE: cms_batch
+Created: 10/18/16 9:10 AM
+
+Convert many CMS BlueButton text files to json across a pool of
+worker processes
+
+"""
+__author__ = 'Mark Scrimshire:@ekivemark'
+
+import glob
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+
+from parse import write_file
+from cms_parser import cms_stream_parse
+from cms_cache import ParseCache
+
+# cache_dir -> ParseCache for this process (see batch_cache)
+BATCH_CACHES = {}
+
+
+def cms_batch(source, outdir, workers=None, chunksize=1, cache_dir=None):
+    # Convert every file named by source and write <name>.json to outdir
+    # source can be a directory, a glob pattern or a manifest file
+    # workers = number of processes. None uses one per cpu.
+    # workers=1 runs in this process (handy for debugging)
+    # cache_dir = cms_cache directory the workers share (None = no cache)
+
+    # Returns a summary dict with aggregate throughput and a "results"
+    # list holding one result per file in the order of source.
+    # A file that fails to convert is recorded as an error in results
+    # and does not stop the batch
+
+    jobs = batch_jobs(batch_files(source), outdir, cache_dir)
+
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+
+    strt = time.time()
+    if workers == 1:
+        results = [batch_convert(job) for job in jobs]
+    else:
+        pool = multiprocessing.Pool(workers, batch_init)
+        try:
+            results = pool.map(batch_convert, jobs, chunksize)
+        finally:
+            pool.close()
+            pool.join()
+    elapsed = time.time() - strt
+
+    return batch_summary(results, elapsed)
+
+
+def batch_convert(job):
+    # Worker: parse one file and write the json
+    # job = (infile, outfile, cache_dir)
+    # Never raises. The outcome is returned in the result dict
+    # cache = "hit" or "miss" when there is a cache_dir
+
+    infile, outfile, cache_dir = job
+
+    result = {"infile": infile,
+              "outfile": outfile,
+              "status": "ok",
+              "error": "",
+              "cache": "",
+              "bytes": 0,
+              "seconds": 0.0}
+
+    strt = time.time()
+    try:
+        result["bytes"] = os.path.getsize(infile)
+        if cache_dir is None:
+            out_dict = cms_stream_parse(infile)
+        else:
+            cache = batch_cache(cache_dir)
+            hits = cache.stats["hits"]
+            out_dict = cache.parse(infile)
+            result["cache"] = "hit" if cache.stats["hits"] > hits else "miss"
+        write_file(out_dict, outfile)
+    except Exception:
+        result["status"] = "error"
+        result["error"] = traceback.format_exc().strip().splitlines()[-1]
+        if os.path.exists(outfile):
+            # do not leave a partly written file behind
+            os.remove(outfile)
+    result["seconds"] = time.time() - strt
+
+    return result
+
+
+def batch_cache(cache_dir):
+    # The ParseCache this process uses for cache_dir. One per process
+    # so the cache keeps its running size instead of scanning the
+    # directory again for every file
+
+    if cache_dir not in BATCH_CACHES:
+        BATCH_CACHES[cache_dir] = ParseCache(cache_dir)
+    return BATCH_CACHES[cache_dir]
+
+
+def batch_files(source):
+    # Turn source in to a sorted list of input files
+    # directory = every file in the directory
+    # glob pattern = every file that matches (eg. downloads/*.txt)
+    # anything else is a manifest file with one path per line.
+    # Blank lines and lines starting with # are skipped and relative
+    # paths are taken from the manifest's directory
+
+    if os.path.isdir(source):
+        files = [os.path.join(source, f) for f in os.listdir(source)]
+        return sorted(f for f in files if os.path.isfile(f))
+
+    if glob.has_magic(source):
+        return sorted(f for f in glob.glob(source) if os.path.isfile(f))
+
+    files = []
+    base = os.path.dirname(source)
+    with open(source, 'r') as f:
+        for l in f:
+            l = l.strip()
+            if l == "" or l.startswith("#"):
+                continue
+            files.append(os.path.join(base, l))
+    return files
+
+
+def batch_init():
+    # Pool initializer: runs once in each worker
+    # Importing cms_parser compiles SEG_DEF in to SEG_INDEX. With fork
+    # the workers inherit the parent's copy. Elsewhere the import here
+    # builds it once per worker rather than once per file
+
+    import cms_parser_utilities
+
+
+def batch_jobs(files, outdir, cache_dir=None):
+    # Pair each input file with its json output file in outdir
+    # Raises ValueError if two input files would be written to the same
+    # output file (eg. a/claims.txt and b/claims.txt)
+
+    jobs = []
+    outfiles = {}
+    for infile in files:
+        name = os.path.splitext(os.path.basename(infile))[0]
+        outfile = os.path.join(outdir, name + ".json")
+        if outfile in outfiles:
+            raise ValueError("%s and %s would both be written to %s" %
+                             (outfiles[outfile], infile, outfile))
+        outfiles[outfile] = infile
+        jobs.append((infile, outfile, cache_dir))
+    return jobs
+
+
+def batch_summary(results, elapsed):
+    # Aggregate the per file results
+
+    total_bytes = sum(r["bytes"] for r in results)
+    failed = [r for r in results if r["status"] != "ok"]
+
+    if elapsed > 0:
+        files_per_sec = len(results) / elapsed
+        mb_per_sec = total_bytes / (1024.0 * 1024.0) / elapsed
+    else:
+        files_per_sec = 0.0
+        mb_per_sec = 0.0
+
+    return {"files": len(results),
+            "ok": len(results) - len(failed),
+            "failed": len(failed),
+            "bytes": total_bytes,
+            "seconds": elapsed,
+            "files_per_sec": files_per_sec,
+            "mb_per_sec": mb_per_sec,
+            "cache_hits": len([r for r in results if r["cache"] == "hit"]),
+            "cache_misses": len([r for r in results
+                                 if r["cache"] == "miss"]),
+            "results": results}
+
+
+def print_summary(summary, out=sys.stdout):
+    # Print failed files and the throughput line
+
+    for r in summary["results"]:
+        if r["status"] != "ok":
+            out.write("FAILED %s: %s\n" % (r["infile"], r["error"]))
+
+    out.write("%d files (%d ok, %d failed) in %.2fs: "
+              "%.1f files/s, %.2f MB/s\n" % (summary["files"],
+                                              summary["ok"],
+                                              summary["failed"],
+                                              summary["seconds"],
+                                              summary["files_per_sec"],
+                                              summary["mb_per_sec"]))
+    if summary["cache_hits"] or summary["cache_misses"]:
+        out.write("cache: %d hits, %d misses\n" % (summary["cache_hits"],
+                                                   summary["cache_misses"]))
@@ -0,0 +1,629 @@
+#!/usr/bin/env python
+"""
+python-bluebutton
+FILE: cms_benchmark
+Created: 10/18/16 2:15 PM
+
+Time the parser stages and bbp.py output types on the bundled sample
+and on generated files of increasing size.
+
+Each (input, stage) run happens in its own child process so peak RSS
+is for that run alone. Results are written as json so two revisions
+can be compared:
+
+python cms_benchmark.py run results.json [claims,claims,...]
+python cms_benchmark.py compare old.json new.json [threshold]
+
+"dates" checks the hand written parse_date / parse_time against
+strptime and times the two:
+
+python cms_benchmark.py dates
+
+"model" measures the memory a claim takes as dicts and as cms_model
+records (Linux only, it reads /proc):
+
+python cms_benchmark.py model [claims]
+
+"""
+__author__ = 'Mark Scrimshire:@ekivemark'
+
+import datetime
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import traceback
+
+import cms_model
+import cms_parser
+import cms_parser_utilities
+import cms_sections
+import parse
+
+from cms_generator import cms_generate
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           "..", "BlueButtonText-2.txt")
+
+# Number of claims in each generated input (5 lines per claim)
+DEFAULT_SIZES = [10, 100, 1000]
+
+# Results each model_memory() child keeps, so the claims outweigh
+# whatever else the parse leaves behind
+MODEL_COPIES = 5
+
+# Functions that run inside parse_lines. They are timed by wrapping
+# every module level reference to them for the length of the run.
+# (name, modules that call it)
+INNER_STAGES = [("process_subseg", [cms_parser]),
+                ("custom_family_history", [cms_parser]),
+                ("build_address", [cms_parser_utilities])]
+
+
+def stage_cms_file_read(inPath, outPath):
+    return cms_parser.cms_file_read(inPath)
+
+
+def stage_cms_file_read_mmap(inPath, outPath):
+    return cms_parser.cms_file_read(inPath, "mmap")
+
+
+def stage_parse_lines(ln_list, outPath):
+    # The inner stages are timed inside this one
+    return cms_parser.parse_lines(ln_list)
+
+
+def stage_cms_stream_parse(inPath, outPath):
+    return cms_parser.cms_stream_parse(inPath)
+
+
+def stage_cms_stream_parse_mmap(inPath, outPath):
+    return cms_parser.cms_stream_parse(inPath, "mmap")
+
+
+def stage_write_file(out_dict, outPath):
+    return parse.write_file(out_dict, outPath)
+
+
+def stage_tojson(out_dict, outPath):
+    return parse.tojson(out_dict)
+
+
+def stage_cms_file_parse(inPath, outPath):
+    return cms_parser.cms_file_parse(inPath)
+
+
+def stage_cms_file_parse2(inPath, outPath):
+    return cms_parser.cms_file_parse2(inPath)
+
+
+def stage_bb_file_parse(inPath, outPath):
+    return parse.bb_file_parse(inPath)
+
+
+def stage_bb_file_parse_mmap(inPath, outPath):
+    return parse.bb_file_parse(inPath, "mmap")
+
+
+def stage_section_parse(inPath, outPath):
+    return parse.section_parse(inPath)
+
+
+def stage_cms_section_index(inPath, outPath):
+    return cms_sections.cms_section_index(inPath)
+
+
+def stage_cms_section_index_mmap(inPath, outPath):
+    return cms_sections.cms_section_index(inPath, "mmap")
+
+
+def bbp_stage(outtype):
+    # Run bbp.py the way the command line does. Includes interpreter
+    # start up so compare these with each other rather than the stages
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "bbp.py")
+
+    def run_bbp(inPath, outPath):
+        with open(os.devnull, 'w') as devnull:
+            rc = subprocess.call([sys.executable, script, outtype,
+                                  inPath, outPath],
+                                 stdout=devnull, stderr=subprocess.STDOUT)
+        if rc != 0:
+            raise RuntimeError("bbp.py %s exited with %d" % (outtype, rc))
+    return run_bbp
+
+
+# (stage name, setup, stage) in the order they are run
+# setup (untimed) turns the input path in to what the stage is passed.
+# None passes the path
+STAGES = [("cms_file_read", None, stage_cms_file_read),
+          ("cms_file_read.mmap", None, stage_cms_file_read_mmap),
+          ("parse_lines", cms_parser.cms_file_read, stage_parse_lines),
+          ("cms_stream_parse", None, stage_cms_stream_parse),
+          ("cms_stream_parse.mmap", None, stage_cms_stream_parse_mmap),
+          ("write_file", cms_parser.cms_stream_parse, stage_write_file),
+          ("tojson", cms_parser.cms_stream_parse, stage_tojson),
+          ("cms_file_parse", None, stage_cms_file_parse),
+          ("cms_file_parse2", None, stage_cms_file_parse2),
+          ("bb_file_parse", None, stage_bb_file_parse),
+          ("bb_file_parse.mmap", None, stage_bb_file_parse_mmap),
+          ("section_parse", None, stage_section_parse),
+          ("cms_section_index", None, stage_cms_section_index),
+          ("cms_section_index.mmap", None, stage_cms_section_index_mmap)]
+
+for outtype in ["all", "bp", "wt", "mds", "d", "green", "segments",
+                "bluebutton", "CMS", "CMSFILE", "CMSDICT"]:
+    STAGES.append(("bbp." + outtype, None, bbp_stage(outtype)))
+
+
+def benchmark(sizes=None, stages=None, seed=0, workdir=None):
+    # Run every stage against the sample file and a generated file per
+    # entry in sizes. Returns the results dict that save_results writes
+
+    if sizes is None:
+        sizes = DEFAULT_SIZES
+    run_stages = [s for s in STAGES if stages is None or s[0] in stages]
+
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix="cms_benchmark")
+
+    inputs = [("sample", SAMPLE_FILE)]
+    for claims in sizes:
+        inPath = os.path.join(workdir, "generated_%d.txt" % claims)
+        cms_generate(inPath, seed, claims=claims, claim_lines=5)
+        inputs.append(("generated_%d" % claims, inPath))
+
+    results = {"python": platform.python_version(),
+               "platform": platform.platform(),
+               "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "seed": seed,
+               "runs": []}
+
+    for input_name, inPath in inputs:
+        for stage_name, setup, stage in run_stages:
+            run = run_stage(stage_name, setup, stage, input_name, inPath,
+                            os.path.join(workdir, "out.json"))
+            results["runs"].append(run)
+
+    return results
+
+
+def run_stage(stage_name, setup, stage, input_name, inPath, outPath):
+    # Run one stage on one input in a child process
+    # Returns a dict with wall time, throughput and peak RSS
+
+    with open(inPath, 'r') as f:
+        lines = sum(1 for l in f)
+    size = os.path.getsize(inPath)
+
+    queue = multiprocessing.Queue()
+    child = multiprocessing.Process(target=_child_run,
+                                    args=(queue, setup, stage,
+                                          inPath, outPath))
+    child.start()
+    run = queue.get()
+    child.join()
+
+    run.update({"stage": stage_name,
+                "input": input_name,
+                "lines": lines,
+                "bytes": size})
+    if run["status"] == "ok" and run["seconds"] > 0:
+        run["lines_per_sec"] = lines / run["seconds"]
+        run["mb_per_sec"] = size / (1024.0 * 1024.0) / run["seconds"]
+    else:
+        run["lines_per_sec"] = 0.0
+        run["mb_per_sec"] = 0.0
+    return run
+
+
+def _child_run(queue, setup, stage, inPath, outPath):
+    # Runs in the child. Output from the legacy parsers is thrown away
+
+    run = {"status": "ok", "error": "", "seconds": 0.0, "inner": {}}
+
+    stage_input = inPath
+    if setup is not None:
+        try:
+            stage_input = setup(inPath)
+        except Exception:
+            run["status"] = "error"
+            run["error"] = "setup: " + _last_line(traceback.format_exc())
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    timers = _wrap_inner_stages()
+    try:
+        if run["status"] == "ok":
+            strt = time.time()
+            try:
+                stage(stage_input, outPath)
+            except Exception:
+                run["status"] = "error"
+                run["error"] = _last_line(traceback.format_exc())
+            run["seconds"] = time.time() - strt
+    finally:
+        _unwrap_inner_stages(timers)
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    for name, timer in timers.items():
+        if timer["calls"] > 0:
+            run["inner"][name] = {"calls": timer["calls"],
+                                  "seconds": timer["seconds"]}
+
+    # ru_maxrss is in KB on Linux (bytes on OS X)
+    # RUSAGE_CHILDREN covers the bbp.py runs
+    run["peak_rss_kb"] = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+    queue.put(run)
+
+
+def _last_line(tb):
+    return tb.strip().splitlines()[-1]
+
+
+def _wrap_inner_stages():
+    # Swap each INNER_STAGES function for a timing wrapper
+    # Time is inclusive and only counted for the outermost call
+
+    timers = {}
+    for name, modules in INNER_STAGES:
+        timer = {"calls": 0, "seconds": 0.0, "depth": 0, "saved": []}
+        func = getattr(modules[0], name)
+        wrapper = _timed(func, timer)
+        for module in modules:
+            timer["saved"].append((module, getattr(module, name)))
+            setattr(module, name, wrapper)
+        timers[name] = timer
+    return timers
+
+
+def _unwrap_inner_stages(timers):
+    for timer in timers.values():
+        for module, func in timer["saved"]:
+            setattr(module, func.__name__, func)
+
+
+def _timed(func, timer):
+    def wrapper(*args, **kwargs):
+        timer["calls"] += 1
+        timer["depth"] += 1
+        strt = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timer["depth"] -= 1
+            if timer["depth"] == 0:
+                timer["seconds"] += time.time() - strt
+    return wrapper
+
+
+def date_inputs():
+    # Every day from 1900 to 2100 written with and without leading
+    # zeros plus inputs that should fall back to strptime or fail
+
+    dates = []
+    day = datetime.date(1900, 1, 1)
+    while day.year <= 2100:
+        dates.append("%d/%d/%d" % (day.month, day.day, day.year))
+        dates.append("%02d/%02d/%d" % (day.month, day.day, day.year))
+        dates.append("%d/%02d/%d" % (day.month, day.day, day.year))
+        day += datetime.timedelta(days=1)
+
+    dates += ["", " ", " 3/4/2015 ", "2/29/2000", "2/29/1900",
+              "2/29/2016", "2/29/2015", "2/30/2016", "4/31/2015",
+              "13/1/2015", "0/1/2015", "1/0/2015", "1/32/2015",
+              "1/1/15", "1/1/1899", "12/31/1000", "1/1/0999",
+              "1/1/10000", " 1/1/2015", "1/ 1/2015", "1/1/ 2015",
+              "001/1/2015", "1-1-2015", "1/1/2015x", "a/b/cdef",
+              "1/1/2015 1:05 PM"]
+    return dates
+
+
+def time_inputs():
+    # Every hour and minute of a few days plus inputs that should
+    # fall back to strptime or fail
+
+    times = []
+    for d in ["1/1/2015", "02/29/2016", "12/31/1999", "7/4/1900"]:
+        for hour in range(1, 13):
+            for minute in range(60):
+                for am_pm in ["AM", "PM"]:
+                    times.append("%s %d:%02d %s" % (d, hour, minute, am_pm))
+                times.append("%s %02d:%02d pm" % (d, hour, minute))
+
+    times += ["1/1/2015 0:00 AM", "1/1/2015 13:00 PM", "1/1/2015 1:60 PM",
+              "1/1/2015 1:5 PM", "1/1/2015  1:05 PM", "1/1/2015 1:05PM",
+              "1/1/2015 1:05 P", "1/1/2015 1:05 XM", "2/30/2015 1:05 AM",
+              "1/1/1899 1:05 AM", " 3/4/2015 10:47 AM ", "1/1/2015",
+              "", "3/4/2015 10:47:00 AM"]
+    return times
+
+
+def outcome(func, value):
+    # (result, None) or (None, exception class) so errors compare too
+
+    try:
+        return func(value), None
+    except Exception as e:
+        return None, e.__class__
+
+
+def reference_date(d):
+    # parse_date as it was: strptime for everything
+
+    d = d.strip()
+    if len(d) > 0:
+        return cms_parser_utilities.strptime_date(d)
+    return ""
+
+
+def reference_time(t):
+    return cms_parser_utilities.strptime_time(t.strip())
+
+
+def check_dates():
+    # Compare parse_date / parse_time with the strptime versions on
+    # every input from date_inputs and time_inputs, with empty and
+    # then warm caches. Then every input goes through parse_date and
+    # parse_time in turn, so a date result the cache handed to
+    # parse_time (or a time to parse_date) shows up.
+    # Returns a list of mismatches
+
+    u = cms_parser_utilities
+    checks = [(u.parse_date, reference_date),
+              (u.parse_time, reference_time)]
+    mismatches = []
+
+    def check(func, reference, value):
+        got = outcome(func, value)
+        want = outcome(reference, value)
+        if got != want:
+            mismatches.append((func.__name__, value, got, want))
+
+    for (func, reference), inputs in zip(checks, [date_inputs(),
+                                                  time_inputs()]):
+        clear_date_caches()
+        for rnd in range(2):
+            for value in inputs:
+                check(func, reference, value)
+
+    # mixed order, both ways round
+    for order in (checks, checks[::-1]):
+        clear_date_caches()
+        for value in date_inputs() + time_inputs():
+            for func, reference in order:
+                check(func, reference, value)
+
+    return mismatches
+
+
+def clear_date_caches():
+    cms_parser_utilities.DATE_CACHE.clear()
+    cms_parser_utilities.TIME_CACHE.clear()
+
+
+def bench_dates(number=20000, seed=0):
+    # Time strptime against the hand written path and the cached path
+    # on a mix of dates like a claim file. Returns {name: usec per call}
+
+    u = cms_parser_utilities
+    rnd = random.Random(seed)
+    dates = ["%d/%d/%d" % (rnd.randint(1, 12), rnd.randint(1, 28),
+                           rnd.randint(1990, 2015)) for i in range(500)]
+    times = [d + " %d:%02d %s" % (rnd.randint(1, 12), rnd.randint(0, 59),
+                                  rnd.choice(["AM", "PM"])) for d in dates]
+
+    def run(func, values):
+        n = len(values)
+        return lambda: [func(values[i % n]) for i in range(number)]
+
+    def cached(func, values):
+        # same calls as run() with the cache warmed up first
+        for v in values:
+            func(v)
+        return run(func, values)
+
+    cases = [("strptime_date", run(u.strptime_date, dates)),
+             ("fast_date", run(u.fast_date, dates)),
+             ("parse_date (cached)", cached(u.parse_date, dates)),
+             ("strptime_time", run(u.strptime_time, times)),
+             ("fast_time", run(u.fast_time, times)),
+             ("parse_time (cached)", cached(u.parse_time, times))]
+
+    results = []
+    for name, case in cases:
+        best = min(timeit.repeat(case, number=1, repeat=3))
+        results.append((name, best / number * 1000000))
+    return results
+
+
+def model_memory(claims=1000, seed=0, workdir=None):
+    # Memory a claim takes held as dicts (cms_stream_parse) and as
+    # cms_model records (cms_model_parse), on a generated file with 5
+    # claim lines per claim. Each is measured in its own child process
+    # as the growth in resident memory from keeping MODEL_COPIES
+    # results. Returns [(name, bytes per claim)]
+
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix="cms_benchmark")
+    inPath = os.path.join(workdir, "generated_%d.txt" % claims)
+    cms_generate(inPath, seed, claims=claims, claim_lines=5)
+
+    results = []
+    for name, parse_func in [("dicts", cms_parser.cms_stream_parse),
+                             ("records", cms_model.cms_model_parse)]:
+        queue = multiprocessing.Queue()
+        child = multiprocessing.Process(target=_child_memory,
+                                        args=(queue, parse_func, inPath))
+        child.start()
+        grown, entries = queue.get()
+        child.join()
+        results.append((name, grown / float(MODEL_COPIES * entries)))
+    return results
+
+
+def _child_memory(queue, parse_func, inPath):
+    # Runs in the child. The first parse loads and fills the caches
+    # (headlessCamel, dates, record layouts) so they are not counted
+
+    parse_func(inPath)
+    gc.collect()
+    before = _resident_bytes()
+    kept = [parse_func(inPath)["claims"] for n in range(MODEL_COPIES)]
+    gc.collect()
+    queue.put((_resident_bytes() - before, len(kept[0])))
+
+
+def _resident_bytes():
+    # Resident memory now. ru_maxrss would be the peak, which counts
+    # the working memory of the parse as well
+    with open("/proc/self/statm", 'r') as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+
+def save_results(results, outPath):
+    with open(outPath, 'w') as f:
+        json.dump(results, f, indent=4, sort_keys=True)
+
+
+def load_results(inPath):
+    with open(inPath, 'r') as f:
+        return json.load(f)
+
+
+def compare_results(old, new, threshold=0.10):
+    # Match runs on (input, stage) and report the change in wall time
+    # and peak RSS. A run that got slower by more than threshold
+    # (0.10 = 10%), or that now errors, is flagged as a regression
+
+    old_runs = dict(((r["input"], r["stage"]), r) for r in old["runs"])
+
+    rows = []
+    for r in new["runs"]:
+        key = (r["input"], r["stage"])
+        o = old_runs.get(key)
+        if o is None:
+            continue
+        row = {"input": r["input"],
+               "stage": r["stage"],
+               "old_seconds": o["seconds"],
+               "new_seconds": r["seconds"],
+               "old_peak_rss_kb": o["peak_rss_kb"],
+               "new_peak_rss_kb": r["peak_rss_kb"],
+               "change": 0.0,
+               "regression": False}
+        if o["status"] == "ok" and r["status"] == "ok":
+            if o["seconds"] > 0:
+                row["change"] = (r["seconds"] - o["seconds"]) / o["seconds"]
+            row["regression"] = row["change"] > threshold
+        elif o["status"] == "ok":
+            row["regression"] = True
+        row["status"] = "%s -> %s" % (o["status"], r["status"])
+        rows.append(row)
+    return rows
+
+
+def print_results(results, out=sys.stdout):
+    out.write("%-16s %-22s %10s %12s %9s %10s  %s\n" % (
+        "input", "stage", "seconds", "lines/s", "MB/s", "peak KB",
+        "status"))
+    for r in results["runs"]:
+        status = r["status"]
+        if r["error"]:
+            status += ": " + r["error"]
+        out.write("%-16s %-22s %10.4f %12.0f %9.3f %10d  %s\n" % (
+            r["input"], r["stage"], r["seconds"], r["lines_per_sec"],
+            r["mb_per_sec"], r["peak_rss_kb"], status))
+        for name in sorted(r["inner"]):
+            inner = r["inner"][name]
+            out.write("%-16s   %-20s %10.4f %12s\n" % (
+                "", name, inner["seconds"], "%d calls" % inner["calls"]))
+
+
+def print_comparison(rows, out=sys.stdout):
+    out.write("%-16s %-22s %10s %10s %9s %10s %10s  %s\n" % (
+        "input", "stage", "old s", "new s", "change", "old KB", "new KB",
+        "status"))
+    for row in rows:
+        flag = ""
+        if row["regression"]:
+            flag = "REGRESSION"
+        out.write("%-16s %-22s %10.4f %10.4f %+8.1f%% %10d %10d  %s %s\n" % (
+            row["input"], row["stage"], row["old_seconds"],
+            row["new_seconds"], row["change"] * 100,
+            row["old_peak_rss_kb"], row["new_peak_rss_kb"],
+            row["status"], flag))
+
+
+if __name__ == "__main__":
+    """
+    cms_benchmark.py run results.json [claims,claims,...]
+    cms_benchmark.py compare old.json new.json [threshold]
+    cms_benchmark.py dates
+    cms_benchmark.py model [claims]
+    """
+    try:
+        command = sys.argv[1]
+        if command == "run":
+            outfile = sys.argv[2]
+        elif command == "compare":
+            old_file = sys.argv[2]
+            new_file = sys.argv[3]
+        elif command in ("dates", "model"):
+            pass
+        else:
+            raise IndexError
+    except IndexError:
+        print "Example: cms_benchmark.py run results.json [10,100,1000]"
+        print "         cms_benchmark.py compare old.json new.json [0.10]"
+        print "         cms_benchmark.py dates"
+        print "         cms_benchmark.py model [1000]"
+        exit(1)
+
+    if command == "run":
+        sizes = None
+        if len(sys.argv) > 3:
+            sizes = [int(s) for s in sys.argv[3].split(",")]
+        results = benchmark(sizes)
+        save_results(results, outfile)
+        print_results(results)
+
+    if command == "compare":
+        threshold = 0.10
+        if len(sys.argv) > 4:
+            threshold = float(sys.argv[4])
+        rows = compare_results(load_results(old_file),
+                               load_results(new_file), threshold)
+        print_comparison(rows)
+        if any(row["regression"] for row in rows):
+            exit(1)
+
+    if command == "dates":
+        mismatches = check_dates()
+        for name, value, got, want in mismatches[:20]:
+            print "MISMATCH %s(%r): %r expected %r" % (name, value, got,
+                                                       want)
+        print "%d mismatches" % len(mismatches)
+        for name, usec in bench_dates():
+            print "%-22s %8.2f usec per call" % (name, usec)
+        if mismatches:
+            exit(1)
+
+    if command == "model":
+        claims = 1000
+        if len(sys.argv) > 2:
+            claims = int(sys.argv[2])
+        for name, size in model_memory(claims):
+            print "%-8s %8.0f bytes per claim" % (name, size)
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+"""
+python-bluebutton
+FILE: cms_cache
+Created: 10/18/16 7:30 PM
+
+On disk cache of parsed CMS BlueButton files
+
+A file is looked up by the sha256 of its bytes together with a
+fingerprint of SEG_DEF, FLD_TRANSLATE and PARSER_VERSION, so a change
+to the tables or the parser never hands back an out of date result.
+Each entry is the json of the out_dict in its own file in the cache
+directory. Entries are written to a temporary file and renamed in to
+place so workers in other processes can share the directory. The
+least recently used entries are removed once the directory holds more
+than max_bytes.
+
+"""
+__author__ = 'Mark Scrimshire:@ekivemark'
+
+import collections
+import hashlib
+import json
+import os
+import tempfile
+
+from cms_parser import cms_stream_parse
+from cms_parser_utilities import TRACE, trace_on, do_DBUG
+from file_def_cms import SEG_DEF, FLD_TRANSLATE
+
+# Change this whenever a parser change alters the output for the same
+# input. Cached results from another version are not used.
+PARSER_VERSION = "0.9.1"
+
+# Environment variable bbp.py and cms_batch read the cache directory
+# from. Not set = no cache
+CACHE_ENV = "BLUEBUTTON_CACHE"
+CACHE_BYTES = 256 * 1024 * 1024
+
+CACHE_SUFFIX = ".json"
+# put() re-reads the directory after this many writes, as well as when
+# its running total passes max_bytes, to pick up other workers' entries
+SCAN_WRITES = 100
+READ_SIZE = 1024 * 1024
+
+
+def table_fingerprint():
+    # sha256 of the parse tables and PARSER_VERSION
+
+    h = hashlib.sha256()
+    h.update(PARSER_VERSION)
+    h.update(json.dumps(SEG_DEF, sort_keys=True))
+    h.update(json.dumps(FLD_TRANSLATE, sort_keys=True))
+    return h.hexdigest()
+
+
+FINGERPRINT = table_fingerprint()
+
+
+def cache_key(inPath):
+    # Cache key for inPath: sha256 of the file bytes and FINGERPRINT
+
+    h = hashlib.sha256(FINGERPRINT)
+    with open(inPath, 'rb') as f:
+        while True:
+            block = f.read(READ_SIZE)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+class ParseCache(object):
+    # A cache directory. Every process can have its own ParseCache on
+    # the same directory.
+    # stats counts what this ParseCache has done:
+    # hits, misses, writes, evictions and errors (unreadable entries,
+    # which are removed and count as a miss as well, and entries that
+    # could not be written)
+    # total = bytes in the directory as of the last scan plus what has
+    # been written since (None until the first put). put() only lists
+    # the directory when total passes max_bytes or every SCAN_WRITES
+    # writes, so a batch does not stat every entry on every write
+
+    def __init__(self, cache_dir, max_bytes=CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.stats = collections.OrderedDict([("hits", 0),
+                                              ("misses", 0),
+                                              ("writes", 0),
+                                              ("evictions", 0),
+                                              ("errors", 0)])
+        self.total = None
+        self.writes = 0
+        if not os.path.isdir(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except OSError:
+                # another worker made it first
+                if not os.path.isdir(cache_dir):
+                    raise
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + CACHE_SUFFIX)
+
+    def get(self, key):
+        # The cached out_dict for key or None
+
+        DBUG = TRACE and trace_on()
+
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                out_dict = json.load(f,
+                                     object_pairs_hook=collections.OrderedDict)
+        except IOError:
+            self.stats["misses"] += 1
+            return None
+        except ValueError:
+            self.stats["errors"] += 1
+            self.stats["misses"] += 1
+            self.remove(path)
+            return None
+
+        # mark it as recently used for eviction
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        self.stats["hits"] += 1
+        if DBUG:
+            do_DBUG("hit:", key)
+        return out_dict
+
+    def put(self, key, out_dict):
+        # Write out_dict under key then trim the cache to max_bytes
+
+        DBUG = TRACE and trace_on()
+
+        # the cache is optional: if the entry can not be written (eg. a
+        # full disk) count it as an error and carry on without it
+        try:
+            fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.cache_dir)
+        except (IOError, OSError):
+            self.stats["errors"] += 1
+            return
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                json.dump(out_dict, f, separators=(",", ":"))
+            size = os.path.getsize(tmp)
+        except (IOError, OSError):
+            self.stats["errors"] += 1
+            self.remove(tmp)
+            return
+
+        try:
+            os.rename(tmp, self.path(key))
+            self.stats["writes"] += 1
+            self.writes += 1
+            if self.total is not None:
+                # an entry written over is counted twice until the
+                # next scan, which only brings the scan forward
+                self.total += size
+        except OSError:
+            # Windows will not rename over a file. Another worker has
+            # already written the same result
+            pass
+        finally:
+            if os.path.exists(tmp):
+                self.remove(tmp)
+
+        if DBUG:
+            do_DBUG("write:", key)
+
+        if self.total is None or self.total > self.max_bytes or \
+                self.writes >= SCAN_WRITES:
+            self.evict()
+
+    def evict(self):
+        # Remove the least recently used entries until the directory
+        # holds no more than max_bytes. Lists the whole directory
+
+        entries = self.entries()
+        total = sum(e[2] for e in entries)
+        for mtime, path, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if self.remove(path):
+                self.stats["evictions"] += 1
+            total -= size
+
+        self.total = total
+        self.writes = 0
+
+    def entries(self):
+        # (mtime, path, bytes) for each entry in the cache directory
+
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(CACHE_SUFFIX):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                # evicted by another worker
+                continue
+            entries.append((st.st_mtime, path, st.st_size))
+        return entries
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            return False
+        return True
+
+    def clear(self):
+        # Remove every entry
+        for mtime, path, size in self.entries():
+            self.remove(path)
+        self.total = 0
+
+    def info(self):
+        # stats plus the entries and bytes now in the directory
+        # (which includes the work of other processes)
+
+        entries = self.entries()
+        info = collections.OrderedDict(self.stats)
+        info["entries"] = len(entries)
+        info["bytes"] = sum(e[2] for e in entries)
+        info["max_bytes"] = self.max_bytes
+        return info
+
+    def parse(self, inPath, reader="file"):
+        # cms_stream_parse(inPath) through the cache
+
+        key = cache_key(inPath)
+        out_dict = self.get(key)
+        if out_dict is None:
+            out_dict = cms_stream_parse(inPath, reader)
+            self.put(key, out_dict)
+        return out_dict
+
+
+def env_cache():
+    # ParseCache on the directory named by CACHE_ENV, or None
+
+    cache_dir = os.environ.get(CACHE_ENV)
+    if not cache_dir:
+        return None
+    return ParseCache(cache_dir)
+
+
+def cms_cached_parse(inPath, cache_dir, max_bytes=CACHE_BYTES,
+                     reader="file"):
+    # cms_stream_parse(inPath) using the cache in cache_dir
+
+    return ParseCache(cache_dir, max_bytes).parse(inPath, reader)
@@ -0,0 +1,399 @@
+#!/usr/bin/env python
+"""
+python-bluebutton
+FILE: cms_claims
+Created: 10/18/16 9:05 PM
+
+Claim number index and claims that are only parsed when they are used
+
+cms_claim_index() scans the claims section for where each claim, and
+its "Claim Lines for Claim Number" detail lines, start. cms_lazy_parse()
+parses the other sections as usual and puts a LazyClaims in
+out_dict["claims"]. A claim, details included, is run through
+parse_lines() the first time it is asked for, so looking up one claim
+by number does not pay for the rest.
+
+iter_claims() reads the file once and hands out each claim as soon as
+it has been read, without keeping the rest of the file.
+
+"""
+__author__ = 'Mark Scrimshire:@ekivemark'
+
+import bisect
+import collections
+import os
+
+from cms_parser import (cms_line_iter, parse_lines, divider, CMSLine,
+                        CMSLineWindow)
+from cms_parser_utilities import (TRACE, trace_on, do_DBUG, headlessCamel,
+                                  lookup_segment)
+from cms_parallel import parallel_section, head_skip
+from cms_reader import open_lines
+from cms_sections import (cms_section_index, cms_section_parse,
+                          cms_section_names, last_sections, range_lines,
+                          section_title, END_TITLE)
+
+
+def cms_claim_index(inPath, index=None):
+    # Claim number index of the claims section of inPath
+    # index = cms_section_index(inPath) if you already have it
+    # Returns an OrderedDict of claim number -> dict in file order:
+    # claimNumber
+    # position = place in the out_dict["claims"] list
+    # entries = out_dict["claims"] entries it makes. 1 plus one for
+    #           each "Part D Claims" block in its detail lines
+    # start, end = byte range of the claim (header and detail lines)
+    # details = offset of the "Claim Lines for Claim Number" header
+    #           (None if the claim has no detail lines)
+    # seed = claim number cms_line_iter has at start
+    # A claim number that turns up twice is indexed at its first claim
+
+    if index is None:
+        index = cms_section_index(inPath)
+
+    return claims_by_number(claim_ranges(inPath, claims_section(index)))
+
+
+def claims_by_number(claims):
+    # claim number -> claim for the claim_ranges() dicts in claims
+
+    claim_index = collections.OrderedDict()
+    for claim in claims:
+        if claim["claimNumber"] not in claim_index:
+            claim_index[claim["claimNumber"]] = claim
+    return claim_index
+
+
+def claims_section(index):
+    # The cms_section_index entry that a full parse takes the claims
+    # from. An empty one if there is no claims section
+
+    section = last_sections(index, ["claims"]).get("claims")
+    if section is None:
+        section = collections.OrderedDict([("title", None),
+                                           ("name", "claims"),
+                                           ("start", 0),
+                                           ("claimNumber", None),
+                                           ("claimHeaders", []),
+                                           ("end", 0)])
+    return section
+
+
+def claim_ranges(inPath, section):
+    # One dict per claim in the claims section. A claim starts at the
+    # section start or at an untitled claim header (as recorded in
+    # section["claimHeaders"]). The claim number is the first one in
+    # the claim's own lines, which is the one parse_lines keeps
+
+    if section["end"] <= section["start"]:
+        return []
+
+    starts = [[section["start"], section["claimNumber"]]]
+    starts.extend(section["claimHeaders"])
+
+    claims = []
+    position = 0
+    with open(inPath, 'rb') as f:
+        for n, (start, seed) in enumerate(starts):
+            if n + 1 < len(starts):
+                end = starts[n + 1][0]
+            else:
+                end = section["end"]
+            claim = collections.OrderedDict([("claimNumber", None),
+                                             ("position", position),
+                                             ("entries", 1),
+                                             ("start", start),
+                                             ("end", end),
+                                             ("details", None),
+                                             ("seed", seed)])
+            scan_claim(range_lines(f, start, end), start, claim)
+            claims.append(claim)
+            position += claim["entries"]
+
+    return claims
+
+
+def scan_claim(lines, pos, claim):
+    # Fill in claimNumber, entries and details for one claim from its
+    # lines. pos = byte offset of the first line
+    # cms_line_iter re-titles "Claim Lines for Claim Number" as "Part D
+    # Claims" when the next line is "Claim Type: Part D". parse_lines
+    # makes a claims entry of its own for that
+
+    line_type = "BODY"
+    get_title = False
+    divider_at = pos
+    lines_title = False
+
+    for l in lines:
+        here = pos
+        pos += len(l)
+        l = l.rstrip()
+        if len(l) < 1:
+            continue
+
+        if line_type == "BODY" and (divider in l):
+            line_type = "HEADER"
+            get_title = True
+            divider_at = here
+
+        elif line_type == "HEADER" and get_title:
+            get_title = False
+            lines_title = False
+            if divider in l:
+                line_type = "BODY"
+            elif "CLAIM LINES FOR CLAIM NUMBER" in l.upper():
+                if claim["details"] is None:
+                    claim["details"] = divider_at
+                tl = l.partition(":")[0].rstrip()
+                lines_title = tl.upper() == "CLAIM LINES FOR CLAIM NUMBER"
+
+        elif line_type == "HEADER":
+            if divider in l:
+                line_type = "BODY"
+
+        else:
+            if lines_title and "CLAIM TYPE: PART D" in l.upper():
+                claim["entries"] += 1
+            lines_title = False
+
+            if "CLAIM NUMBER" in l.upper():
+                label, sep, value = l.partition(":")
+                if sep and claim["claimNumber"] is None:
+                    claim["claimNumber"] = value.strip()
+
+
+class LazyClaims(object):
+    # The out_dict["claims"] list of one file, parsed a claim at a time
+    # len(), claims[n], slices and iteration behave like the list
+    # cms_stream_parse builds. claim(number) looks a claim up by number.
+    # section = the claims entry of cms_section_index()
+    # index = claim number index, as cms_claim_index() returns.
+    # Parsed claims are kept (in claims, by claim_ranges() number).
+    # write_json() writes it like a list. Use to_list() for json.dumps
+
+    def __init__(self, inPath, section):
+        self.inPath = inPath
+        self.section = section
+        self.ranges = claim_ranges(inPath, section)
+        self.index = claims_by_number(self.ranges)
+        self.positions = [c["position"] for c in self.ranges]
+        self.claims = {}
+        # head_skip() of the head parse_claim puts in front of claims
+        # after the first. Worked out the first time it is needed
+        self.skip = None
+
+    def __len__(self):
+        if not self.ranges:
+            return 0
+        return self.ranges[-1]["position"] + self.ranges[-1]["entries"]
+
+    def __getitem__(self, n):
+        if isinstance(n, slice):
+            return [self[i] for i in range(*n.indices(len(self)))]
+        if n < 0:
+            n += len(self)
+        if n < 0 or n >= len(self):
+            raise IndexError("claim index out of range")
+
+        r = bisect.bisect_right(self.positions, n) - 1
+        if r not in self.claims:
+            self.claims[r] = self.parse_claim(r)
+        return self.claims[r][n - self.positions[r]]
+
+    def __iter__(self):
+        for n in range(len(self)):
+            yield self[n]
+
+    def __contains__(self, claim):
+        return claim in self.to_list()
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "LazyClaims(%r, %d claims, %d parsed)" % (self.inPath,
+                                                         len(self.ranges),
+                                                         len(self.claims))
+
+    def claim(self, claim_number):
+        # The claim with claim_number. KeyError if there is none
+
+        return self[self.index[claim_number]["position"]]
+
+    def numbers(self):
+        # The claim numbers in file order
+        return list(self.index.keys())
+
+    def to_list(self):
+        return list(self)
+
+    def parse_claim(self, n):
+        # Run claim n of ranges through parse_lines. Returns the list
+        # of its out_dict["claims"] entries. Claims after the first get
+        # the section title and first claim in front so process_subseg
+        # sees them as it does in a full parse (see cms_parallel)
+
+        DBUG = TRACE and trace_on()
+
+        claim = self.ranges[n]
+        head = None
+        if n:
+            head = (self.section["start"], self.ranges[1]["start"],
+                    self.section["claimNumber"])
+            if self.skip is None:
+                with open(self.inPath, 'rb') as f:
+                    self.skip = head_skip(f, "claims", head,
+                                          os.path.getsize(self.inPath))
+
+        task = {"inPath": self.inPath,
+                "name": "claims",
+                "start": claim["start"],
+                "end": claim["end"],
+                "claimNumber": claim["seed"],
+                "head": head,
+                "skip": self.skip}
+        name, value, chunk = parallel_section(task)
+
+        if DBUG:
+            do_DBUG("claim:", n, claim["claimNumber"],
+                    "bytes:", claim["end"] - claim["start"])
+
+        return value or []
+
+
+def cms_lazy_parse(inPath, index=None):
+    # cms_stream_parse(inPath) with out_dict["claims"] as a LazyClaims
+    # Every other section is parsed straight away
+
+    if index is None:
+        index = cms_section_index(inPath)
+
+    names = [n for n in cms_section_names(index) if n != "claims"]
+    parsed = cms_section_parse(inPath, names, index)
+
+    out_dict = collections.OrderedDict()
+    for name in cms_section_names(index):
+        if name == "claims":
+            out_dict[name] = LazyClaims(inPath, claims_section(index))
+        elif name in parsed:
+            out_dict[name] = parsed[name]
+
+    return out_dict
+
+
+def cms_claim(inPath, claim_number, index=None):
+    # Parse just the claim with claim_number from inPath
+    # None if it is not there
+
+    if index is None:
+        index = cms_section_index(inPath)
+
+    claims = LazyClaims(inPath, claims_section(index))
+    if claim_number not in claims.index:
+        return None
+    return claims.claim(claim_number)
+
+
+def iter_claims(inPath, reader="file"):
+    # Generator: the out_dict["claims"] entries of inPath one at a time
+    # Each claim header comes out with its detail lines (and a Part D
+    # block as an entry of its own, as in the full parse) as soon as
+    # the last line of the claim has been read. Only the lines of the
+    # claim being read are held, not the file or the parsed tree.
+    # Claims from every claims section are produced, in file order
+    # (a full parse keeps only the last claims section).
+
+    # The lines come from cms_line_iter, as for cms_stream_parse. The
+    # claims section title and claim headers are found from SEG_DEF:
+    # a level 0 title whose entry is named "claims" starts the section
+    # and "claims.claimHeader" starts each claim after the first.
+    # Each claim goes through parse_lines() behind the section title
+    # lines (see claim_entries).
+
+    DBUG = TRACE and trace_on()
+
+    claims = 0
+    section = None
+
+    with open_lines(inPath, reader, skip_blank=True) as f:
+        for ln in cms_line_iter(f):
+            ln_ctrl = section_title(ln)
+            if ln_ctrl is not False:
+                # a new section ends any claims section we are in
+                if section is not None:
+                    for entry in section.close():
+                        claims += 1
+                        yield entry
+                section = None
+                if ln_ctrl is not None and ln_ctrl["name"] == "claims":
+                    section = ClaimReader(ln, ln_ctrl["name"])
+                continue
+
+            if section is not None:
+                for entry in section.push(ln):
+                    claims += 1
+                    yield entry
+
+        if section is not None:
+            for entry in section.close():
+                claims += 1
+                yield entry
+
+    if DBUG:
+        do_DBUG("inPath:", inPath, "claims:", claims)
+
+
+class ClaimReader(object):
+    # The CMSLines of one claims section, a claim at a time
+    # title = the section title CMSLine, name = its SEG_DEF name
+    # push(ln) takes each line after the title and returns the claims
+    # entries finished by it (a claim is finished by the next claim
+    # header). close() returns the rest at the end of the section
+
+    def __init__(self, title, name):
+        self.name = name
+        self.head = [title]
+        self.claim = []
+        self.skip = None
+
+    def push(self, ln):
+        if ln.type == "HEADER" and ln.level == 1 and ln.line:
+            ln_ctrl = lookup_segment(self.name + "." +
+                                     headlessCamel(ln.line), True)
+            if ln_ctrl is not None and ln_ctrl["name"] == "claim":
+                # an untitled claim header: the claim before is done
+                entries = claim_entries(self.head, self.claim,
+                                        self.skip or 0)
+                if self.skip is None:
+                    self.skip = len(claim_entries(self.head, [], 0))
+                self.claim = [ln]
+                return entries
+
+        if self.skip is None and not self.claim and \
+                not (ln.type == "BODY" and
+                     "CLAIM NUMBER" in ln.line.upper()):
+            # still in the section title lines (eg. Source:)
+            self.head.append(ln)
+            return []
+
+        self.claim.append(ln)
+        return []
+
+    def close(self):
+        entries = claim_entries(self.head, self.claim, self.skip or 0)
+        self.claim = []
+        return entries
+
+
+def claim_entries(head, claim, skip):
+    # parse_lines() the claims section title lines in head followed by
+    # the CMSLines of one claim. Returns the claims entries after the
+    # first skip (the ones the head makes on its own)
+
+    end = CMSLine(None, 0, END_TITLE, "HEADER", None)
+    section_dict = parse_lines(CMSLineWindow(iter(head + claim + [end])))
+    return (section_dict.get("claims") or [])[skip:]
@@ -12,7 +12,6 @@ from datetime import datetime, date, timedelta
 
 import json
 import collections
-import inspect
 import six
 
 from file_def_cms import SEG_DEF
@@ -41,7 +40,7 @@ def custom_family_history(strt_ln, ln_control, match_ln, strt_lvl,
     # seg = dict returned from process_header
     # seg_name = dict key in seg returned from process_header
 
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
     current_segment = seg_name
     seg_type = check_type(seg[seg_name])
@@ -76,14 +75,11 @@ def custom_family_history(strt_ln, ln_control, match_ln, strt_lvl,
 
     # get current line
     current_line = get_line_dict(ln_list, wrk_ln)
-    wrk_ln_lvl = current_line["level"]
+    wrk_ln_lvl = current_line.level
 
     # Update match_ln with headers name from SEG_DEF (ie. ln_control)
     match_ln = update_match(strt_lvl, seg_name, match_ln)
 
-    match_hdr = combined_match(wrk_ln_lvl, match_ln)
-    # Find segment using combined header
-
     type_count = 0
 
     if DBUG:
@@ -108,24 +104,24 @@ def custom_family_history(strt_ln, ln_control, match_ln, strt_lvl,
         # not at end of file or segment
         # Lookup SEG DEF Record
 
-        wrk_ln_lvl = current_line["level"]
+        wrk_ln_lvl = current_line.level
         match_ln = update_match(wrk_ln_lvl,
-                                headlessCamel(current_line["line"]),
+                                current_line.k,
                                 match_ln)
-        match_hdr = combined_match(wrk_ln_lvl,
-                                   match_ln)
-        # Find segment using combined header
+        # Find segment using the breadcrumb in match_ln
 
-        is_line_seg_def = find_segment(match_hdr, True)
+        found_seg_def = match_lookup(wrk_ln_lvl, match_ln, True)
+        is_line_seg_def = found_seg_def is not None
         # Find SEG_DEF with match exact = True
 
         if is_line_seg_def:
-            wrk_seg_def = get_segment(match_hdr, True)
+            wrk_seg_def = found_seg_def
             # We found a SEG_DEF match with exact=True so Get the SEG_DEF
 
         kvs = assign_key_value(current_line,
                                wrk_seg_def,
-                               kvs)
+                               kvs,
+                               seg_index_of(match_ln))
 
         # process items unless we hit the 2nd k == "type"
         if kvs["k"].upper() == "TYPE" and type_count == 0:
@@ -175,7 +171,7 @@ def custom_family_history(strt_ln, ln_control, match_ln, strt_lvl,
         # update the current_line information
         current_line = get_line_dict(ln_list, wrk_ln)
 
-        if current_line["type"] == "HEADER":
+        if current_line.type == "HEADER":
             # We found the next header
             wrk_ln -= 1
             end_segment = True
@@ -237,7 +233,7 @@ def write_conditions(wrk_ln, kvs, wrk_seg_def, ln_list):
     # loop through lines until:
     # line type=header
 
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
     current_line = get_line_dict(ln_list, wrk_ln)
     sub_kvs = {"k": "",
@@ -253,7 +249,7 @@ def write_conditions(wrk_ln, kvs, wrk_seg_def, ln_list):
     sub_kvs = assign_key_value(current_line, wrk_seg_def, sub_kvs)
 
     loop_more = True
-    ln_type = current_line["type"]
+    ln_type = current_line.type
     not_eol = not (is_eol(wrk_ln, ln_list))
 
     kvs["k"] = "condition"
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+"""
+python-bluebutton
+FILE: cms_events
+Created: 10/18/16 10:10 PM
+
+Event (SAX style) interface to the CMS BlueButton parser
+
+cms_events() reads a file through cms_line_iter and calls a handler as
+it goes: section start and end, claim start and end, list item
+boundaries and one call per field. No out_dict is built, so a handler
+that only counts or sums runs in constant memory.
+
+Sections, claims, Part D claims, claim lines and list sections are
+recognised from SEG_DEF in the same way parse_lines sees them. In a
+list section (and in the lines of a claim) an item starts at the first
+field and ends when that field's key comes round again. The Source:
+and Category: lines belong to the section, not an item. Values are
+handed on as the text after the ":" (eg. "$38.00"). Use parse_date()
+or parse_time() on them as needed.
+
+The items follow the file. The out_dict can differ where
+process_subseg or the cms_custom functions re-arrange a section (eg.
+family history, or the boosters of an immunization), and where a
+claim has no claim header of its own (the last claim in
+BlueButtonText-2.txt): both read it as more lines of the claim before,
+but parse_lines writes its claim lines over that claim's details entry
+where the events give them an item of their own.
+
+"""
+__author__ = 'Mark Scrimshire:@ekivemark'
+
+from cms_parser import cms_line_iter
+from cms_parser_utilities import (TRACE, trace_on, do_DBUG, headlessCamel,
+                                  lookup_segment)
+from cms_reader import open_lines
+from cms_sections import section_title
+
+# Keys that belong to the section rather than a list item
+SECTION_KEYS = ("category", "source")
+
+
+class CMSHandler(object):
+    # Base class for cms_events() handlers. Every callback does nothing.
+    # Override the ones you need.
+    # path = tuple of names from the section down, eg. ("medications",)
+    #        or ("claims", "claim", "details")
+    # kind = SEG_DEF name of the claim: "claim" or "partDClaim"
+
+    def start_document(self, inPath):
+        pass
+
+    def end_document(self):
+        pass
+
+    def start_section(self, name, title):
+        # name = out_dict key (headlessCamel of the title if the title
+        # is not in SEG_DEF)
+        pass
+
+    def end_section(self, name):
+        pass
+
+    def start_claim(self, claim_number, kind):
+        pass
+
+    def end_claim(self, claim_number, kind):
+        pass
+
+    def start_item(self, path):
+        pass
+
+    def end_item(self, path):
+        pass
+
+    def field(self, key, value, path):
+        # key = headlessCamel of the text before the ":"
+        pass
+
+    def text(self, line, path):
+        # a line with no ":" in it
+        pass
+
+
+def cms_events(inPath, handler, reader="file"):
+    # Read inPath and send its events to handler (a CMSHandler)
+    # Returns handler
+
+    DBUG = TRACE and trace_on()
+
+    events = CMSEvents(handler)
+    handler.start_document(inPath)
+    with open_lines(inPath, reader, skip_blank=True) as f:
+        for ln in cms_line_iter(f):
+            events.line(ln)
+    events.end_section()
+    handler.end_document()
+
+    if DBUG:
+        do_DBUG("inPath:", inPath, "lines:", events.lines)
+
+    return handler
+
+
+class CMSEvents(object):
+    # The state cms_events keeps between lines: where we are in the
+    # section, claim and list item. line() takes each CMSLine
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.lines = 0
+
+        self.section = None
+        self.is_list = False
+        self.is_claims = False
+        self.group = None
+
+        self.claim = None
+        self.claim_kind = None
+        self.next_claim = None
+        self.wait_number = False
+        self.details = False
+
+        self.item = None
+        self.item_key = None
+
+    def line(self, ln):
+        self.lines += 1
+        if ln.line is None:
+            return
+
+        if ln.type == "HEADER":
+            ln_ctrl = section_title(ln)
+            if ln_ctrl is False:
+                self.sub_header(ln)
+            else:
+                self.end_section()
+                self.start_section(ln, ln_ctrl)
+            return
+
+        if self.section is None:
+            return
+
+        if self.next_claim is not None:
+            if not self.wait_number or "CLAIM NUMBER" in ln.line.upper():
+                self.start_claim(ln.claimNumber)
+
+        if not ln.kv:
+            self.handler.text(ln.line, self.path())
+            return
+
+        if self.is_list and ln.k not in SECTION_KEYS and \
+                (self.details or not self.is_claims):
+            # in a claim only the claim lines are items
+            if self.item is None:
+                self.start_item(ln.k)
+            elif ln.k == self.item_key:
+                self.end_item()
+                self.start_item(ln.k)
+
+        self.handler.field(ln.k, ln.v, self.path())
+
+    def path(self):
+        # breadcrumb of the current container
+        path = (self.section,)
+        if self.claim_kind is not None:
+            path += (self.claim_kind,)
+            if self.details:
+                path += ("details",)
+        elif self.group is not None:
+            path += (self.group,)
+        return path
+
+    def start_section(self, ln, ln_ctrl):
+        if ln_ctrl is None:
+            self.section = headlessCamel(ln.line)
+            self.is_list = False
+        else:
+            self.section = ln_ctrl["name"]
+            self.is_list = ln_ctrl["type"].upper() == "LIST"
+        self.is_claims = self.section == "claims"
+        self.group = None
+        if self.is_claims:
+            # the first claim has no header of its own. It starts at its
+            # claim number, after the section lines (eg. Source:)
+            self.next_claim = "claim"
+            self.wait_number = True
+        self.handler.start_section(self.section, ln.line)
+
+    def end_section(self):
+        self.end_claim()
+        self.end_item()
+        if self.section is not None:
+            self.handler.end_section(self.section)
+        self.section = None
+        self.next_claim = None
+        self.wait_number = False
+
+    def sub_header(self, ln):
+        # A title inside a section: a claim header, claim lines, a Part D
+        # block or (eg. Employer Subsidy) a group of list items
+
+        if self.section is None:
+            return
+
+        ln_ctrl = lookup_segment(self.section + "." +
+                                 headlessCamel(ln.line), True)
+        if ln_ctrl is None:
+            ln_ctrl = lookup_segment(headlessCamel(ln.line), True)
+        name = None
+        if ln_ctrl is not None:
+            name = ln_ctrl["name"]
+
+        if self.is_claims and name in ("claim", "partDClaim"):
+            self.end_claim()
+            self.next_claim = name
+            self.wait_number = False
+        elif self.is_claims and name == "details":
+            self.end_item()
+            self.details = True
+        else:
+            self.end_item()
+            self.group = name or headlessCamel(ln.line)
+
+    def start_claim(self, claim_number):
+        self.end_item()
+        self.claim = claim_number
+        self.claim_kind = self.next_claim
+        self.next_claim = None
+        self.wait_number = False
+        self.details = False
+        self.handler.start_claim(self.claim, self.claim_kind)
+
+    def end_claim(self):
+        self.end_item()
+        if self.claim_kind is not None:
+            self.handler.end_claim(self.claim, self.claim_kind)
+        self.claim = None
+        self.claim_kind = None
+        self.details = False
+
+    def start_item(self, key):
+        # key = the first key of the item
+        self.item = self.path()
+        self.item_key = key
+        self.handler.start_item(self.item)
+
+    def end_item(self):
+        if self.item is not None:
+            self.handler.end_item(self.item)
+        self.item = None
+        self.item_key = None
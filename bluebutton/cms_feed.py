@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""
+python-bluebutton
+FILE: cms_feed
+Created: 10/18/16 11:00 PM
+
+Push parser for CMS BlueButton text that arrives in pieces
+
+    parser = CMSFeedParser()
+    for chunk in response:
+        parser.feed(chunk)
+    out_dict = parser.close()
+
+feed() takes any size of chunk. A line split across two chunks is put
+back together. The lines go through the same CMSLineReader state
+machine as cms_file_read, and each section is run through parse_lines()
+as soon as the title of the next section arrives. In the claims section
+each claim is parsed when the header of the next claim arrives (see
+cms_claims.ClaimReader). By the time the last chunk comes in only the
+last claim or section is left to parse.
+
+CMSFeedParser(model=True) hands back cms_model records in place of
+the claims, medications, providers, pharmacies and emergency contacts
+dicts. Each claim is turned in to a record as soon as it is parsed.
+
+"""
+__author__ = 'Mark Scrimshire:@ekivemark'
+
+import collections
+
+from cms_parser import (parse_lines, CMSLine, CMSLineReader,
+                        CMSLineWindow)
+from cms_claims import ClaimReader
+from cms_model import model_claim, model_section
+from cms_parser_utilities import TRACE, trace_on, do_DBUG
+from cms_sections import section_title, END_TITLE
+
+
+class CMSFeedParser(object):
+    # feed(data) any number of times then close() for the out_dict.
+    # The out_dict is the same as cms_stream_parse() gives for a file
+    # holding all the data.
+    # sections = number of sections parsed so far
+    # model = True for cms_model records (see cms_model_parse)
+
+    def __init__(self, model=False):
+        self.model = model
+        self.reader = CMSLineReader()
+        self.partial = ""
+        self.lines = []
+        self.claims = None
+        self.out_dict = collections.OrderedDict()
+        self.sections = 0
+        self.closed = False
+
+    def feed(self, data):
+        # Add the next piece of text
+
+        if self.closed:
+            raise ValueError("feed() after close()")
+
+        if not data:
+            return
+
+        lines = (self.partial + data).split("\n")
+        # the last piece has no newline yet. Keep it for the next feed
+        self.partial = lines.pop()
+
+        push = self.reader.push
+        for l in lines:
+            ln = push(l)
+            if ln is not None:
+                self.add_line(ln)
+
+    def close(self):
+        # No more data. Returns the out_dict
+
+        DBUG = TRACE and trace_on()
+
+        if not self.closed:
+            self.closed = True
+            if self.partial:
+                ln = self.reader.push(self.partial)
+                self.partial = ""
+                if ln is not None:
+                    self.add_line(ln)
+            ln = self.reader.close()
+            if ln is not None:
+                self.add_line(ln)
+            # the file ends here so no END_TITLE after the last section
+            self.end_section(False)
+
+            if DBUG:
+                do_DBUG("sections:", self.sections,
+                        "keys:", list(self.out_dict.keys()))
+
+        return self.out_dict
+
+    def add_line(self, ln):
+        ln_ctrl = section_title(ln)
+        if ln_ctrl is not False:
+            self.end_section(True)
+            if ln_ctrl is not None and ln_ctrl["name"] == "claims":
+                self.claims = (ClaimReader(ln, ln_ctrl["name"]), [])
+                return
+        if self.claims is not None:
+            reader, entries = self.claims
+            self.add_claims(entries, reader.push(ln))
+            return
+        self.lines.append(ln)
+
+    def end_section(self, more):
+        # parse_lines() the lines held for the section just finished
+        # more = True if another section follows. parse_lines needs to
+        # see a header to end the section, as in cms_section_lines
+
+        if self.claims is not None:
+            reader, entries = self.claims
+            self.claims = None
+            self.add_claims(entries, reader.close())
+            self.sections += 1
+            self.out_dict["claims"] = entries
+            return
+
+        if not self.lines:
+            return
+
+        lines = self.lines
+        self.lines = []
+        if more:
+            lines.append(CMSLine(None, 0, END_TITLE, "HEADER", None))
+
+        section_dict = parse_lines(CMSLineWindow(iter(lines)))
+        self.sections += 1
+
+        # A key seen before keeps its place and takes the new value, as
+        # when a title repeats in one parse_lines pass
+        for key, value in section_dict.items():
+            if self.model:
+                value = model_section(key, value)
+            self.out_dict[key] = value
+
+    def add_claims(self, entries, claims):
+        # Add the claims entries from ClaimReader to the list in entries
+
+        if self.model:
+            claims = [model_claim(claim) for claim in claims]
+        entries.extend(claims)
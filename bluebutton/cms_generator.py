@@ -0,0 +1,582 @@
+#!/usr/bin/env python
+"""
+python-bluebutton
+FILE: cms_generator
+Created: 10/18/16 11:02 AM
+
+Write synthetic CMS BlueButton v2.0 text files for scale testing
+
+The layout follows the MyMedicare.gov download (see
+BlueButtonText-2.txt) so the files go through the same code paths in
+the parser as a real download. Output is fully determined by the seed
+and the counts.
+
+"""
+__author__ = 'Mark Scrimshire:@ekivemark'
+
+import random
+import sys
+
+divider = "--------------------------------"
+
+# How many entries to write in each section
+# claim_lines is the number of lines per claim
+DEFAULT_COUNTS = {"emergency_contacts": 2,
+                  "conditions": 5,
+                  "allergies": 4,
+                  "devices": 6,
+                  "immunizations": 1,
+                  "labs": 1,
+                  "vitals": 8,
+                  "family_members": 2,
+                  "drugs": 25,
+                  "preventive_services": 15,
+                  "providers": 30,
+                  "pharmacies": 2,
+                  "plans": 1,
+                  "other_insurance": 1,
+                  "claims": 8,
+                  "claim_lines": 2,
+                  "part_d_claims": 0,
+                  }
+
+FIRST_NAMES = ["JOHN", "MARY", "ROBERT", "PATRICIA", "JAMES", "LINDA",
+               "MICHAEL", "BARBARA", "WILLIAM", "ELIZABETH", "DAVID",
+               "JENNIFER", "RICHARD", "MARIA", "CHARLES", "SUSAN"]
+LAST_NAMES = ["SMITH", "JOHNSON", "WILLIAMS", "BROWN", "JONES", "MILLER",
+              "DAVIS", "GARCIA", "RODRIGUEZ", "WILSON", "MARTINEZ",
+              "ANDERSON", "TAYLOR", "THOMAS", "HERNANDEZ", "MOORE"]
+STREETS = ["ANY ROAD", "MAIN ST", "CLEARVISTA DR", "WHITE RD",
+           "KEYSTONE XING", "SHADELAND AVE", "MERIDIAN ST", "OAK LANE"]
+CITIES = [("ANYTOWN", "IN"), ("INDIANAPOLIS", "IN"), ("BOULDER", "CO"),
+          ("PHOENIX", "AZ"), ("FAIRFAX", "VA"), ("TROY", "MI"),
+          ("BEND", "OR"), ("LAWRENCE", "KS"), ("WASHINGTON", "DC")]
+RELATIONSHIPS = ["Friend", "Spouse", "Daughter", "Son", "Brother",
+                 "Sister", "Neighbor"]
+CONDITIONS = ["Allergies", "Arthritis", "Broken Wrist", "Diabetes",
+              "Hypertension", "Asthma", "Other"]
+ALLERGIES = [("Antibotic", "Drugs"), ("Corn", "Food"), ("Milk", "Food"),
+             ("Pollen", "Environmental"), ("Other - other", "Other - other")]
+REACTIONS = ["", "Blisters", "Anaphylaxis", "Hives", "Rash"]
+SEVERITIES = ["", "Mild", "Moderate", "Severe"]
+DEVICES = ["Coronary stent", "Knee replacement", "Pace maker",
+           "Hearing aid", "Hip replacement"]
+IMMUNIZATIONS = ["shingles", "influenza", "pneumonia", "tetanus"]
+VITALS = [("Glucose", 80, 320), ("Pulse", 50, 120),
+          ("Temperature", 96, 103), ("Weight", 100, 300)]
+FAMILY = ["Daughter", "Son", "Brother", "Sister", "Mother", "Father"]
+FAMILY_TYPES = ["Maternal", "Paternal", ""]
+FAMILY_CONDITIONS = ["Diabetes, Type 2", "Skin Cancer",
+                     "Alzheimer's Disease", "Heart Disease", "Stroke"]
+FAMILY_ALLERGIES = ["Dyes", "Chemotherapy", "Penicillin", "Latex"]
+DRUGS = [("Abacavir", "TAB 300MG"), ("Amlodipine Besylate", "TAB 10MG"),
+         ("Gabapentin", "CAP 100MG"), ("Jakafi", "TAB 10MG"),
+         ("Montelukast Sodium", "TAB 10MG"), ("Omeprazole", "CAP 20MG"),
+         ("Vagifem", "TAB 10MCG"), ("Zaleplon", "CAP 10MG"),
+         ("Zafirlukast", "TAB 20MG"), ("Tabloid", "TAB 40MG")]
+PREVENTIVE = ["ABDOMINAL AORTIC ANEURYSM", "CARDIOVASCULAR", "PPV",
+              "PROSTATE", "PSA", "ANNUAL WELLNESS VISIT", "COLORECTAL",
+              "DEPRESSION SCREENING", "DIABETES", "OBESITY COUNSELING",
+              "PHYSICAL", "SMOKING CESSATION (counseling to stop smoking)"]
+PROVIDER_TYPES = ["Physician & Other Healthcare Professional",
+                  "Dialysis Facility", "Nursing Home", "Hospital",
+                  "Home Health"]
+SPECIALTIES = ["", "", "Addiction Medicine",
+               "Cardiac Electrophysiology,Cardiovascular Disease "
+               "(Cardiology)"]
+MEDICARE_PROVIDER = ["Yes", "Not Available", "May Accept Medicare"]
+CLAIM_TYPES = ["DME", "PartB", "PartA"]
+PROCEDURES = ["E0601 - Continuous Positive Airway Pressure (Cpap) Device",
+              "98941 - Chiropractic Manipulative Treatment, 3 To 4 Spinal "
+              "Regions",
+              "A0428 - Ambulance Service, Basic Life Support, "
+              "Non-Emergency Transport, (Bls)",
+              "99213 - Office/Outpatient Visit Est"]
+MODIFIERS = ["", "", "MS - Six Month Maintenance And Servicing Fee",
+             "KX - Requirements Specified In The Medical Policy Have "
+             "Been Met",
+             "GA - Waiver Of Liability Statement Issued As Required By "
+             "Payer Policy, Individual Case",
+             "RH"]
+PLACES = ["12 - Home", "11 - Office", "41 - Ambulance - Land",
+          "21 - Inpatient Hospital"]
+SERVICES = ["R - Rental of DME", "1 - Medical Care",
+            "9 - Other Medical Services"]
+PHARMACIES = ["Castleton Integrative Health", "Costco Pharmacy",
+              "Walgreens", "CVS Pharmacy"]
+
+
+def cms_generate(outPath, seed=0, newline="\r\n", **counts):
+    # Write a synthetic CMS BlueButton file to outPath
+    # counts override DEFAULT_COUNTS eg. claims=10000, claim_lines=10
+    # Returns a dict with the number of lines and claims written
+
+    cnt = {"lines": 0, "claims": 0, "claim_lines": 0, "part_d_claims": 0}
+
+    with open(outPath, 'w') as f:
+        for l in cms_generate_lines(seed, cnt, **counts):
+            f.write(l + newline)
+            cnt["lines"] += 1
+
+    return cnt
+
+
+def cms_generate_lines(seed=0, cnt=None, **counts):
+    # Generator for the text lines (without line endings) of a file
+    # cnt (optional) dict is updated with the claims written
+
+    for k in counts:
+        if k not in DEFAULT_COUNTS:
+            raise KeyError("Unknown count: " + k)
+    c = dict(DEFAULT_COUNTS)
+    c.update(counts)
+
+    if cnt is None:
+        cnt = {}
+    for k in ["claims", "claim_lines", "part_d_claims"]:
+        cnt.setdefault(k, 0)
+
+    rnd = random.Random(seed)
+
+    for l in _header(rnd):
+        yield l
+
+    for l in _section("Demographic", "MyMedicare.gov",
+                      [_demographic(rnd)]):
+        yield l
+
+    for l in _section("Emergency Contact", "Self-Entered",
+                      [_contact(rnd)
+                       for i in range(c["emergency_contacts"])]):
+        yield l
+
+    for l in _section("Self Reported Medical Conditions", "Self-Entered",
+                      [[("Condition Name", rnd.choice(CONDITIONS)),
+                        ("Medical Condition Start Date", _date(rnd)),
+                        ("Medical Condition End Date", _date(rnd, 0.5))]
+                       for i in range(c["conditions"])]):
+        yield l
+
+    for l in _section("Self Reported Allergies", "Self-Entered",
+                      [_allergy(rnd) for i in range(c["allergies"])]):
+        yield l
+
+    for l in _section("Self Reported Implantable Device", "Self-Entered",
+                      [[("Device Name", rnd.choice(DEVICES)),
+                        ("Date Implanted", _date(rnd))]
+                       for i in range(c["devices"])]):
+        yield l
+
+    for l in _section("Self Reported Immunizations", "Self-Entered",
+                      [_immunization(rnd)
+                       for i in range(c["immunizations"])]):
+        yield l
+
+    for l in _section("Self Reported Labs and Tests", "Self-Entered",
+                      [[("Test/Lab Type", rnd.choice(["Test", "Lab"])),
+                        ("Date Taken", _date(rnd)),
+                        ("Administered by", rnd.choice(LAST_NAMES).title()),
+                        ("Requesting Doctor", "Dr. " + _name(rnd).title()),
+                        ("Reason Test/Lab Requested", ""),
+                        ("Results", ""),
+                        ("Comments", "")]
+                       for i in range(c["labs"])]):
+        yield l
+
+    for l in _section("Self Reported Vital Statistics", "Self-Entered",
+                      [_vital(rnd) for i in range(c["vitals"])]):
+        yield l
+
+    for l in _family_history(rnd, c["family_members"]):
+        yield l
+
+    for l in _section("Drugs", "Self-Entered",
+                      [_drug(rnd) for i in range(c["drugs"])]):
+        yield l
+
+    for l in _section("Preventive Services", "MyMedicare.gov",
+                      [[("Description", rnd.choice(PREVENTIVE)),
+                        ("Next Eligible Date", _date(rnd, 0.5)),
+                        ("Last Date of Service", _date(rnd, 0.5))]
+                       for i in range(c["preventive_services"])]):
+        yield l
+
+    for l in _section("Providers", "Self-Entered",
+                      [_provider(rnd) for i in range(c["providers"])]):
+        yield l
+
+    for l in _section("Pharmacies", "Self-Entered",
+                      [[("Pharmacy Name", rnd.choice(PHARMACIES) + " " +
+                         _address(rnd)),
+                        ("Pharmacy Phone", _phone(rnd))]
+                       for i in range(c["pharmacies"])]):
+        yield l
+
+    for l in _section("Plans", "MyMedicare.gov",
+                      [_plan(rnd) for i in range(c["plans"])]):
+        yield l
+
+    for l in _section("Employer Subsidy", "MyMedicare.gov", []):
+        yield l
+
+    for l in _section("Primary Insurance", "MyMedicare.gov", []):
+        yield l
+
+    for l in _section("Other Insurance", "MyMedicare.gov",
+                      [_insurance(rnd)
+                       for i in range(c["other_insurance"])]):
+        yield l
+
+    for l in _claims(rnd, c, cnt):
+        yield l
+
+
+def _header(rnd):
+    # File banner. Becomes the "header" section
+
+    return [divider,
+            "MYMEDICARE.GOV PERSONAL HEALTH INFORMATION",
+            divider,
+            "**********CONFIDENTIAL***********",
+            "Produced by the Blue Button (v2.0)",
+            _date(rnd) + " " + _time(rnd),
+            "",
+            ""]
+
+
+def _section(title, source, entries):
+    # Title block, Source line then one block of key: value lines
+    # per entry separated by blank lines
+
+    yield divider
+    yield title
+    yield divider
+    yield ""
+    yield "Source: " + source
+    yield ""
+    for entry in entries:
+        for k, v in entry:
+            if v is None:
+                # line written as is eg. "Address Type:Home"
+                yield k
+            else:
+                yield _kv(k, v)
+        yield ""
+    if len(entries) == 0:
+        yield ""
+
+
+def _kv(k, v, sep=": "):
+    return k + sep + v
+
+
+def _demographic(rnd):
+    city, state = rnd.choice(CITIES)
+    return [("Name", _name(rnd)),
+            ("Date of Birth", _date(rnd, 0, 1910, 1950)),
+            ("Address Line 1", _street(rnd)),
+            ("Address Line 2", ""),
+            ("City", city),
+            ("State", state),
+            ("Zip", _zip(rnd)),
+            ("Phone Number", _phone(rnd)),
+            ("Email", ""),
+            ("Part A Effective Date", _date(rnd)),
+            ("Part B Effective Date", _date(rnd))]
+
+
+def _contact(rnd):
+    city, state = rnd.choice(CITIES)
+    # The download has no space after "Address Type:"
+    return [("Contact Name", _name(rnd).title()),
+            ("Address Type:Home", None),
+            ("Address Line 1", _street(rnd).title()),
+            ("Address Line 2", "%s, %s %s" % (city.title(), state,
+                                              _zip(rnd))),
+            ("City", ""),
+            ("State", ""),
+            ("Zip", _zip(rnd)),
+            ("Relationship", rnd.choice(RELATIONSHIPS)),
+            ("Home Phone", _phone(rnd, 0.5)),
+            ("Work Phone", ""),
+            ("Mobile Phone", _phone(rnd, 0.5)),
+            ("Email Address", "")]
+
+
+def _allergy(rnd):
+    name, typ = rnd.choice(ALLERGIES)
+    return [("Allergy Name", name),
+            ("Type", typ),
+            ("Reaction", rnd.choice(REACTIONS)),
+            ("Severity", rnd.choice(SEVERITIES)),
+            ("Diagnosed", rnd.choice(["", "Yes", "No"])),
+            ("Treatment", ""),
+            ("First Episode Date", _date(rnd, 0.5)),
+            ("Last Episode Date", _date(rnd, 0.5)),
+            ("Last Treatment Date", _date(rnd, 0.5)),
+            ("Comments", "")]
+
+
+def _immunization(rnd):
+    return [("Immunization Name", rnd.choice(IMMUNIZATIONS)),
+            ("Date Administered:" + _date(rnd), None),
+            ("Method", "Injection"),
+            ("Were you vaccinated in the US", rnd.choice(["Yes", "No"])),
+            ("Comments", ""),
+            ("Booster 1 Date", _date(rnd, 0.5)),
+            ("Booster 2 Date", _date(rnd, 0.5)),
+            ("Booster 3 Date", "")]
+
+
+def _vital(rnd):
+    name, low, high = rnd.choice(VITALS)
+    return [("Vital Statistic Type", name),
+            ("Date", _date(rnd)),
+            ("Time", _time(rnd)),
+            ("Reading/Value", str(rnd.randint(low, high))),
+            ("Comments", "")]
+
+
+def _family_history(rnd, members):
+    # Family history repeats "Type:" inside each member so it does not
+    # fit the _section layout
+
+    yield divider
+    yield "Family Medical History"
+    yield divider
+    yield ""
+    yield "Source: Self-Entered"
+    yield ""
+    for i in range(members):
+        yield _kv("Family Member", rnd.choice(FAMILY))
+        yield _kv("Type", rnd.choice(FAMILY_TYPES))
+        yield "DOB:" + _date(rnd, 0, 1930, 2012)
+        yield _kv("DOD", "")
+        yield _kv("Age", str(rnd.randint(1, 90)))
+        yield _kv("Type", "Allergy")
+        yield _kv("Description", rnd.choice(FAMILY_ALLERGIES))
+        yield _kv("Type", "Condition")
+        for j in range(rnd.randint(1, 2)):
+            yield _kv("Description", rnd.choice(FAMILY_CONDITIONS))
+        yield ""
+
+
+def _drug(rnd):
+    name, form = rnd.choice(DRUGS)
+    return [("Drug Name", name + " " + form),
+            ("Supply", "%d Every %d Month" % (rnd.choice([30, 60, 90]),
+                                              rnd.choice([1, 3]))),
+            ("Orig Drug Entry", name)]
+
+
+def _provider(rnd):
+    return [("Provider Name", _name(rnd)),
+            ("Provider Address", _address(rnd)),
+            ("Type", rnd.choice(PROVIDER_TYPES)),
+            ("Specialty", rnd.choice(SPECIALTIES)),
+            ("Medicare Provider", rnd.choice(MEDICARE_PROVIDER))]
+
+
+def _plan(rnd):
+    return [("Contract ID/Plan ID", "S%04d/%03d" % (rnd.randint(1000, 9999),
+                                                    rnd.randint(1, 999))),
+            ("Plan Period", _date(rnd) + " - current"),
+            ("Plan Name", ""),
+            ("Marketing Name", ""),
+            ("Plan Address", ""),
+            ("Plan Type", "11 - Medicare Prescription Drug Plan")]
+
+
+def _insurance(rnd):
+    return [("MSP Type", ""),
+            ("Policy Number", str(rnd.randint(10000, 99999))),
+            ("Insurer Name", rnd.choice(LAST_NAMES) + " HEALTH GROUP"),
+            ("Insurer Address", _address(rnd)),
+            ("Effective Date", _date(rnd)),
+            ("Termination Date", "")]
+
+
+def _claims(rnd, c, cnt):
+    # Claim Summary section. The first claim follows the section title.
+    # Each later claim starts with an empty title block which the
+    # parser reads as a "claim Header". Part D claims come last.
+
+    claim_base = rnd.randint(1000000000, 9000000000) * 10000
+
+    yield divider
+    yield "Claim Summary"
+    yield divider
+    yield ""
+    yield "Source: MyMedicare.gov"
+    yield ""
+
+    total = c["claims"] + c["part_d_claims"]
+    for i in range(total):
+        claim_number = str(claim_base + i * 10000)
+        part_d = i >= c["claims"]
+
+        if i > 0:
+            yield divider
+            yield ""
+            yield divider
+            yield ""
+
+        for l in _claim_summary(rnd, claim_number, part_d):
+            yield l
+
+        yield divider
+        yield "Claim Lines for Claim Number: " + claim_number
+        yield divider
+        yield ""
+        yield ""
+
+        if part_d:
+            for l in _part_d_claim(rnd, claim_number):
+                yield l
+            cnt["part_d_claims"] += 1
+        else:
+            for n in range(c["claim_lines"]):
+                for l in _claim_line(rnd, n + 1):
+                    yield l
+                cnt["claim_lines"] += 1
+            cnt["claims"] += 1
+
+
+def _claim_summary(rnd, claim_number, part_d):
+    charged = rnd.randint(1000, 500000)
+    approved = charged * rnd.randint(50, 100) // 100
+    paid = approved * 80 // 100
+    start = _date(rnd, 0, 2012, 2015, "%02d/%02d/%04d")
+
+    yield _kv("Claim Number", claim_number)
+    yield _kv("Provider", "No Information Available")
+    yield _kv("Provider Billing Address", "   ")
+    yield _kv("Service Start Date", start)
+    yield _kv("Service End Date", start)
+    yield _kv("Amount Charged", _money(charged))
+    yield _kv("Medicare Approved", _money(approved))
+    yield _kv("Provider Paid", _money(paid))
+    yield _kv("You May be Billed", _money(approved - paid))
+    if part_d:
+        yield _kv("Claim Type", "PartD")
+    else:
+        yield _kv("Claim Type", rnd.choice(CLAIM_TYPES))
+    for n in range(rnd.randint(1, 4)):
+        yield _kv("Diagnosis Code %d" % (n + 1),
+                  str(rnd.randint(1000, 99999)))
+    yield ""
+
+
+def _claim_line(rnd, line_number):
+    charged = rnd.randint(1000, 100000)
+    allowed = charged * rnd.randint(50, 100) // 100
+    service = _date(rnd, 0, 2012, 2015, "%02d/%02d/%04d")
+
+    # Claim lines use two spaces after the colon
+    sep = ":  "
+    yield _kv("Line number", str(line_number), sep)
+    yield _kv("Date of Service From", service, sep)
+    yield _kv("Date of Service To", service, sep)
+    yield _kv("Procedure Code/Description", rnd.choice(PROCEDURES), sep)
+    for n in range(4):
+        yield _kv("Modifier %d/Description" % (n + 1),
+                  rnd.choice(MODIFIERS), sep)
+    yield _kv("Quantity Billed/Units", str(rnd.randint(1, 3)), sep)
+    yield _kv("Submitted Amount/Charges", _money(charged), sep)
+    yield _kv("Allowed Amount", _money(allowed), sep)
+    yield _kv("Non-Covered", _money(charged - allowed), sep)
+    yield _kv("Place of Service/Description", rnd.choice(PLACES), sep)
+    yield _kv("Type of Service/Description", rnd.choice(SERVICES), sep)
+    yield _kv("Rendering Provider No", "PROV%05d" % rnd.randint(0, 99999),
+              sep)
+    yield _kv("Rendering Provider NPI", "", sep)
+    yield ""
+
+
+def _part_d_claim(rnd, claim_number):
+    # "Claim Type: Part D" straight after the claim lines title turns
+    # the title in to "Part D Claims" when the file is read
+    name, form = rnd.choice(DRUGS)
+
+    yield _kv("Claim Type", "Part D")
+    yield _kv("Claim Number", claim_number)
+    yield _kv("Claim Service Date", _date(rnd, 0, 2012, 2015,
+                                          "%02d/%02d/%04d"))
+    yield _kv("Pharmacy Service Provider", str(rnd.randint(1000000,
+                                                           9999999)))
+    yield _kv("Pharmacy Name", rnd.choice(PHARMACIES).upper())
+    yield _kv("Drug Code", "%011d" % rnd.randint(0, 99999999999))
+    yield _kv("Drug Name", (name + " " + form).upper())
+    yield _kv("Fill Number", str(rnd.randint(0, 11)))
+    yield _kv("Days' Supply", str(rnd.choice([30, 60, 90])))
+    yield _kv("Prescriber Identifer", str(rnd.randint(1000000000,
+                                                      9999999999)))
+    yield _kv("Prescriber Name", _name(rnd))
+    yield ""
+
+
+def _name(rnd):
+    return rnd.choice(FIRST_NAMES) + " " + rnd.choice(LAST_NAMES)
+
+
+def _street(rnd):
+    return "%d %s" % (rnd.randint(1, 9999), rnd.choice(STREETS))
+
+
+def _address(rnd):
+    city, state = rnd.choice(CITIES)
+    return "%s %s, %s %s" % (_street(rnd), city, state, _zip(rnd))
+
+
+def _zip(rnd):
+    return "%05d" % rnd.randint(1000, 99999)
+
+
+def _phone(rnd, blank=0.0):
+    if rnd.random() < blank:
+        return ""
+    return "%03d-%03d-%04d" % (rnd.randint(201, 989), rnd.randint(200, 999),
+                               rnd.randint(0, 9999))
+
+
+def _date(rnd, blank=0.0, start=1950, end=2015, fmt="%d/%d/%d"):
+    # m/d/yyyy by default. blank = chance of returning ""
+    if rnd.random() < blank:
+        return ""
+    return fmt % (rnd.randint(1, 12), rnd.randint(1, 28),
+                  rnd.randint(start, end))
+
+
+def _time(rnd):
+    return "%d:%02d %s" % (rnd.randint(1, 12), rnd.randint(0, 59),
+                           rnd.choice(["AM", "PM"]))
+
+
+def _money(cents):
+    return "${:,.2f}".format(cents / 100.0)
+
+
+if __name__ == "__main__":
+    """
+    Write a synthetic file:
+    cms_generator.py outfile [claims] [claim_lines] [seed]
+    """
+    try:
+        outfile = sys.argv[1]
+    except IndexError:
+        print "Example: cms_generator.py outfile.txt [claims]", \
+              "[claim_lines] [seed]"
+        exit(1)
+
+    counts = {}
+    if len(sys.argv) > 2:
+        counts["claims"] = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        counts["claim_lines"] = int(sys.argv[3])
+    seed = 0
+    if len(sys.argv) > 4:
+        seed = int(sys.argv[4])
+
+    cnt = cms_generate(outfile, seed, **counts)
+    print "%d lines, %d claims, %d claim lines written to %s" % (
+        cnt["lines"], cnt["claims"], cnt["claim_lines"], outfile)
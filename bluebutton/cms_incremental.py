@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+"""
+python-bluebutton
+FILE: cms_incremental
+Created: 10/18/16 8:15 PM
+
+Re-parse only the parts of a CMS BlueButton file that changed since
+the last download
+
+The file is split the same way cms_parallel splits it: one piece per
+section and one per run of claims. Each piece is hashed and the parsed
+value kept in a state file under that hash. Next time only the pieces
+with a new hash are run through parse_lines(). Claims are appended to
+the end of the claims section so a download with a few new claims only
+re-parses the last run of claims.
+
+"""
+__author__ = 'Mark Scrimshire:@ekivemark'
+
+import collections
+import hashlib
+import json
+import os
+import tempfile
+
+from cms_cache import FINGERPRINT
+from cms_parser_utilities import TRACE, trace_on, do_DBUG
+from cms_parallel import (CHUNK_CLAIMS, parallel_merge, parallel_section,
+                          parallel_tasks)
+from cms_sections import cms_section_index
+
+READ_SIZE = 1024 * 1024
+# Change this with any change to what the state holds. A state from
+# another version is not used
+STATE_VERSION = 2
+
+
+def cms_incremental_parse(inPath, state=None, chunk_claims=CHUNK_CLAIMS):
+    # Parse inPath re-using the pieces in state that have not changed
+    # state = the state returned by the last run (or load_state()).
+    #         None parses everything
+    # Returns (out_dict, state, report)
+    # out_dict = the same OrderedDict as cms_stream_parse(inPath)
+    # state = the hashes and values for this file. Pass it to the next
+    #         run. Only holds the pieces of this file. The values are
+    #         kept as json text so the out_dict never shares objects
+    #         with state: changing one can not change the other
+    # report = one dict per piece in file order: name, start, end and
+    #          reused (True if the value came from state)
+
+    DBUG = TRACE and trace_on()
+
+    if state is None or state.get("fingerprint") != FINGERPRINT or \
+            state.get("version") != STATE_VERSION:
+        # nothing to re-use, or a different SEG_DEF, parser version or
+        # state layout
+        state = new_state()
+
+    index = cms_section_index(inPath)
+    tasks = parallel_tasks(inPath, index, chunk_claims)
+    size = os.path.getsize(inPath)
+
+    results = []
+    report = []
+    new = new_state()
+    with open(inPath, 'rb') as f:
+        for task in tasks:
+            key = task_hash(f, task, size)
+            if key in state["sections"]:
+                kept = state["sections"][key]
+                name, text, chunk = kept
+                result = (name, json.loads(
+                    text, object_pairs_hook=collections.OrderedDict), chunk)
+                reused = True
+            else:
+                result = parallel_section(task)
+                name, value, chunk = result
+                kept = (name, json.dumps(value, separators=(",", ":")),
+                        chunk)
+                reused = False
+            new["sections"][key] = kept
+            results.append(result)
+            report.append(collections.OrderedDict([("name", task["name"]),
+                                                   ("start", task["start"]),
+                                                   ("end", task["end"]),
+                                                   ("reused", reused)]))
+
+    if DBUG:
+        do_DBUG("inPath:", inPath, "pieces:", len(report),
+                "reused:", len([r for r in report if r["reused"]]))
+
+    out_dict = parallel_merge(index, results)
+
+    return out_dict, new, report
+
+
+def new_state():
+    return collections.OrderedDict([("fingerprint", FINGERPRINT),
+                                    ("version", STATE_VERSION),
+                                    ("sections", collections.OrderedDict())])
+
+
+def task_hash(f, task, size):
+    # sha256 of everything parallel_section reads for task: the claim
+    # numbers it starts from, the bytes of the head and the piece and
+    # whether an END_TITLE header follows
+
+    h = hashlib.sha256(FINGERPRINT)
+    h.update(json.dumps([task["name"], task["claimNumber"],
+                         task["end"] < size]))
+    if task["head"] is not None:
+        start, end, claim_number = task["head"]
+        h.update(json.dumps(claim_number))
+        hash_range(h, f, start, end)
+        h.update("\0")
+    hash_range(h, f, task["start"], task["end"])
+    return h.hexdigest()
+
+
+def hash_range(h, f, start, end):
+    # Add bytes start to end of the open file f to the hash h
+
+    f.seek(start)
+    left = end - start
+    while left > 0:
+        block = f.read(min(left, READ_SIZE))
+        if not block:
+            break
+        h.update(block)
+        left -= len(block)
+
+
+def load_state(statePath):
+    # The state saved by save_state. None if there is none (or it
+    # can not be read)
+
+    try:
+        with open(statePath, 'rb') as f:
+            state = json.load(f, object_pairs_hook=collections.OrderedDict)
+    except (IOError, ValueError):
+        return None
+
+    # json turns the (name, text, chunk) entries in to lists
+    for key, result in state["sections"].items():
+        state["sections"][key] = tuple(result)
+    return state
+
+
+def save_state(state, statePath):
+    # Write state to statePath. Written to a temporary file and renamed
+    # so a reader never sees half a file
+
+    fd, tmp = tempfile.mkstemp(suffix=".tmp",
+                               dir=os.path.dirname(statePath) or ".")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            json.dump(state, f, separators=(",", ":"))
+        if os.name == "nt" and os.path.exists(statePath):
+            # Windows will not rename over a file
+            os.remove(statePath)
+        os.rename(tmp, statePath)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
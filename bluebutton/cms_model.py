@@ -0,0 +1,367 @@
+#!/usr/bin/env python
+"""
+python-bluebutton
+FILE: cms_model
+Created: 10/18/16 11:40 PM
+
+Compact result model for the CMS BlueButton parser
+
+The out_dict is OrderedDicts all the way down. An OrderedDict keeps a
+hash table and a linked list entry for every key, which is most of the
+memory a parsed claim takes. The classes here hold the same fields in
+__slots__:
+
+    claims            Claim (details: ClaimLine) or PartDClaim
+    medications       Drug
+    providers         Provider
+    pharmacies        Pharmacy
+    emergencyContact  EmergencyContact (address: Address)
+
+Any other dict inside them (eg. charges, date, phone) becomes a Values.
+Keys that have no slot (eg. diagnosisCode5) go in to "extra". Each
+record keeps the keys it was made from, in order, as a tuple shared by
+every record with the same keys, so to_dict() gives back exactly the
+dict the parser made.
+
+    >>> out_dict = cms_model_parse("BlueButtonText-2.txt")
+    >>> out_dict["claims"][0].claimNumber
+    >>> to_dict(out_dict) == cms_stream_parse("BlueButtonText-2.txt")
+
+"""
+__author__ = 'Mark Scrimshire:@ekivemark'
+
+import collections
+
+from cms_parser_utilities import TRACE, trace_on, do_DBUG
+
+# Read this much of the file at a time in cms_model_parse
+READ_BYTES = 64 * 1024
+
+# Values kept once however many records hold them
+INTERN_FIELDS = ("category", "source", "claimType", "type", "specialty",
+                 "addressType", "state", "relationship")
+
+# The key tuples records are made from. See layout_of()
+LAYOUTS = {}
+
+
+def layout_of(keys):
+    # The shared tuple for this list of keys
+
+    keys = tuple(keys)
+    return LAYOUTS.setdefault(keys, keys)
+
+
+def model_value(value):
+    # value with the dicts in it turned in to Values. Lists are
+    # copied, anything else is returned as it is
+
+    if isinstance(value, dict):
+        return Values.from_dict(value)
+    if isinstance(value, list):
+        return [model_value(v) for v in value]
+    return value
+
+
+def plain_value(value):
+    # model_value the other way round
+
+    if isinstance(value, Record):
+        return value.to_dict()
+    if isinstance(value, list):
+        return [plain_value(v) for v in value]
+    return value
+
+
+class Record(object):
+    # Base class for the result model
+    # Subclasses list their fields in __slots__. A field is named after
+    # the out_dict key, or after RENAME[key] where the key is not a
+    # python name (eg. "non-Covered")
+    # NESTED = {key: Record subclass} for keys holding a dict, or a list
+    # of dicts, of a known kind
+    # layout = the keys in out_dict order. extra = OrderedDict of keys
+    # with no field (None if there are none)
+
+    __slots__ = ("layout", "extra")
+
+    RENAME = {}
+    NESTED = {}
+    # key -> field. Filled in by record_fields()
+    FIELDS = {}
+
+    def __init__(self, **kwargs):
+        # Fields by name, eg. Address(city="BALTIMORE", state="MD").
+        # The layout follows the order of FIELDS
+        for field in self.FIELDS.values():
+            setattr(self, field, None)
+        keys = []
+        for key, field in self.FIELDS.items():
+            if field in kwargs:
+                setattr(self, field, kwargs.pop(field))
+                keys.append(key)
+        if kwargs:
+            raise TypeError("%s has no field %s" %
+                            (type(self).__name__, ", ".join(kwargs)))
+        self.layout = layout_of(keys)
+        self.extra = None
+
+    @classmethod
+    def from_dict(cls, d):
+        # A record holding the out_dict entry d
+
+        self = cls.__new__(cls)
+        fields = cls.FIELDS
+        nested = cls.NESTED
+        for field in fields.values():
+            setattr(self, field, None)
+
+        extra = None
+        for key, value in d.iteritems():
+            if key in nested:
+                value = nested[key].convert(value)
+            elif isinstance(value, (dict, list)):
+                value = model_value(value)
+            elif key in INTERN_FIELDS and type(value) is str:
+                value = intern(value)
+
+            field = fields.get(key)
+            if field is not None:
+                setattr(self, field, value)
+            else:
+                if extra is None:
+                    extra = collections.OrderedDict()
+                extra[key] = value
+
+        self.layout = layout_of(d.keys())
+        self.extra = extra
+        return self
+
+    @classmethod
+    def convert(cls, value):
+        # from_dict() for a dict or each dict in a list
+
+        if isinstance(value, dict):
+            return cls.from_dict(value)
+        if isinstance(value, list):
+            return [cls.convert(v) for v in value]
+        return value
+
+    def get(self, key, default=None):
+        # The value for an out_dict key
+        if key not in self.layout:
+            return default
+        field = self.FIELDS.get(key)
+        if field is None:
+            return self.extra[key]
+        return getattr(self, field)
+
+    def keys(self):
+        return list(self.layout)
+
+    def to_dict(self):
+        # The OrderedDict the parser made
+
+        out = collections.OrderedDict()
+        fields = self.FIELDS
+        for key in self.layout:
+            field = fields.get(key)
+            if field is None:
+                value = self.extra[key]
+            else:
+                value = getattr(self, field)
+            out[key] = plain_value(value)
+        return out
+
+    def __getitem__(self, key):
+        if key not in self.layout:
+            raise KeyError(key)
+        return self.get(key)
+
+    def __contains__(self, key):
+        return key in self.layout
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "%s(%s)" % (type(self).__name__,
+                           ", ".join("%s=%r" % (k, self.get(k))
+                                     for k in self.layout))
+
+
+class Values(Record):
+    # A dict of plain values (eg. charges, date, phone) as a tuple
+    # plain = True if it was a dict rather than an OrderedDict
+
+    __slots__ = ("values", "plain")
+
+    @classmethod
+    def from_dict(cls, d):
+        self = cls.__new__(cls)
+        self.layout = layout_of(d.keys())
+        self.values = tuple(model_value(v) for v in d.itervalues())
+        self.extra = None
+        self.plain = type(d) is dict
+        return self
+
+    def get(self, key, default=None):
+        if key not in self.layout:
+            return default
+        return self.values[self.layout.index(key)]
+
+    def to_dict(self):
+        items = zip(self.layout, [plain_value(v) for v in self.values])
+        if self.plain:
+            return dict(items)
+        return collections.OrderedDict(items)
+
+
+class Address(Record):
+    __slots__ = ("addressType", "addressLine1", "addressLine2", "city",
+                 "state", "zip")
+
+
+class ClaimLine(Record):
+    # An entry in the details of a Claim
+    __slots__ = ("details", "lineNumber", "dateOfServiceFrom",
+                 "dateOfServiceTo", "procedureCodeDescription",
+                 "modifier1Description", "modifier2Description",
+                 "modifier3Description", "modifier4Description",
+                 "quantityBilledUnits", "submittedAmountCharges",
+                 "allowedAmount", "nonCovered",
+                 "placeOfServiceDescription", "typeOfServiceDescription",
+                 "renderingProviderNo", "renderingProviderNpi",
+                 "category", "source", "claimNumber")
+    RENAME = {"non-Covered": "nonCovered"}
+
+
+class Claim(Record):
+    # A claim header. "claims" is only set on the first one
+    __slots__ = ("claims", "claim", "claimNumber", "provider",
+                 "providerBillingAddress", "date", "charges", "claimType",
+                 "diagnosisCode1", "diagnosisCode2", "diagnosisCode3",
+                 "diagnosisCode4", "category", "source", "details")
+    NESTED = {"details": ClaimLine}
+
+
+class PartDClaim(Record):
+    __slots__ = ("claims", "partDClaim", "claimType", "claimNumber",
+                 "claimServiceDate", "pharmacyServiceProvider",
+                 "pharmacyName", "drugCode", "drugName", "fillNumber",
+                 "daysSupply", "prescriberIdentifer", "prescriberName",
+                 "category", "source")
+    RENAME = {"days'Supply": "daysSupply"}
+
+
+class Drug(Record):
+    __slots__ = ("medications", "drugName", "supply", "origDrugEntry",
+                 "category", "source")
+
+
+class Provider(Record):
+    __slots__ = ("providers", "providerName", "providerAddress", "type",
+                 "specialty", "medicareProvider", "category", "source")
+
+
+class Pharmacy(Record):
+    __slots__ = ("pharmacies", "pharmacyName", "pharmacyPhone",
+                 "category", "source")
+
+
+class EmergencyContact(Record):
+    __slots__ = ("emergencyContact", "contactName", "address",
+                 "relationship", "phone", "emailAddress", "category",
+                 "source")
+    NESTED = {"address": Address}
+
+
+def record_fields(cls):
+    # out_dict key -> field for cls, in __slots__ order
+
+    fields = collections.OrderedDict()
+    keys = dict((v, k) for k, v in cls.RENAME.items())
+    for field in cls.__slots__:
+        fields[keys.get(field, field)] = field
+    return fields
+
+
+for _cls in (Address, ClaimLine, Claim, PartDClaim, Drug, Provider,
+             Pharmacy, EmergencyContact):
+    _cls.FIELDS = record_fields(_cls)
+
+# out_dict section -> Record subclass for its list entries
+SECTION_MODELS = {"medications": Drug,
+                  "providers": Provider,
+                  "pharmacies": Pharmacy,
+                  "emergencyContact": EmergencyContact}
+
+
+def model_claim(entry):
+    # A claims entry as a Claim or PartDClaim
+
+    if "partDClaim" in entry:
+        return PartDClaim.from_dict(entry)
+    return Claim.from_dict(entry)
+
+
+def model_section(name, value):
+    # out_dict[name] with its entries as records. Sections with no
+    # model are returned as they are
+
+    if name == "claims" and isinstance(value, list):
+        return [model_claim(entry) for entry in value]
+    if name in SECTION_MODELS:
+        return SECTION_MODELS[name].convert(value)
+    return value
+
+
+def to_model(out_dict):
+    # An out_dict from any of the CMS parsers with its claims,
+    # medications, providers, pharmacies and emergency contacts as
+    # records
+
+    result = collections.OrderedDict()
+    for name, value in out_dict.items():
+        result[name] = model_section(name, value)
+    return result
+
+
+def to_dict(value):
+    # Records (and lists or dicts of them) back to the parser's dicts
+
+    if isinstance(value, Record):
+        return value.to_dict()
+    if isinstance(value, dict):
+        return collections.OrderedDict((k, to_dict(v))
+                                       for k, v in value.items())
+    if isinstance(value, list):
+        return [to_dict(v) for v in value]
+    return value
+
+
+def cms_model_parse(inPath):
+    # cms_stream_parse(inPath) with the results as records
+    # Each claim becomes a record as soon as it is parsed (see
+    # CMSFeedParser) so the dicts of only one claim are held at a time
+
+    DBUG = TRACE and trace_on()
+
+    # cms_feed imports this module for model=True
+    from cms_feed import CMSFeedParser
+
+    parser = CMSFeedParser(model=True)
+    with open(inPath, 'rb') as f:
+        for data in iter(lambda: f.read(READ_BYTES), ""):
+            parser.feed(data)
+    out_dict = parser.close()
+
+    if DBUG:
+        do_DBUG("inPath:", inPath, "layouts:", len(LAYOUTS))
+
+    return out_dict
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+"""
+python-bluebutton
+FILE: cms_parallel
+Created: 10/18/16 6:40 PM
+
+Parse one large CMS BlueButton file across a pool of workers
+
+cms_section_index() finds where each section starts. Every section,
+and every run of claims inside the claims section, goes to a worker
+that runs it through parse_lines(). The results are put back together
+in file order so the out_dict matches cms_stream_parse().
+
+Worth it for very large single beneficiary files. For a normal sized
+file starting the pool costs more than the parse.
+
+"""
+__author__ = 'Mark Scrimshire:@ekivemark'
+
+import collections
+import itertools
+import multiprocessing
+import multiprocessing.pool
+import os
+
+from cms_parser import cms_line_iter, parse_lines, CMSLineWindow
+from cms_parser_utilities import TRACE, trace_on, do_DBUG
+from cms_sections import (cms_section_index, cms_section_lines,
+                          cms_section_names, last_sections, range_lines)
+
+# Claims handed to a worker at a time
+CHUNK_CLAIMS = 500
+
+POOLS = {"process": multiprocessing.Pool,
+         "thread": multiprocessing.pool.ThreadPool}
+
+
+def cms_parallel_parse(inPath, workers=None, pool="process",
+                       chunk_claims=CHUNK_CLAIMS, index=None):
+    # Parse inPath with a pool of workers
+    # workers = pool size. None uses one per cpu.
+    # workers=1 runs in this process (handy for debugging)
+    # pool = "process" or "thread". Threads share the GIL so only
+    #        "process" runs the parse on more than one cpu
+    # chunk_claims = claims per task in the claims section
+    # index = cms_section_index(inPath) if you already have it
+
+    # Returns the same OrderedDict as cms_stream_parse(inPath)
+
+    DBUG = TRACE and trace_on()
+
+    if pool not in POOLS:
+        raise ValueError("pool must be one of %s" % (tuple(POOLS),))
+
+    if index is None:
+        index = cms_section_index(inPath)
+
+    tasks = parallel_tasks(inPath, index, chunk_claims)
+
+    if DBUG:
+        do_DBUG("inPath:", inPath, "sections:", len(index),
+                "tasks:", len(tasks), "workers:", workers, "pool:", pool)
+
+    if workers == 1:
+        results = [parallel_section(task) for task in tasks]
+    else:
+        workers = POOLS[pool](workers)
+        try:
+            results = workers.map(parallel_section, tasks, 1)
+        finally:
+            workers.close()
+            workers.join()
+
+    return parallel_merge(index, results)
+
+
+def parallel_merge(index, results):
+    # Put the (name, value) results of parallel_section back in to one
+    # out_dict. results are in file order. The claims lists of a
+    # chunked claims section are joined up
+
+    out_dict = collections.OrderedDict()
+    for name in cms_section_names(index):
+        out_dict[name] = None
+
+    found = set()
+    for name, value, chunk in results:
+        if value is None:
+            continue
+        if chunk and name in found:
+            out_dict[name].extend(value)
+        else:
+            out_dict[name] = value
+            found.add(name)
+
+    for name in list(out_dict.keys()):
+        if name not in found:
+            del out_dict[name]
+
+    return out_dict
+
+
+def parallel_section(task):
+    # Worker: parse one task from parallel_tasks
+    # Returns (name, value, chunk). value = what parse_lines wrote to
+    # out_dict[name] (None if nothing). chunk = True for the claims
+    # after the first chunk of a claims section
+
+    # task["skip"] = head_skip() of the head if the caller already has
+    # it (see cms_claims.LazyClaims)
+
+    name = task["name"]
+    size = os.path.getsize(task["inPath"])
+
+    with open(task["inPath"], 'rb') as f:
+        skip = 0
+        if task["head"] is not None:
+            start, end, claim_number = task["head"]
+            skip = task.get("skip")
+            if skip is None:
+                skip = head_skip(f, name, task["head"], size)
+
+        lines = cms_line_iter(cms_section_lines(f, task, size),
+                              task["claimNumber"])
+        if task["head"] is not None:
+            # The section title and first claim go in front so
+            # process_subseg sees the claims from the top of the section.
+            # The entries from the head are dropped again below
+            lines = itertools.chain(
+                cms_line_iter(range_lines(f, start, end), claim_number),
+                lines)
+        section_dict = parse_lines(CMSLineWindow(lines))
+
+    value = section_dict.get(name)
+    if skip and value is not None:
+        value = value[skip:]
+
+    return name, value, task["head"] is not None
+
+
+def head_skip(f, name, head, size):
+    # The out_dict[name] entries the head of a task makes on its own
+    # (more than one if the first claim has a Part D block)
+    # f = the open file, head = (start, end, claim number)
+
+    start, end, claim_number = head
+    head_dict = parse_lines(CMSLineWindow(cms_line_iter(
+        cms_section_lines(f, {"start": start, "end": end}, size),
+        claim_number)))
+    return len(head_dict.get(name) or [])
+
+
+def parallel_tasks(inPath, index, chunk_claims=CHUNK_CLAIMS):
+    # One task dict per section to parse, in file order
+    # A section with more than chunk_claims untitled claim headers is
+    # split at those headers. Each later chunk has a head: the byte
+    # range of the section title and first claim
+
+    tasks = []
+    for section in sorted(last_sections(index).values(),
+                          key=lambda s: s["start"]):
+        headers = section["claimHeaders"]
+        starts = [[section["start"], section["claimNumber"]]]
+        starts.extend(headers[chunk_claims - 1::chunk_claims])
+        ends = [s[0] for s in starts[1:]] + [section["end"]]
+
+        for n, (start, claim_number) in enumerate(starts):
+            head = None
+            if n:
+                head = (section["start"], headers[0][0],
+                        section["claimNumber"])
+            tasks.append({"inPath": inPath,
+                          "name": section["name"],
+                          "start": start,
+                          "end": ends[n],
+                          "claimNumber": claim_number,
+                          "head": head})
+
+    return tasks
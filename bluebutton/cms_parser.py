@@ -10,19 +10,28 @@ convert CMS BlueButton text to json
 __author__ = 'Mark Scrimshire:@ekivemark'
 
 
+import collections
+import copy
 import json
+import logging
 import re
 import os, sys
 
 from cms_parser_utilities import *
 from cms_custom import *
+from cms_reader import open_lines
+from file_def_cms import SEG_DEF, FLD_TYPES
 
 
 # DBUG = False
 
 divider = "----------"
 
-def cms_file_read(inPath):
+# Per line diagnostics from cms_file_parse and cms_file_parse2 are
+# logged at DEBUG level instead of printed
+cms_log = logging.getLogger("bluebutton.cms_parser")
+
+def cms_file_read(inPath, reader="file"):
     # Read file and save in OrderedDict
     # Identify Headings and set them as level 0
     # Everything else assign as Level 1
@@ -30,161 +39,448 @@ def cms_file_read(inPath):
     # Add in claimNumber value to line_dict to simplify detail
     # downstream processing of lines
 
-    DBUG = False
+    # The line classification itself lives in cms_line_iter()
+    # Returns a CMSLineTable. Use .to_f_lines() for the old
+    # [{ln_cntr: line_dict}, ...] layout (eg. the CMSDICT dump)
+    # reader = "mmap" reads through cms_reader.MappedLines, which
+    # drops the blank lines before cms_line_iter sees them
 
-    ln_cntr = 0
-    blank_ln = 0
-    f_lines = []
-    set_level = 0
+    f_lines = CMSLineTable()
 
-    line_type = "BODY"
-    header_line = False
-    set_header = "HEADER"
-    current_segment = ""
-    claim_number = ""
+    with open_lines(inPath, reader, skip_blank=True) as f:
+        for line in cms_line_iter(f):
+            f_lines.append(line)
 
-    kvs = {}
+    # print ln_cntr, "written."
+    # print f_lines
 
-    line_dict = {"key": 0,
-                 "level": 0,
-                 "line": "",
-                 "type": "",
-                 "claimNumber": "",
-                 "category": ""}
+    return f_lines
 
-    with open(inPath, 'r') as f:
-        # get the line from the input file
-        # print "Processing:",
-        for i, l in enumerate(f):
-            # reset the dictionary
-            line_dict = {}
 
-            # Read each line in file
-            l = l.rstrip()
-            # remove white space from end of line
+def cms_line_iter(lines, claim_number=None):
+    # Generator that classifies CMS BlueButton text lines
+    # lines = any iterable of text lines (eg. an open file)
+    # claim_number = the claim number in force before the first line.
+    # None when no claim number has been seen. Used to start part way
+    # through a file (see cms_sections)
+    # yields a CMSLine for every line cms_file_read keeps
+    # The classification is done by CMSLineReader
 
-            # if (i % 10) == 0:
-                # print ".",
-                # Show progress every 10 steps
+    reader = CMSLineReader(claim_number)
+    push = reader.push
+    for l in lines:
+        line_dict = push(l)
+        if line_dict is not None:
+            yield line_dict
 
-            if len(l) < 1:
-                # skip blank lines
-                blank_ln += 1
-                continue
+    line_dict = reader.close()
+    if line_dict is not None:
+        yield line_dict
 
-            if line_type == "BODY" and (divider in l):
-                header_line = True
-                get_title = True
-                line_type = "HEADER"
-                blank_ln += 1
-                continue
-            elif line_type == "HEADER" and header_line and get_title:
-                # Get the title line
-                # print "we found title:",l
-                # print i, "[About to set Seg:", l, "]"
-                # Save the current_segment before we overwrite it
-                if not (divider in l):
-                    if len(l.strip()) > 0:
-                        # print "title length:", len(l.strip())
 
-                        # Remove : from Title - for Claims LineNumber:
-                        titleline = l.split(":")
-                        tl = titleline[0].rstrip()
-                        set_header = line_type
-                        current_segment = tl
-                        get_title = False
-                        if "CLAIM LINES FOR CLAIM NUMBER" in l.upper():
-                            # we have to account for Part D Claims
-                            kvs = assign_simple_key(l, kvs)
-                            claim_number = kvs["v"]
-                            set_level = 1
-                        else:
-                            set_level = 0
-                else:
-                    # we didn't find a title
-                    # So set a default
-                    # Only claim summary title segments are blank
-                    # save current_segment
-                    previous_segment = current_segment
-                    current_segment = "claim Header"
-                    # print "set title to", current_segment
-                    # print i,"We never got a title line...",
-                    # current_segment
-                    set_level = 1
-                    header_line = False
-                    if current_segment == "claim Header":
-                        set_header = "HEADER"
-                    else:
-                        set_header = "HEADER"
-                    line_type = "BODY"
-
-                line_dict = {"key": ln_cntr,
-                             "level": set_level,
-                             "line": current_segment,
-                             "type": set_header,
-                             "claimNumber": claim_number}
-
-            elif line_type == "HEADER" and not get_title:
-                # we got a second divider
-                if divider in l:
-                    set_header = "BODY"
-                    line_type = "BODY"
-                    header_line = False
+class CMSLineReader(object):
+    # The line classifier behind cms_line_iter, one line at a time
+    # push(l) takes the next text line and returns the CMSLine for the
+    # line before it (or None). close() returns the last one.
+    # Used directly when the text arrives in pieces (see cms_feed)
 
-                    blank_ln += 1
-                    continue
+    # Identify Headings and set them as level 0
+    # Everything else assign as Level 1
 
+    # Each line is held back until the next line has been read so that
+    # a "Claim Type: Part D" line can still re-write the title of the
+    # "Claim Lines for Claim Number" header in front of it.
+
+    def __init__(self, claim_number=None):
+        # claim_number as for cms_line_iter
+        self.ln_cntr = 0
+        self.blank_ln = 0
+        self.set_level = 0
+
+        self.line_type = "BODY"
+        self.header_line = False
+        self.get_title = False
+        self.set_header = "HEADER"
+        self.current_segment = ""
+
+        self.kvs = {}
+        if claim_number is None:
+            self.claim_number = ""
+        else:
+            self.claim_number = claim_number
+            self.kvs["v"] = claim_number
+
+        self.pending = None
+
+    def push(self, l):
+        DBUG = TRACE and trace_on()
+
+        # reset the line record
+        line_dict = None
+
+        # Read each line in file
+        l = l.rstrip()
+        # remove white space from end of line
+
+        if len(l) < 1:
+            # skip blank lines
+            self.blank_ln += 1
+            return None
+
+        line_type = self.line_type
+
+        if line_type == "BODY" and (divider in l):
+            self.header_line = True
+            self.get_title = True
+            self.line_type = "HEADER"
+            self.blank_ln += 1
+            return None
+        elif line_type == "HEADER" and self.header_line and self.get_title:
+            # Get the title line
+            # Save the current_segment before we overwrite it
+            if not (divider in l):
+                if len(l.strip()) > 0:
+
+                    # Remove : from Title - for Claims LineNumber:
+                    tl, sep, rest = l.partition(":")
+                    tl = tl.rstrip()
+                    self.set_header = line_type
+                    self.current_segment = tl
+                    self.get_title = False
+                    if "CLAIM LINES FOR CLAIM NUMBER" in l.upper():
+                        # we have to account for Part D Claims
+                        kvs = self.kvs
+                        if sep:
+                            kvs["k"] = headlessCamel(tl)
+                            kvs["v"] = rest.strip()
+                        self.claim_number = kvs["v"]
+                        self.set_level = 1
+                    else:
+                        self.set_level = 0
             else:
-                line_type = "BODY"
-                set_header = line_type
-                if "CLAIM NUMBER" in l.upper():
-                    kvs = assign_simple_key(l, kvs)
-                    claim_number = kvs["v"]
-                if "CLAIM TYPE: PART D" in l.upper():
-                    # We need to re-write the previous f_lines entry
-                    prev_line = f_lines[ln_cntr - 1]
+                # we didn't find a title
+                # So set a default
+                # Only claim summary title segments are blank
+                # save current_segment
+                self.previous_segment = self.current_segment
+                self.current_segment = "claim Header"
+                self.set_level = 1
+                self.header_line = False
+                self.set_header = "HEADER"
+                self.line_type = "BODY"
+
+            line_dict = CMSLine(self.ln_cntr, self.set_level,
+                                self.current_segment, self.set_header,
+                                self.claim_number)
+
+        elif line_type == "HEADER" and not self.get_title:
+            # we got a second divider
+            if divider in l:
+                self.set_header = "BODY"
+                self.line_type = "BODY"
+                self.header_line = False
+
+                self.blank_ln += 1
+                return None
+
+        else:
+            self.line_type = "BODY"
+            self.set_header = "BODY"
+            line_dict = CMSLine(self.ln_cntr, self.set_level + 1, l,
+                                "BODY", self.claim_number)
+            if "CLAIM NUMBER" in l.upper():
+                kvs = self.kvs
+                if line_dict.kv:
+                    kvs["k"] = line_dict.k
+                    kvs["v"] = line_dict.v
+                self.claim_number = kvs["v"]
+                line_dict.claimNumber = self.claim_number
+            if "CLAIM TYPE: PART D" in l.upper():
+                # We need to re-write the previous line
+                prev_line = self.pending
+                if DBUG:
+                    do_DBUG("prev_line:", prev_line)
+                if prev_line.line.upper() == "CLAIM LINES FOR CLAIM NUMBER":
+                    prev_line.set_line("Part D Claims")
+
                     if DBUG:
-                        do_DBUG("prev_line:", prev_line)
-                    if prev_line[ln_cntr - 1]["line"].upper() == "CLAIM LINES FOR CLAIM NUMBER":
-                        prev_line[ln_cntr - 1]["line"] = "Part D Claims"
-                        f_lines[ln_cntr - 1] = prev_line
+                        do_DBUG("re-wrote prev_line:", prev_line)
 
-                        if DBUG:
-                            do_DBUG("re-wrote f_lines:",
-                                    f_lines[ln_cntr - 1])
-                line_dict = {"key": ln_cntr,
-                             "level": set_level + 1,
-                             "line": l,
-                             "type": set_header,
-                             "claimNumber": claim_number}
+        if line_dict is None:
+            # a line after a title that is not the closing divider
+            # used to be kept as an empty dict
+            line_dict = CMSLine(self.ln_cntr, None, None, None, None)
 
-            f_lines.append({ln_cntr: line_dict})
+        ready = self.pending
+        self.pending = line_dict
 
-            ln_cntr += 1
+        self.ln_cntr += 1
 
-    f.close()
+        return ready
 
-    # print i+1, "records"
-    # print ln_cntr, "written."
-    # print blank_ln, "skipped"
+    def close(self):
+        # The line still held back. None if there is none
+        DBUG = TRACE and trace_on()
 
-    # print f_lines
-    # print ""
+        ready = self.pending
+        self.pending = None
 
-    return f_lines
+        if DBUG:
+            do_DBUG("lines:", self.ln_cntr, "skipped:", self.blank_ln)
+
+        return ready
+
+
+class CMSLine(object):
+    # One line from cms_line_iter()
+    # key = line number, level, line = text, type = HEADER or BODY and
+    # claimNumber = the claim the line belongs to.
+    # __slots__ keeps this to one small object per line where we used
+    # to hold {n: {...}}: two dicts per line. The parser reads the
+    # attributes. line["type"] style access still works for old code.
+
+    # The line is split once when it is read (see split_line):
+    # k = headlessCamel key, v = value after the first ":" and
+    # kv = True if the line has a ":". Use set_line() to change line
+    # so they stay in step.
+
+    __slots__ = ("key", "level", "line", "type", "claimNumber",
+                 "k", "v", "kv")
+
+    def __init__(self, key, level, line, type, claimNumber):
+        self.key = key
+        self.level = level
+        self.type = type
+        self.claimNumber = claimNumber
+        self.set_line(line)
+
+    def set_line(self, line):
+        self.line = line
+        if line is None:
+            self.k, self.v, self.kv = None, None, False
+        else:
+            self.k, self.v, self.kv = split_line(line)
+
+    def __getitem__(self, k):
+        if k not in self.__slots__:
+            raise KeyError(k)
+        return getattr(self, k)
+
+    def __setitem__(self, k, v):
+        if k not in self.__slots__:
+            raise KeyError(k)
+        if k == "line":
+            self.set_line(v)
+        else:
+            setattr(self, k, v)
+
+    def __contains__(self, k):
+        return k in self.__slots__
+
+    def __repr__(self):
+        return "CMSLine(%r, %r, %r, %r, %r)" % (self.key, self.level,
+                                                 self.line, self.type,
+                                                 self.claimNumber)
+
+    def to_dict(self):
+        # The line_dict cms_file_read used to build
+        if self.line is None:
+            return {}
+        return {"key": self.key,
+                "level": self.level,
+                "line": self.line,
+                "type": self.type,
+                "claimNumber": self.claimNumber}
+
+
+class CMSLineTable(list):
+    # Every CMSLine in a file. ln_list[i] is the record for line i
+
+    def to_f_lines(self):
+        # [{ln_cntr: line_dict}, ...] as cms_file_read used to return
+        return [{line.key: line.to_dict()} for line in self]
+
+    @classmethod
+    def from_f_lines(cls, f_lines):
+        # Build a table from the old [{ln_cntr: line_dict}, ...] list
+        table = cls()
+        for entry in f_lines:
+            for n, line_dict in entry.items():
+                table.append(CMSLine(line_dict.get("key", n),
+                                     line_dict.get("level"),
+                                     line_dict.get("line"),
+                                     line_dict.get("type"),
+                                     line_dict.get("claimNumber")))
+        return table
+
+
+class CMSLineWindow(object):
+    # Read-only, list-like view of the lines from cms_line_iter()
+    # parse_lines() and the process_* functions only ever look a few
+    # lines behind the furthest line they have read, so we keep a
+    # small window of CMSLine records instead of the whole table.
+
+    def __init__(self, line_iter, keep=16):
+        self.line_iter = line_iter
+        self.keep = keep
+        self.lines = collections.deque()
+        self.base = 0
+        self.read = 0
+        self.highest = -1
+        self.eof = False
+
+    def fill(self, upto):
+        # read lines until index upto is buffered or the input ends
+        while not self.eof and self.read <= upto:
+            try:
+                line = next(self.line_iter)
+            except StopIteration:
+                self.eof = True
+                break
+            self.lines.append(line)
+            self.read += 1
+
+    def __getitem__(self, i):
+        if i < self.base:
+            raise IndexError("line %s is no longer in the window" % i)
+
+        if i > self.highest:
+            self.highest = i
+            while self.base < self.highest - self.keep:
+                self.lines.popleft()
+                self.base += 1
+
+        self.fill(i)
+        if i >= self.read:
+            raise IndexError("line index out of range")
+
+        return self.lines[i - self.base]
+
+    def __len__(self):
+        # The callers only compare len() against the line they are on
+        # or the one after it. Reading two lines past the furthest line
+        # requested lets us return the real length at end of file and
+        # a safe lower bound before that.
+        self.fill(self.highest + 2)
+        return self.read
+
+
+def cms_stream_parse(inPath, reader="file"):
+    # Single pass CMS BlueButton parser
+    # Reads, classifies and builds the JSON dict in one pass over inPath
+    # Returns the same result as parse_lines(cms_file_read(inPath))
+    # without holding every line of the file in memory
+    # reader = "file" or "mmap" as for cms_file_read
+
+    with open_lines(inPath, reader, skip_blank=True) as f:
+        out_dict = parse_lines(CMSLineWindow(cms_line_iter(f)))
+
+    return out_dict
+
+
+class CMSParser(object):
+    # cms_stream_parse with its own copy of SEG_DEF, compiled once
+    # seg_def = a SEG_DEF style list. None uses file_def_cms.SEG_DEF.
+    # It is deep copied so later changes to the list passed in do not
+    # reach the parser.
+    # normalize = True to convert the FLD_TYPES fields: money to int
+    # cents, counts to int. fld_types = a table to use in place of
+    # FLD_TYPES. keep_raw = True writes {"value": 12345, "raw": "$123.45"}
+    # Nothing on the instance changes after __init__, so one CMSParser
+    # can serve parses in any number of threads. Each out_dict gets its
+    # own copy of the "pre" values (see segment_prefill)
+
+    def __init__(self, seg_def=None, normalize=False, fld_types=None,
+                 keep_raw=False):
+        if seg_def is None:
+            seg_def = SEG_DEF
+        if fld_types is None:
+            fld_types = FLD_TYPES
+        if not normalize:
+            fld_types = {}
+        for field, fld_type in fld_types.items():
+            if fld_type not in FLD_CONVERT:
+                raise ValueError("field %s: type %r is not one of %s" %
+                                 (field, fld_type,
+                                  ", ".join(sorted(FLD_CONVERT))))
+        self.seg_def = copy_seg_def(seg_def)
+        self.seg_index = compile_seg_def(self.seg_def, fld_types,
+                                         keep_raw)
+
+    def __repr__(self):
+        return "CMSParser(%d segments, %d field types)" % (
+            len(self.seg_def), len(self.seg_index["fld_types"]))
+
+    def parse(self, inPath, reader="file"):
+        # Same as cms_stream_parse(inPath, reader)
+
+        DBUG = TRACE and trace_on()
+
+        with open_lines(inPath, reader, skip_blank=True) as f:
+            out_dict = self.parse_lines(CMSLineWindow(cms_line_iter(f)))
+
+        if DBUG:
+            do_DBUG("inPath:", inPath, "keys:", list(out_dict.keys()))
+
+        return out_dict
+
+    def parse_lines(self, ln_list):
+        # Same as parse_lines(ln_list)
 
+        return parse_lines(ln_list, self.seg_index)
 
-def parse_lines(ln_list):
+    def lookup(self, title, exact=False):
+        # lookup_segment() in this parser's SEG_DEF
+
+        return lookup_segment(title, exact, self.seg_index)
+
+
+def copy_seg_def(seg_def):
+    # Deep copy of a SEG_DEF list for CMSParser
+    # copy.deepcopy rebuilds a dict and can change the order its keys
+    # come out in. The "pre" values are written to the out_dict in
+    # that order so they are copied in to OrderedDicts instead
+
+    result = []
+    for entry in seg_def:
+        entry = copy.deepcopy(entry)
+        if entry.get("pre") is not None:
+            entry["pre"] = ordered_copy(seg_def[len(result)]["pre"])
+        result.append(entry)
+
+    return result
+
+
+def ordered_copy(value):
+    # Deep copy of value with every dict as an OrderedDict in the
+    # order the original iterates in
+
+    if isinstance(value, dict):
+        return collections.OrderedDict((k, ordered_copy(v))
+                                       for k, v in value.iteritems())
+    if isinstance(value, list):
+        return [ordered_copy(v) for v in value]
+    return copy.deepcopy(value)
+
+
+def parse_lines(ln_list, seg_index=None):
     # Receive list created in cms_file_read
     # Build the final Json dict
     # Use SEG_DEF to control JSON construction
+    # seg_index = compile_seg_def() of another SEG_DEF (see CMSParser).
+    # None uses SEG_INDEX
 
     # set variables
 
-    DBUG = False
+    DBUG = TRACE and trace_on()
+
+    if not isinstance(ln_list, (CMSLineTable, CMSLineWindow)):
+        # [{ln_cntr: line_dict}, ...] in the old cms_file_read layout
+        ln_list = CMSLineTable.from_f_lines(ln_list)
 
     if DBUG:
-        to_json(ln_list)
+        # ln_list may be a CMSLineWindow so do not try to dump it
+        do_DBUG("parse_lines from:", type(ln_list).__name__)
 
     ln = {}
     ln_ctrl = {}
@@ -193,25 +489,14 @@ def parse_lines(ln_list):
     seg_match_exact = True
     # Pass to get_segment for an exact match
 
-    match_ln = [None, None, None, None, None, None, None, None, None, None]
+    # Breadcrumb of the headers and fields above the current line
+    match_ln = SegPath(seg_index=seg_index)
+    seg_index = match_ln.index
 
     segment_dict = collections.OrderedDict()
     out_dict = collections.OrderedDict()
     # Set starting point in list
 
-    if DBUG:
-        print "Initializing Working Storage Arrays...",
-
-    block_limit = 9
-    block = collections.OrderedDict()
-    n = 0
-    while n <= block_limit:
-        block[n] = collections.OrderedDict()
-        n += 1
-
-    if DBUG:
-        print "Done."
-
     i = 0
 
     # while i <= 44: #(len(ln_list)-1):
@@ -220,27 +505,28 @@ def parse_lines(ln_list):
 
         ln = get_line_dict(ln_list, i)
 
-        wrk_lvl = ln["level"]
+        wrk_lvl = ln.level
 
         match_ln = update_match(wrk_lvl,
-                                headlessCamel(ln["line"]),
+                                ln.k,
                                 match_ln)
 
-        match_hdr = combined_match(wrk_lvl, match_ln)
-
-        hdr_lk_up = headlessCamel(ln["line"])
+        hdr_lk_up = ln.k
 
         if DBUG:
             do_DBUG("Line(i):", i, "ln:", ln,
                     "hdr_lk_up:", hdr_lk_up)
 
         # lookup ln in SEG_DEF
+        # No SEG_DEF title has a ":" so key: value lines never match
 
-        if find_segment(hdr_lk_up, seg_match_exact):
+        ln_ctrl = None
+        if not ln.kv:
+            ln_ctrl = lookup_segment(hdr_lk_up, seg_match_exact, seg_index)
 
-            ln_ctrl = get_segment(hdr_lk_up, seg_match_exact)
+        if ln_ctrl is not None:
 
-            wrk_lvl = adjusted_level(ln["level"], match_ln)
+            wrk_lvl = adjusted_level(ln.level, match_ln)
             # We found a match in SEG_DEF
             # So we use SEG_DEF to tailor how we write the line and
             # section since a SEG_DEF defines special processing
@@ -250,7 +536,7 @@ def parse_lines(ln_list):
                         "i:", i,
                         "Match_ln:", match_ln,
                         "ln-ctrl:", to_json(ln_ctrl),
-                        "ln_lvl:", ln["level"],
+                        "ln_lvl:", ln.level,
                         "wrk_lvl:", wrk_lvl)
 
             i, sub_seg, seg_name = process_header(i, ln_ctrl,
@@ -541,7 +827,7 @@ def cms_file_parse2(inPath):
                         # match key against segment
                         match_string = current_segment + "." + k
 
-                        print "Match:", match_string
+                        cms_log.debug("Match: %s", match_string)
 
                         if find_segment(match_string):
                             # Get info about how to treat this key
@@ -670,7 +956,7 @@ def cms_file_parse(inPath):
                 else:
                     # not the first header so we should write the segment
                     # print "Not First Header - Write segment"
-                    print i, "writing segment",
+                    cms_log.debug("%s writing segment", i)
                     items, segment_dict = write_segment(items,
                                                         current_segment,
                                                         segment_dict)
@@ -712,12 +998,13 @@ def cms_file_parse(inPath):
                     segment_dict = collections.OrderedDict()
                     segment_dict[current_segment] = {}
 
-                print "%s:Current_Segment: %s" % (i, current_segment)
+                cms_log.debug("%s:Current_Segment: %s", i, current_segment)
                 # print "Header Line:",header_line
                 # go to next line in file
                 continue
 
-            print "[%s:CSeg:%s|%s L:[%s]" % (i,current_segment,line_type,l)
+            cms_log.debug("[%s:CSeg:%s|%s L:[%s]", i, current_segment,
+                          line_type, l)
 
             # print "%s:Not a Heading Line" % i
             ######################################
@@ -13,12 +13,26 @@ from datetime import datetime, date, timedelta
 
 import json
 import collections
-import inspect
+import copy
+import logging
+import re
 import six
+import sys
+import threading
 
-from file_def_cms import SEG_DEF
+from file_def_cms import SEG_DEF, CMS_LABELS, FLD_TYPES
 from usa_states import STATES
 
+# Tracing
+# Each function starts with DBUG = TRACE and trace_on(). Add a function
+# name (eg. "process_subseg"), a module name (eg. "cms_custom") or "*"
+# to TRACE with set_trace() to switch its do_DBUG output on at run time.
+# Output goes to the "bluebutton.trace" logger at DEBUG level.
+# With TRACE empty the check is a single test of an empty set.
+TRACE = set()
+trace_log = logging.getLogger("bluebutton.trace")
+logging.getLogger("bluebutton").addHandler(logging.NullHandler())
+
 def process_header(strt_ln, ln_control, strt_lvl, ln_list):
     # Input:
     # strt_ln = current line number in the dict
@@ -35,7 +49,7 @@ def process_header(strt_ln, ln_control, strt_lvl, ln_list):
     #    }
     # },
 
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
     wrk_add_dict = collections.OrderedDict()
 
@@ -142,7 +156,7 @@ def process_subseg(strt_ln, ln_control, match_ln, strt_lvl,
     # we create and increment that on change of "Line Number" found in
     # the lines
 
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
     current_segment = seg_name
     seg_type = check_type(seg[seg_name])
@@ -178,15 +192,16 @@ def process_subseg(strt_ln, ln_control, match_ln, strt_lvl,
 
     # get current line
     current_line = get_line_dict(ln_list, wrk_ln)
-    wrk_ln_lvl = current_line["level"]
+    wrk_ln_lvl = current_line.level
 
     # Update match_ln with headers name from SEG_DEF (ie. ln_control)
     match_ln = update_match(strt_lvl, seg_name, match_ln)
 
-    match_hdr = combined_match(wrk_ln_lvl, match_ln)
-    # Find segment using combined header
+    # Find segment using the breadcrumb in match_ln
+    hdr_seg_def = match_lookup(wrk_ln_lvl, match_ln, True)
 
     if DBUG:
+        match_hdr = combined_match(wrk_ln_lvl, match_ln)
         do_DBUG(">>==>>==>>==>>==>>==>>==>>==>>==>>==>>==>>",
                 "type:", seg_type,
                 "seg", to_json(seg),
@@ -214,7 +229,8 @@ def process_subseg(strt_ln, ln_control, match_ln, strt_lvl,
 
         # update the match string in match_ln
 
-        is_line_seg_def = find_segment(match_hdr, True)
+        found_seg_def = hdr_seg_def
+        is_line_seg_def = found_seg_def is not None
         # Find SEG_DEF with match exact = True
 
         if DBUG:
@@ -228,7 +244,7 @@ def process_subseg(strt_ln, ln_control, match_ln, strt_lvl,
         if is_line_seg_def:
             # We found an entry in SEG_DEF using match_hdr
 
-            wrk_seg_def = get_segment(match_hdr, True)
+            wrk_seg_def = found_seg_def
             # We found a SEG_DEF match with exact=True so Get the SEG_DEF
 
             match_ln = update_match(wrk_ln_lvl, wrk_seg_def["name"],
@@ -247,7 +263,7 @@ def process_subseg(strt_ln, ln_control, match_ln, strt_lvl,
                         "match_ln:", match_ln,
                         "wrk_ln:", wrk_ln,
                         "strt_ln:", strt_ln,
-                        "current_line type:", current_line["type"])
+                        "current_line type:", current_line.type)
 
             if (wrk_ln != strt_ln) and (is_head(current_line)):
                 # we found a new header
@@ -256,7 +272,7 @@ def process_subseg(strt_ln, ln_control, match_ln, strt_lvl,
                 # So test for level = strt_lvl
                 if DBUG:
                     do_DBUG("DEALING WITH NEW HEADER:",
-                            current_line["line"])
+                            current_line.line)
 
                 # set wrk_ln_head = True
                 # Clean up the last section since we are in a
@@ -306,7 +322,8 @@ def process_subseg(strt_ln, ln_control, match_ln, strt_lvl,
         # Get key and value
         kvs = assign_key_value(current_line,
                                wrk_seg_def,
-                               kvs)
+                               kvs,
+                               seg_index_of(match_ln))
 
         if DBUG:
             do_DBUG("wrk_ln_lvl:", wrk_ln_lvl, "match_hdr:", match_hdr,
@@ -637,21 +654,29 @@ def process_subseg(strt_ln, ln_control, match_ln, strt_lvl,
         # increment the line counter
         if wrk_ln < len(ln_list): # - 1:
             current_line = get_line_dict(ln_list, wrk_ln)
-            wrk_ln_lvl = current_line["level"]
+            wrk_ln_lvl = current_line.level
             # update the match string in match_ln
-            if find_segment(headlessCamel(current_line["line"]),
-                            exact=True):
-                wrk_seg_def = get_segment(
-                    headlessCamel(current_line["line"]), exact=True)
-                wrk_ln_lvl = max(current_line["level"],
+            # key: value lines are never a SEG_DEF title
+            found_seg_def = None
+            if not current_line.kv:
+                found_seg_def = lookup_segment(current_line.k, True,
+                                               seg_index_of(match_ln))
+            if found_seg_def is not None:
+                wrk_seg_def = found_seg_def
+                wrk_ln_lvl = max(current_line.level,
                                  wrk_seg_def["level"])
 
             match_ln = update_match(wrk_ln_lvl,
-                                    headlessCamel(current_line["line"]),
+                                    current_line.k,
                                     match_ln)
-            match_hdr = combined_match(wrk_ln_lvl, match_ln)
-            # Find segment using combined header
-            wrk_seg_def = get_segment(match_hdr, True)
+            # Find segment using the breadcrumb in match_ln
+            # The top of the loop uses the same lookup
+            hdr_seg_def = match_lookup(wrk_ln_lvl, match_ln, True)
+            wrk_seg_def = hdr_seg_def
+            if wrk_seg_def is None:
+                wrk_seg_def = {}
+            if DBUG:
+                match_hdr = combined_match(wrk_ln_lvl, match_ln)
             if is_head(current_line):
                 ln_control_alt = wrk_seg_def
             # We found a SEG_DEF match with exact=True so Get the SEG_DEF
@@ -742,11 +767,11 @@ def adjusted_level(lvl, match_ln):
     # lookup the level based on the max of source line lvl
     # and SEG_DEF matched level
 
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
     result = lvl
-    if find_segment(combined_match(lvl, match_ln)):
-        seg_info = get_segment(combined_match(lvl, match_ln))
+    seg_info = match_lookup(lvl, match_ln)
+    if seg_info is not None:
         if key_is_in("level", seg_info):
             result = max(lvl, seg_info["level"])
 
@@ -757,30 +782,28 @@ def adjusted_level(lvl, match_ln):
     return result
 
 
-def assign_key_value(line_dict, wrk_seg_def, kvs):
+def assign_key_value(line_dict, wrk_seg_def, kvs, seg_index=None):
     # evaluate the line to get key and value
+    # seg_index = the compiled SEG_DEF in use. Its "fld_types" (see
+    # FLD_TYPES) says which values to convert. None = SEG_INDEX
 
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
-    full_line = line_dict["line"]
-    kvs["ln"] = line_dict["key"]
-    claim = line_dict["claimNumber"]
+    full_line = line_dict.line
+    kvs["ln"] = line_dict.key
+    claim = line_dict.claimNumber
 
     if DBUG and kvs["ln"] > 140 and kvs["ln"] < 199:
         do_DBUG("line_dict:", line_dict,
                 "kvs:", kvs, )
 
-    line_source = full_line.split(":")
-    if len(line_source) > 1:
-        kvs["k"] = headlessCamel(line_source[0])
-        kvs["v"] = line_source[1].lstrip()
-        # lines with more than 1 : get truncated.
-        # so lets make sure we ge the whole line
-        kvs = get_rest_of_line(kvs, line_source)
-        kvs["v"] = kvs["v"].rstrip()
+    if line_dict.kv:
+        # split when the line was read. v keeps any later ":"
+        kvs["k"] = line_dict.k
+        kvs["v"] = line_dict.v
 
     else:
-        if line_dict["type"].upper() == "HEADER":
+        if line_dict.type.upper() == "HEADER":
             kvs["k"] = wrk_seg_def["name"]
             kvs["v"] = full_line.rstrip()
             kvs["category"] = kvs["v"]
@@ -823,6 +846,13 @@ def assign_key_value(line_dict, wrk_seg_def, kvs):
     if "/" in kvs["k"]:
         kvs["k"] = kvs["k"].translate(None, "/")
 
+    if seg_index is None:
+        seg_index = SEG_INDEX
+    if seg_index["fld_types"] and kvs["k"] in seg_index["fld_types"]:
+        kvs["v"] = normalize_value(kvs["v"],
+                                   seg_index["fld_types"][kvs["k"]],
+                                   seg_index["keep_raw"])
+
     if claim:
         kvs["claimNumber"] = claim
 
@@ -857,7 +887,7 @@ def build_address(ln_list, wk_ln):
     # so read until k.upper() == "ZIP"
     # then return address block and work_ln reached
 
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
     address_block = collections.OrderedDict([("addressType", ""),
                                              ("addressLine1", ""),
@@ -871,9 +901,14 @@ def build_address(ln_list, wk_ln):
     while not end_block:
 
         ln_dict = get_line_dict(ln_list, wk_ln)
-        l = ln_dict["line"]
 
-        k, v = split_k_v(l)
+        if ln_dict.kv:
+            # same as split_k_v: the value stops at the next ":"
+            k = ln_dict.k
+            v = ln_dict.v.split(":", 1)[0].rstrip()
+        else:
+            k = "comments"
+            v = ln_dict.line
         # print wk_ln, ":", k
 
         if k in address_block:
@@ -953,6 +988,76 @@ def build_address(ln_list, wk_ln):
     return address_block, wk_ln - 1
 
 
+def camel_cache_clear():
+    # Empty the LRU cache and zero CAMEL_STATS. CAMEL_TABLE is kept
+
+    with CAMEL_LOCK:
+        CAMEL_LRU.clear()
+        for k in CAMEL_STATS:
+            CAMEL_STATS[k] = 0
+
+
+def camel_cache_info():
+    # Hit/miss counts for headlessCamel
+    # table_hits = found in CAMEL_TABLE, hits = found in the LRU cache,
+    # misses = worked out, evictions = dropped from a full LRU cache.
+    # Use this to decide if a label belongs in CMS_LABELS or
+    # CAMEL_CACHE_SIZE needs to change
+    # hits, evictions and the misses of str labels are counted under
+    # CAMEL_LOCK. table_hits (and misses of unicode labels) are not, so
+    # with parses in several threads they can come out a little low
+
+    info = dict(CAMEL_STATS)
+    calls = sum(CAMEL_STATS[k] for k in ("table_hits", "hits", "misses"))
+    info["calls"] = calls
+    info["table_size"] = len(CAMEL_TABLE)
+    info["size"] = len(CAMEL_LRU)
+    info["max_size"] = CAMEL_CACHE_SIZE
+    if calls:
+        info["hit_rate"] = (CAMEL_STATS["table_hits"] +
+                            CAMEL_STATS["hits"]) / float(calls)
+    else:
+        info["hit_rate"] = 0.0
+
+    return info
+
+
+def camel_case(In_put):
+    # The uncached headlessCamel
+    # Raises IndexError if In_put has nothing left to camel case
+
+    Camel = ''.join(x for x in In_put.title() if not x.isspace())
+    Camel = Camel.replace('_', '')
+
+    return Camel[0].lower() + Camel[1:len(Camel)]
+
+
+def camel_seed(seg_def, labels):
+    # Labels to work out up front for CAMEL_TABLE:
+    # the known CMS labels plus any title in a SEG_DEF "pre"
+
+    seed = list(labels)
+    for ky in seg_def:
+        if "pre" in ky and "title" in ky["pre"]:
+            seed.append(ky["pre"]["title"])
+
+    return seed
+
+
+# headlessCamel caches
+# CAMEL_TABLE is built once at import from CMS_LABELS and SEG_DEF and
+# never changes. Other labels go in the CAMEL_LRU cache, which holds
+# the CAMEL_CACHE_SIZE most recently used, behind CAMEL_LOCK so parses
+# in several threads can share it. camel_cache_info() reports
+# CAMEL_STATS.
+CAMEL_CACHE_SIZE = 1024
+CAMEL_TABLE = dict((l, camel_case(l)) for l in camel_seed(SEG_DEF,
+                                                         CMS_LABELS))
+CAMEL_LRU = collections.OrderedDict()
+CAMEL_LOCK = threading.Lock()
+CAMEL_STATS = {"table_hits": 0, "hits": 0, "misses": 0, "evictions": 0}
+
+
 def check_type(check_this):
     # Check_this and return type
 
@@ -983,7 +1088,7 @@ def combined_match(lvl, match_ln):
     # return the combined String as combined_header
     # eg. patient.partAEffectiveDate
 
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
     ctr = 0
     combined_header = ""
@@ -1011,11 +1116,195 @@ def combined_match(lvl, match_ln):
     return combined_header
 
 
+def compile_seg_def(seg_def, fld_types=None, keep_raw=False):
+    # Compile a SEG_DEF list in to hash lookup tables
+    # "exact" maps each "match" string to its SEG_DEF entry
+    # "contains" maps every substring of every "match" string to
+    # the entry find_segment(title, exact=False) would return.
+    # Where more than one entry matches the first one in SEG_DEF
+    # order wins, same as the old linear scan.
+    # "trie" is the same "match" strings split on "." for SegPath
+    # "fld_types" / "keep_raw" = field conversions for
+    # assign_key_value (see FLD_TYPES). Empty = leave values as text
+
+    exact = {}
+    contains = {}
+
+    for ky in seg_def:
+        match = ky["match"]
+        if match not in exact:
+            exact[match] = ky
+
+        strt = 0
+        while strt <= len(match):
+            end = strt
+            while end <= len(match):
+                if match[strt:end] not in contains:
+                    contains[match[strt:end]] = ky
+                end += 1
+            strt += 1
+
+    return {"exact": exact, "contains": contains,
+            "trie": compile_seg_trie(seg_def, exact, contains),
+            "fld_types": dict(fld_types or {}),
+            "keep_raw": keep_raw}
+
+
+def compile_seg_trie(seg_def, exact, contains):
+    # Build a SegNode trie from the "match" strings in seg_def
+    # One node per breadcrumb component (eg. claims -> details ->
+    # lineNumber). Each node holds what lookup_segment would return
+    # for the "." joined path to it, so SegPath.lookup() never has to
+    # build the string.
+
+    root = SegNode()
+    for ky in seg_def:
+        node = root
+        for component in ky["match"].split("."):
+            if component not in node.children:
+                node.children[component] = SegNode()
+            node = node.children[component]
+
+    # fill in the lookups now the tree is built
+    todo = [(child, component)
+            for component, child in root.children.items()]
+    while todo:
+        node, path = todo.pop()
+        node.exact = exact.get(path)
+        node.contains = contains.get(path)
+        for component, child in node.children.items():
+            todo.append((child, path + "." + component))
+
+    return root
+
+
+class SegNode(object):
+    # A node in the compile_seg_trie() trie
+    # children = {component: SegNode}
+    # exact / contains = lookup_segment(path, exact=True / False)
+    # for the path from the root to this node
+
+    __slots__ = ("children", "exact", "contains")
+
+    def __init__(self):
+        self.children = {}
+        self.exact = None
+        self.contains = None
+
+
+class SegPath(object):
+    # The match_ln breadcrumb as a cursor on the SEG_DEF trie
+    # Reads and writes like the old 10 slot list so update_match() and
+    # combined_match() still work on it. nodes[n] is the trie node for
+    # the breadcrumb up to level n. Setting a level drops the nodes
+    # below it and they are walked again, one step from their parent,
+    # the next time lookup() needs them. None means the breadcrumb has
+    # left the trie, so lookup() falls back to the joined string.
+
+    __slots__ = ("parts", "nodes", "valid", "index")
+
+    def __init__(self, size=10, seg_index=None):
+        if seg_index is None:
+            seg_index = SEG_INDEX
+        self.index = seg_index
+        self.parts = [None] * size
+        self.nodes = [None] * size
+        # nodes[0:valid] are up to date
+        self.valid = 0
+
+    def __getitem__(self, lvl):
+        return self.parts[lvl]
+
+    def __setitem__(self, lvl, component):
+        self.parts[lvl] = component
+        if lvl < self.valid:
+            self.valid = lvl
+
+    def __len__(self):
+        return len(self.parts)
+
+    def __iter__(self):
+        return iter(self.parts)
+
+    def __repr__(self):
+        return repr(self.parts)
+
+    def to_dict(self):
+        # for to_json()
+        return self.parts
+
+    def node(self, lvl):
+        # trie node for the breadcrumb up to lvl
+        parts = self.parts
+        nodes = self.nodes
+        while self.valid <= lvl:
+            n = self.valid
+            component = parts[n]
+            if n == 0:
+                parent = self.index["trie"]
+                if component is None:
+                    parent = None
+            else:
+                parent = nodes[n - 1]
+
+            if parent is None or component is None:
+                # None components are skipped by combined_match
+                nodes[n] = parent
+            elif "." in component:
+                # a title can hold a "." (mymedicare.GovPersonal...)
+                for piece in component.split("."):
+                    parent = parent.children.get(piece)
+                    if parent is None:
+                        break
+                nodes[n] = parent
+            else:
+                nodes[n] = parent.children.get(component)
+            self.valid = n + 1
+
+        return nodes[lvl]
+
+    def lookup(self, lvl, exact=False):
+        # Same result as lookup_segment(combined_match(lvl, self), exact)
+
+        node = self.node(lvl)
+        if node is None:
+            if exact and self.parts[0] is not None:
+                # Not a path in the trie so not a "match" string
+                return None
+            # A "contains" match can still hit part way through a
+            # component
+            return lookup_segment(combined_match(lvl, self), exact,
+                                  self.index)
+
+        if exact:
+            return node.exact
+        return node.contains
+
+
+# Compiled once at import. Use lookup_segment() to read it.
+# No field conversions: CMSParser(normalize=True) compiles its own
+SEG_INDEX = compile_seg_def(SEG_DEF)
+
+# parse_date and parse_time
+# DATE_RE / TIME_RE only take the layout the CMS file uses. Anything
+# else (extra spaces, 2 digit years, dates before 1900) is left to
+# strptime. DATE_CACHE and TIME_CACHE map the stripped input to the
+# result. They are kept apart because the same text can be a valid
+# date and a bad time (or the other way round).
+DATE_RE = re.compile(r"(\d{1,2})/(\d{1,2})/(\d{4})\Z")
+TIME_RE = re.compile(r"(\d{1,2})/(\d{1,2})/(\d{4}) "
+                     r"(\d{1,2}):(\d{2}) ([AaPp][Mm])\Z")
+DAYS_IN_MONTH = (0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+DATE_CACHE_SIZE = 4096
+DATE_CACHE = {}
+TIME_CACHE = {}
+
+
 def dict_in_list(ln_control):
     # if SEG_DEF type = list and sub_type = "dict"
     # return true
 
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
     result = False
     if ln_control["type"].upper() == "LIST":
@@ -1030,57 +1319,90 @@ def dict_in_list(ln_control):
 
 
 def do_DBUG(*args, **kwargs):
-    # basic debug printing function
-    # if string ends in : then print without newline
-    # so next value prints on the same line
-
-    # inspect.stack()[1][3] = Function that called do_DBUG
-    # inspect.stack()[1][2] = line number in calling function
-
-    # print inspect.stack()
-    print "####################################"
-    print "In function:", inspect.stack()[1][3], "[", \
-        inspect.stack()[1][2], "]"
-    # print args
-
-    # print six.string_types
-    for i in args:
-        if isinstance(i, six.string_types):
-            if len(i) > 1:
-                if i[-1] == ":":
-                    print i,
-                else:
-                    print i
-            else:
-                print i
-        else:
-            print i
-    print "####################################"
+    # basic debug logging function
+    # if string ends in : then the next value is written on the
+    # same line
+    # The calling function and line number come from the frame and the
+    # text is only built if the trace log is going to write it
+
+    if not trace_log.isEnabledFor(logging.DEBUG):
+        return
+
+    caller = sys._getframe(1)
+    trace_log.debug("In function: %s [ %s ]\n%s",
+                    caller.f_code.co_name, caller.f_lineno,
+                    TraceArgs(args))
 
     return
 
 
-def find_segment(title, exact=False):
-    DBUG = False
+class TraceArgs(object):
+    # Formats do_DBUG args the way the old print statements laid them
+    # out. Only runs when a log handler formats the record
 
-    result = False
-    ky = ""
+    def __init__(self, args):
+        self.args = args
 
-    # cycle through the seg dictionary to match against title
-    for ky in SEG_DEF:
-        if exact is False:
-            if title in ky["match"]:
-                result = True
-                break
-        else:
-            if ky["match"] == title:
-                result = True
-                break
+    def __str__(self):
+        out = []
+        for i in self.args:
+            if isinstance(i, six.string_types) and len(i) > 1 \
+                    and i[-1] == ":":
+                out.append(i + " ")
+            else:
+                out.append("%s\n" % (i,))
+        return "".join(out).rstrip("\n")
+
+
+def fast_date(d):
+    # Hand written M/D/YYYY -> YYYYMMDD
+    # Returns None if d is not a valid M/D/YYYY date in or after 1900
+    # so the caller can fall back to strptime_date. Before 1900
+    # strftime raises ValueError and we leave that to strptime_date.
+
+    m = DATE_RE.match(d)
+    if m is None:
+        return None
+
+    month, day, year = m.groups()
+    if not valid_date(int(month), int(day), int(year)):
+        return None
+
+    return "%04d%02d%02d" % (int(year), int(month), int(day))
+
+
+def fast_time(t):
+    # Hand written M/D/YYYY h:mm AM -> YYYYMMDDHHMMSS+0500
+    # Returns None for anything fast_date would or a bad time
+
+    m = TIME_RE.match(t)
+    if m is None:
+        return None
+
+    month, day, year, hour, minute, am_pm = m.groups()
+    hour = int(hour)
+    if not valid_date(int(month), int(day), int(year)):
+        return None
+    if hour < 1 or hour > 12 or int(minute) > 59:
+        return None
+
+    # 12 AM is 00, 12 PM is 12
+    hour %= 12
+    if am_pm.upper() == "PM":
+        hour += 12
+
+    return "%04d%02d%02d%02d%02d00+0500" % (int(year), int(month),
+                                             int(day), hour, int(minute))
+
+
+def find_segment(title, exact=False):
+    DBUG = TRACE and trace_on()
+
+    result = lookup_segment(title, exact) is not None
 
     if DBUG:
         do_DBUG("title:", title,
                 "match exact:", exact,
-                "ky in SEG_DEF:", ky,
                 "result:", result)
 
     return result
@@ -1090,7 +1412,7 @@ def get_dict_name(wrk_seg_def):
     # Get dict_name from wrk_seg_def
     # If no "dict_name" then return "name"
 
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
     if key_is_in("dict_name", wrk_seg_def):
         dict_name = wrk_seg_def["dict_name"]
@@ -1117,26 +1439,25 @@ def get_level(ln):
 
 
 def get_line_dict(ln, i):
-    # Get the inner line dict from ln
-    DBUG = False
+    # Get the CMSLine record for line i from ln
+    DBUG = TRACE and trace_on()
 
-    found_line = ln[i]
-    extract_line = found_line[i]
+    extract_line = ln[i]
 
     # fix for missing claim header line(s)
-    if "Claim Number:" in extract_line["line"]:
+    if "Claim Number:" in extract_line.line:
         # we need to check the previous line which
         # should be "claimHeader". If it isn't we have a missing
         # header so change this line content type to "HEADER"
         prev_i = max(0, i - 1)
-        prev_line = ln[prev_i][prev_i]
+        prev_line = ln[prev_i]
 
         if DBUG:
             do_DBUG("ln["+ str(prev_i)+"]:",
                     ln[prev_i],
                     prev_line)
-        if prev_line["line"].upper() == "CLAIM HEADER" or \
-                "SOURCE:" in prev_line["line"].upper():
+        if prev_line.line.upper() == "CLAIM HEADER" or \
+                "SOURCE:" in prev_line.line.upper():
             if DBUG:
                 do_DBUG("We found claim Number with previous claimHeader")
             pass
@@ -1144,9 +1465,7 @@ def get_line_dict(ln, i):
             if DBUG:
                 do_DBUG("MISSING PREVIOUS CLAIM HEADER",
                         "Extract line:", extract_line,
-                        "Previous Line:", prev_line,
-                        "Changing TYPE")
-                extract_line["type"] = "HEADER"
+                        "Previous Line:", prev_line)
 
     return extract_line
 
@@ -1156,7 +1475,7 @@ def get_rest_of_line(kvs, line_source):
     # so we need to rebuild the full value entry
     # line_source was split on ":" so we need to ad those back
 
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
     line_value = line_source[1]
     piece = 2
@@ -1181,26 +1500,15 @@ def get_rest_of_line(kvs, line_source):
 def get_segment(title, exact=False):
     # get the SEG_DEF record using title in Match
 
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
-    result = {}
-    ky = ""
-
-    # cycle through the seg dictionary to match against title
-    for ky in SEG_DEF:
-        if exact == False:
-            if title in ky["match"]:
-                result = ky
-                break
-        else:
-            if ky["match"] == title:
-                result = ky
-                break
+    result = lookup_segment(title, exact)
+    if result is None:
+        result = {}
 
     if DBUG:
         do_DBUG("title:", title,
                 "match exact:", exact,
-                "ky in SEG_DEF:", ky,
                 "result:", result)
 
     return result
@@ -1213,12 +1521,42 @@ def headlessCamel(In_put):
     # Make first character lower case
     # result result
 
-    DBUG = False
+    # The same few hundred labels repeat on every claim so look in
+    # CAMEL_TABLE, then the LRU cache, before working it out.
+    # Only str is cached so unicode In_put still returns unicode
 
-    Camel = ''.join(x for x in In_put.title() if not x.isspace())
-    Camel = Camel.replace('_', '')
+    DBUG = TRACE and trace_on()
 
-    result = Camel[0].lower() + Camel[1:len(Camel)]
+    result = None
+    if type(In_put) is str:
+        result = CAMEL_TABLE.get(In_put)
+
+    if result is not None:
+        # not under CAMEL_LOCK: this is the path nearly every call takes
+        # and the count is only a guide (see camel_cache_info)
+        CAMEL_STATS["table_hits"] += 1
+
+    elif type(In_put) is str:
+        # OrderedDict is not safe to change from two threads at once
+        with CAMEL_LOCK:
+            result = CAMEL_LRU.pop(In_put, None)
+            if result is None:
+                CAMEL_STATS["misses"] += 1
+                result = camel_case(In_put)
+                if len(CAMEL_LRU) >= CAMEL_CACHE_SIZE:
+                    try:
+                        CAMEL_LRU.popitem(last=False)
+                        CAMEL_STATS["evictions"] += 1
+                    except KeyError:
+                        pass
+            else:
+                CAMEL_STATS["hits"] += 1
+            # most recently used goes to the end
+            CAMEL_LRU[In_put] = result
+
+    else:
+        CAMEL_STATS["misses"] += 1
+        result = camel_case(In_put)
 
     if DBUG:
         do_DBUG("In_put:", In_put, "headlessCamel:", result)
@@ -1229,11 +1567,11 @@ def headlessCamel(In_put):
 def is_body(ln):
     # Is line type = "BODY"
 
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
     result = False
-    if key_is_in("type", ln):
-        if ln["type"].upper() == "BODY":
+    if ln.type:
+        if ln.type.upper() == "BODY":
             result = True
 
     if DBUG:
@@ -1258,16 +1596,16 @@ def is_eol(ln, lst):
 def is_head(ln):
     # Is line type = "HEADER" in ln
 
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
     result = False
 
-    if key_is_in("type", ln):
+    if ln.type:
 
         if DBUG:
-            do_DBUG("Matching HEAD in:", ln["type"])
+            do_DBUG("Matching HEAD in:", ln.type)
 
-        if "HEAD" in ln["type"].upper():
+        if "HEAD" in ln.type.upper():
             # match on "HEAD", "HEADING" or "HEADER"
             result = True
 
@@ -1280,7 +1618,7 @@ def is_head(ln):
 def is_multi(ln_dict):
     # Check value of "Multi" in ln_dict
 
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
     result = False
 
@@ -1301,7 +1639,7 @@ def is_multi(ln_dict):
 def key_is(ky, dt, val):
     # if KY is in DT and has VAL
 
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
     result = False
 
@@ -1322,7 +1660,7 @@ def key_is(ky, dt, val):
 def key_is_in(ky, dt):
     # Check if key is in dict
 
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
     result = False
     if ky in dt:
@@ -1339,7 +1677,7 @@ def key_is_in(ky, dt):
 def key_is_in_subdict(ky, dt):
     # Check if key is in dict
 
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
     result = False
 
@@ -1386,7 +1724,7 @@ def key_value(ky, dt):
 
     result = ""
 
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
     if ky in dt:
         result = dt[ky]
@@ -1399,6 +1737,50 @@ def key_value(ky, dt):
     return result
 
 
+def lookup_segment(title, exact=False, seg_index=None):
+    # Single hash lookup of title in the compiled SEG_DEF
+    # exact=True: title must equal a "match" string
+    # exact=False: title only has to be contained in a "match" string
+    # Return the SEG_DEF entry or None when there is no match
+
+    if seg_index is None:
+        seg_index = SEG_INDEX
+
+    if exact is False:
+        return seg_index["contains"].get(title)
+
+    return seg_index["exact"].get(title)
+
+
+def match_lookup(lvl, match_ln, exact=False):
+    # lookup_segment() for the breadcrumb in match_ln up to lvl
+    # A SegPath walks its trie. A plain list (the old match_ln) is
+    # joined with combined_match() and looked up as a string
+
+    if isinstance(match_ln, SegPath):
+        return match_ln.lookup(lvl, exact)
+
+    return lookup_segment(combined_match(lvl, match_ln), exact)
+
+
+def normalize_value(v, fld_type, keep_raw=False):
+    # Convert the text v of a FLD_TYPES field
+    # fld_type = "currency" (int cents) or "count" (int)
+    # keep_raw=True returns {"value": converted, "raw": v} instead,
+    # in the same way as effectiveTime holds {"value": ...}
+    # v is returned as it is if it does not convert
+
+    if not isinstance(v, six.string_types):
+        return v
+
+    result = FLD_CONVERT[fld_type](v)
+    if result is None:
+        return v
+    if keep_raw:
+        return collections.OrderedDict([("value", result), ("raw", v)])
+    return result
+
+
 def overide_fieldname(lvl, match_ln, current_fld):
     # Lookup line  in SEG_DEF using match_ln[lvl]
     # look for "name" or "field"
@@ -1406,11 +1788,12 @@ def overide_fieldname(lvl, match_ln, current_fld):
     # else return name or field
     # if name and field defined use field
 
+    DBUG = TRACE and trace_on()
+
     result = current_fld
 
-    title = combined_match(lvl, match_ln)
-    if find_segment(title):
-        tmp_seg_def = get_segment(title)
+    tmp_seg_def = match_lookup(lvl, match_ln)
+    if tmp_seg_def is not None:
         if key_is_in("field", tmp_seg_def):
             result = tmp_seg_def["field"]
         elif key_is_in("name", tmp_seg_def):
@@ -1418,16 +1801,60 @@ def overide_fieldname(lvl, match_ln, current_fld):
 
         if DBUG:
             do_DBUG("lvl:", lvl, "Match_ln", to_json(match_ln),
-                    "title:", title, "tmp_seg_def", to_json(tmp_seg_def),
+                    "title:", combined_match(lvl, match_ln),
+                    "tmp_seg_def", to_json(tmp_seg_def),
                     "Result:", result)
 
     return result
 
 
+def parse_cents(v):
+    # "$1,234.56" -> 123456. Also takes "-$5.00", "$5" and "5.5"
+    # None if v is not an amount of money (eg. "* Not Available *")
+
+    v = v.strip()
+    sign = 1
+    if v.startswith("-"):
+        sign = -1
+        v = v[1:].lstrip()
+    if v.startswith("$"):
+        v = v[1:]
+    v = v.replace(",", "")
+
+    dollars, sep, cents = v.partition(".")
+    if not (dollars or cents):
+        return None
+    if not dollars:
+        dollars = "0"
+    if not dollars.isdigit() or (sep and not cents.isdigit()) or \
+            len(cents) > 2:
+        return None
+
+    return sign * (int(dollars) * 100 + int(cents.ljust(2, "0")))
+
+
+def parse_count(v):
+    # "  3" -> 3. None if v is not a whole number
+
+    v = v.strip()
+    if not v.isdigit():
+        return None
+    return int(v)
+
+
+# FLD_TYPES type -> converter for normalize_value
+FLD_CONVERT = {"currency": parse_cents,
+               "count": parse_count}
+
+
 def parse_date(d):
     # convert date to json format
+    # M/D/YYYY -> YYYYMMDD
+    # Plain dates are converted by hand (fast_date) and remembered in
+    # DATE_CACHE. Anything else goes to strptime_date, which raises
+    # ValueError for input that is not a date.
 
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
     if DBUG:
         do_DBUG("Date to parse:", d)
@@ -1435,9 +1862,12 @@ def parse_date(d):
 
     d = d.strip()
     if len(d) > 0:
-        # print d
-        date_value = datetime.strptime(d, "%m/%d/%Y")
-        result = date_value.strftime("%Y%m%d")
+        result = DATE_CACHE.get(d)
+        if result is None:
+            result = fast_date(d)
+            if result is None:
+                result = strptime_date(d)
+            remember_date(DATE_CACHE, d, result)
 
     if DBUG:
         do_DBUG("Result:", result)
@@ -1447,15 +1877,20 @@ def parse_date(d):
 
 def parse_time(t):
     # convert time to  json format
+    # M/D/YYYY h:mm AM -> YYYYMMDDHHMMSS+0500
+    # Same approach as parse_date with TIME_CACHE
 
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
     if DBUG:
         do_DBUG("Time to parse:", t)
     t = t.strip()
-    time_value = datetime.strptime(t, "%m/%d/%Y %I:%M %p")
-    # print time_value
-    result = time_value.strftime("%Y%m%d%H%M%S+0500")
+    result = TIME_CACHE.get(t)
+    if result is None:
+        result = fast_time(t)
+        if result is None:
+            result = strptime_time(t)
+        remember_date(TIME_CACHE, t, result)
 
     if DBUG:
         do_DBUG("Result:", result)
@@ -1463,18 +1898,38 @@ def parse_time(t):
     return result
 
 
+def remember_date(cache, k, v):
+    # Add to cache (DATE_CACHE or TIME_CACHE). When it is full start
+    # again rather than keep track of what was used last. Dates repeat
+    # within a file far more than across files
+
+    if len(cache) >= DATE_CACHE_SIZE:
+        cache.clear()
+    cache[k] = v
+
+
+def seg_index_of(match_ln):
+    # The compiled SEG_DEF that match_ln looks things up in. A SegPath
+    # carries its own (see CMSParser). Anything else uses SEG_INDEX
+
+    if isinstance(match_ln, SegPath):
+        return match_ln.index
+
+    return SEG_INDEX
+
+
 def segment_prefill(wrk_seg_def, segment_dict):
     # Receive the Segment information for a header line
     # get the seg["pre"] and iterate through the dict
     # assigning to segment_dict
     # First we reset the segment_dict as an OrderedDict
 
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
     if len(segment_dict) > 0:
 
         if DBUG:
-            print "Pre-fill- segment_dict:", segment_dict, "NOT EMPTY"
+            do_DBUG("Pre-fill- segment_dict:", segment_dict, "NOT EMPTY")
 
         pass
     else:
@@ -1490,7 +1945,9 @@ def segment_prefill(wrk_seg_def, segment_dict):
         if "pre" in wrk_seg_def:
             pre = wrk_seg_def["pre"]
             for pi, pv in pre.iteritems():
-                segment_dict[pi] = pv
+                # copy so lists such as "comments" filled in while parsing
+                # do not get written back in to SEG_DEF
+                segment_dict[pi] = copy.deepcopy(pv)
 
     if DBUG:
         do_DBUG("Current_Segment:", current_segment,
@@ -1521,8 +1978,30 @@ def set_source(kvs):
     return kvs
 
 
+def set_trace(*names, **kwargs):
+    # Switch tracing on for function or module names
+    # eg. set_trace("process_subseg", "cms_custom") or set_trace("*")
+    # set_trace(name, on=False) switches it off again
+    # Configure logging (eg. logging.basicConfig()) to see the output
+
+    on = kwargs.get("on", True)
+
+    for name in names:
+        if on:
+            TRACE.add(name)
+        else:
+            TRACE.discard(name)
+
+    if TRACE:
+        trace_log.setLevel(logging.DEBUG)
+    else:
+        trace_log.setLevel(logging.NOTSET)
+
+    return TRACE
+
+
 def setup_header(ln_ctrl, wrk_ln_dict):
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
     wrk_add_dict = {}
     segment_name = ln_ctrl["name"]
@@ -1542,7 +2021,7 @@ def setup_header(ln_ctrl, wrk_ln_dict):
                 wrk_add_dict[segment_name] = segment_prefill(ln_ctrl,
                     {})
         else:
-            wrk_add_dict[segment_name] = wrk_ln_dict["line"]
+            wrk_add_dict[segment_name] = wrk_ln_dict.line
 
     if DBUG:
         do_DBUG("Assigning Header========================",
@@ -1570,22 +2049,89 @@ def split_k_v(l):
     return k, v
 
 
+def split_line(l):
+    # Split a line once in to k, v and kv
+    # kv = True if the line has a ":"
+    # k = headlessCamel of the text before the first ":" (the whole
+    #     line if there is no ":"). "" if there is nothing to camel
+    # v = the text after the first ":" with any later ":" kept,
+    #     stripped. "" if there is no ":"
+    # This is what assign_key_value and update_match used to work out
+    # each time they saw the line
+
+    name, sep, value = l.partition(":")
+
+    try:
+        k = headlessCamel(name)
+    except IndexError:
+        k = ""
+
+    # keys repeat on every claim so share one copy of each
+    if type(k) is str:
+        k = intern(k)
+
+    if sep:
+        return k, value.strip(), True
+
+    return k, "", False
+
+
+def strptime_date(d):
+    # The strptime version of parse_date (d already stripped)
+    # Used when fast_date says no and to check fast_date is the same
+
+    date_value = datetime.strptime(d, "%m/%d/%Y")
+    return date_value.strftime("%Y%m%d")
+
+
+def strptime_time(t):
+    # The strptime version of parse_time (t already stripped)
+
+    time_value = datetime.strptime(t, "%m/%d/%Y %I:%M %p")
+    return time_value.strftime("%Y%m%d%H%M%S+0500")
+
+
 def to_json(items):
     """
     to_json
     pretty json format with indent = 4
     """
-    itemsjson = json.dumps(items, indent=4)
+    itemsjson = json.dumps(items, indent=4, default=to_json_default)
     return itemsjson
 
 
+def to_json_default(o):
+    # Let to_json write objects that have a to_dict() (eg. CMSLine) or
+    # a to_list() (eg. cms_claims.LazyClaims)
+
+    if hasattr(o, "to_dict"):
+        return o.to_dict()
+    if hasattr(o, "to_list"):
+        return o.to_list()
+    raise TypeError(repr(o) + " is not JSON serializable")
+
+
+def trace_on():
+    # True if tracing is on for the calling function or its module
+    # Called as DBUG = TRACE and trace_on() so this only runs when
+    # something is being traced
+
+    if "*" in TRACE:
+        return True
+
+    caller = sys._getframe(1)
+    module = caller.f_globals.get("__name__", "").rsplit(".", 1)[-1]
+
+    return caller.f_code.co_name in TRACE or module in TRACE
+
+
 def update_match(lvl, txt, match_ln):
     # Update the match_ln list
     # lvl = number position in match_ln
     # txt = line to check (received in headlessCamel format)
     # match_ln = list
 
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
     line = txt.split(":")
     if len(line) > 1:
@@ -1609,7 +2155,7 @@ def update_match(lvl, txt, match_ln):
 def update_save_to(target, src, key, val_fld):
     # Test the target and update with source
 
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
     target_type = check_type(target)
     save_to = target
@@ -1650,12 +2196,25 @@ def update_save_to(target, src, key, val_fld):
     return save_to
 
 
+def valid_date(month, day, year):
+    # True if month/day/year is a real date in or after 1900
+
+    if year < 1900 or month < 1 or month > 12 or day < 1:
+        return False
+
+    if month == 2 and (year % 4 == 0 and
+                       (year % 100 != 0 or year % 400 == 0)):
+        return day <= 29
+
+    return day <= DAYS_IN_MONTH[month]
+
+
 def write_comment(wrk_add_dict, kvs):
     # if value is assigned to comments we need to check
     # if comments already present
     # if so, add to the list
 
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
     if DBUG:
         do_DBUG("IN WRITE COMMENTS", "wrk_add_dict:",
@@ -1670,7 +2229,7 @@ def write_comment(wrk_add_dict, kvs):
     else:
         if isinstance(wrk_add_dict[kvs["k"]], basestring):
             tmp_comment = wrk_add_dict[kvs["k"]]
-            print "tmp_comment:", tmp_comment
+            trace_log.debug("tmp_comment: %s", tmp_comment)
             # get the comment
             wrk_add_dict[kvs["k"]] = []
             # initialize the list
@@ -1693,7 +2252,7 @@ def write_comment(wrk_add_dict, kvs):
 def write_proc_dl(kvs, process_dict, process_list):
     # standardize the update of Process_dict and process_list
 
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
     # Write source and comments to the dict
     if len(process_dict) < 1:
@@ -1742,7 +2301,7 @@ def write_save_to(save_to, pd):
     :param pd:
     :return:
     """
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
     if DBUG:
         do_DBUG("pd:", pd)
@@ -1765,7 +2324,7 @@ def write_save_to(save_to, pd):
 def write_segment(itm, sgmnt, sgmnt_dict, ln_list, multi):
     # Write the segment to items dict
 
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
     if DBUG:
         do_DBUG("Item:", itm, "Writing Segment:", sgmnt,
@@ -1785,7 +2344,7 @@ def write_segment(itm, sgmnt, sgmnt_dict, ln_list, multi):
 def write_source(kvs, dt):
     # Write source and comments to dt
 
-    DBUG = False
+    DBUG = TRACE and trace_on()
 
     if DBUG:
         do_DBUG("kvs:", kvs)
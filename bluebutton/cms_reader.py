@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+"""
+python-bluebutton
+FILE: cms_reader
+Created: 10/18/16 5:05 PM
+
+Memory mapped line reader for CMS BlueButton text files
+
+The file is mmap'd and NumPy finds every newline, the end of each line
+after rstrip(), the blank lines and the divider lines in a few
+vectorized passes over the bytes. Lines are then sliced out of the map
+as they are asked for.
+
+NumPy is optional. Without it open_lines(inPath, "mmap") hands back
+the plain file.
+
+"""
+__author__ = 'Mark Scrimshire:@ekivemark'
+
+import mmap
+
+from six.moves import zip
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from cms_parser_utilities import TRACE, trace_on, do_DBUG
+
+DIVIDER = "----------"
+CLAIM_NUMBER = "CLAIM NUMBER"
+
+# bytes str.rstrip() removes: \t \n \v \f \r and space
+WHITESPACE = (9, 10, 11, 12, 13, 32)
+
+READERS = ("file", "mmap")
+
+
+def open_lines(inPath, reader="file", skip_blank=False, mode='r'):
+    # Open inPath for reading line by line
+    # reader = "file": the file object, opened with mode
+    # reader = "mmap": a MappedLines (the file object if there is no
+    #          NumPy)
+    # skip_blank = MappedLines only: leave out blank lines and hand
+    #          out each line already rstrip()'d. For cms_line_iter,
+    #          which skips and strips them itself anyway
+    # Use in a with statement either way
+
+    if reader not in READERS:
+        raise ValueError("reader must be one of %s" % (READERS,))
+
+    if reader == "mmap" and numpy is not None:
+        return MappedLines(inPath, skip_blank)
+
+    return open(inPath, mode)
+
+
+def line_index(buf, size):
+    # Vectorized index of the lines in buf (a NumPy uint8 array)
+    # Returns a dict of arrays with one entry per line:
+    # start = offset of the first byte
+    # next = offset of the next line (end including the newline)
+    # end = offset after rstrip()
+    # blank = True if the line is empty after rstrip()
+    # divider = True if the line holds a DIVIDER
+
+    newlines = numpy.flatnonzero(buf == 10)
+    start = numpy.concatenate(([0], newlines + 1))
+    nxt = numpy.concatenate((newlines + 1, [size]))
+    if len(start) and start[-1] == size:
+        # the file ends with a newline. No line after it
+        start = start[:-1]
+        nxt = nxt[:-1]
+
+    # rstrip: step every line end back over whitespace. Only lines
+    # still ending in whitespace take part in the next step so this
+    # runs as many times as the longest run of trailing whitespace
+    end = nxt.copy()
+    active = numpy.flatnonzero(end > start)
+    while len(active):
+        last = buf[end[active] - 1]
+        is_ws = numpy.zeros(len(active), dtype=bool)
+        for c in WHITESPACE:
+            is_ws |= last == c
+        active = active[is_ws]
+        end[active] -= 1
+        active = active[end[active] > start[active]]
+
+    blank = end == start
+
+    # divider lines: runs of at least len(DIVIDER) dashes
+    # A run starts at a dash that does not follow a dash. Working on
+    # the dash offsets keeps this to the (few) dashes in the file
+    dashes = numpy.flatnonzero(buf == ord("-"))
+    first = numpy.flatnonzero(numpy.diff(dashes) != 1) + 1
+    first = numpy.concatenate((numpy.zeros(1 if len(dashes) else 0,
+                                           dtype=first.dtype), first))
+    length = numpy.diff(numpy.append(first, len(dashes)))
+    runs = dashes[first[length >= len(DIVIDER)]]
+    divider = numpy.zeros(len(start), dtype=bool)
+    divider[numpy.searchsorted(start, runs, "right") - 1] = True
+
+    return {"start": start, "next": nxt, "end": end,
+            "blank": blank, "divider": divider}
+
+
+def find_lines(buf, start, text):
+    # Line numbers of the lines that contain text (upper case ASCII)
+    # ignoring case, as "text in l.upper()" would. Vectorized search
+    # over the buffer. start = line start offsets from line_index
+
+    n = len(text)
+    if len(buf) < n:
+        return numpy.zeros(0, dtype=numpy.intp)
+
+    # Start from every place the first letter is, in either case, and
+    # drop the ones where the following letters do not match
+    # (upper case ASCII letters only, same as str.upper())
+    head = buf[:len(buf) - n + 1]
+    hits = numpy.flatnonzero((head == ord(text[0])) |
+                             (head == ord(text[0].lower())))
+    for i in range(1, n):
+        c = buf[hits + i]
+        hits = hits[(c == ord(text[i])) | (c == ord(text[i].lower()))]
+
+    return numpy.unique(numpy.searchsorted(start, hits, "right") - 1)
+
+
+class MappedLines(object):
+    # Line reader over an mmap of inPath
+    # for l in MappedLines(path) gives the same lines as the file
+    # object (newline included). With skip_blank=True blank lines are
+    # left out and each line comes back rstrip()'d.
+    # index = the line_index() arrays. Call close() (or use a with
+    # statement) to release the map.
+
+    def __init__(self, inPath, skip_blank=False):
+        DBUG = TRACE and trace_on()
+
+        self.skip_blank = skip_blank
+        self.f = open(inPath, 'rb')
+        self.f.seek(0, 2)
+        self.size = self.f.tell()
+        self.f.seek(0)
+
+        if self.size:
+            self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+            buf = numpy.frombuffer(self.mm, dtype=numpy.uint8)
+            self.index = line_index(buf, self.size)
+            del buf
+        else:
+            # mmap will not map an empty file
+            self.mm = None
+            empty = numpy.zeros(0, dtype=numpy.intp)
+            self.index = {"start": empty, "next": empty, "end": empty,
+                          "blank": numpy.zeros(0, dtype=bool),
+                          "divider": numpy.zeros(0, dtype=bool)}
+
+        if DBUG:
+            do_DBUG("inPath:", inPath, "bytes:", self.size,
+                    "lines:", len(self.index["start"]),
+                    "dividers:", int(self.index["divider"].sum()))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        return self.lines()
+
+    def __len__(self):
+        return len(self.index["start"])
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        self.f.close()
+
+    def line(self, n):
+        # line n after rstrip()
+        start = int(self.index["start"][n])
+        return self.mm[start:int(self.index["end"][n])]
+
+    def offset(self, n):
+        # byte offset of line n
+        return int(self.index["start"][n])
+
+    def lines(self):
+        mm = self.mm
+        if self.skip_blank:
+            keep = ~self.index["blank"]
+            ends = self.index["end"][keep].tolist()
+            starts = self.index["start"][keep].tolist()
+        else:
+            ends = self.index["next"].tolist()
+            starts = self.index["start"].tolist()
+
+        for s, e in zip(starts, ends):
+            yield mm[s:e]
+
+    def divider_lines(self):
+        # Line numbers of the divider lines
+        return numpy.flatnonzero(self.index["divider"])
+
+    def find(self, text):
+        # Line numbers of the lines with text in l.upper()
+        if not self.size:
+            return numpy.zeros(0, dtype=numpy.intp)
+        buf = numpy.frombuffer(self.mm, dtype=numpy.uint8)
+        found = find_lines(buf, self.index["start"], text)
+        del buf
+        return found
+
+    def title_lines(self):
+        # The first non blank line after each divider line
+        # (where cms_line_iter looks for a section title)
+        nonblank = numpy.flatnonzero(~self.index["blank"])
+        after = numpy.searchsorted(nonblank, self.divider_lines(), "right")
+        return numpy.unique(nonblank[after[after < len(nonblank)]])
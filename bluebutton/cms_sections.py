@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+"""
+python-bluebutton
+FILE: cms_sections
+Created: 10/18/16 4:20 PM
+
+Parse only some sections of a CMS BlueButton file
+
+cms_section_index() scans the divider and title lines for the byte
+offset of each section. cms_section_parse() then seeks to the sections
+asked for and runs them through parse_lines(), so asking for "patient"
+does not parse the claims.
+
+"""
+__author__ = 'Mark Scrimshire:@ekivemark'
+
+import collections
+import os
+
+from cms_parser import (cms_line_iter, parse_lines, divider,
+                        CMSLineWindow)
+from cms_parser_utilities import headlessCamel, lookup_segment
+from cms_reader import (open_lines, numpy, MappedLines, CLAIM_NUMBER)
+
+# Title written after a section that is not the last in the file.
+# parse_lines() needs to see a header to end the section it is in.
+# This one is not in SEG_DEF so nothing is written for it.
+END_TITLE = "END OF SECTION"
+
+
+def cms_section_index(inPath, reader="file"):
+    # Scan inPath for the start of each top level section
+    # Returns a list with one dict per section in file order:
+    # title = title line (None for anything before the first title)
+    # name = out_dict key parse_lines writes it to (None if the title
+    #        is not in SEG_DEF)
+    # start, end = byte offsets. start is the divider before the title
+    # claimNumber = claim number cms_line_iter has at start
+    #               (None if there has not been one)
+    # claimHeaders = [offset, claimNumber] for each untitled claim
+    #                header (divider, blank, divider) in the section.
+    #                cms_parallel splits the claims on these
+    # reader = "mmap" only looks at the divider, title and claim number
+    #          lines that cms_reader finds with NumPy (see scan_lines)
+
+    # The title, divider and claim number handling follows
+    # cms_line_iter. A section ends at the next title that parse_lines
+    # treats as level 0. Claim headers, "Claim Lines for Claim Number"
+    # and titles with a deeper SEG_DEF level (eg. Employer Subsidy
+    # inside Plans) stay in the section they are in.
+
+    sections = []
+    section = index_entry(None, None, 0, None)
+
+    line_type = "BODY"
+    get_title = False
+    divider_at = 0
+    claim_number = None
+
+    for here, l in scan_lines(inPath, reader):
+        if len(l) < 1:
+            continue
+
+        if line_type == "BODY" and (divider in l):
+            line_type = "HEADER"
+            get_title = True
+            divider_at = here
+
+        elif line_type == "HEADER" and get_title:
+            if divider in l:
+                # untitled claim header
+                line_type = "BODY"
+                section["claimHeaders"].append([divider_at, claim_number])
+                continue
+
+            get_title = False
+            tl, sep, rest = l.partition(":")
+            tl = tl.rstrip()
+            if "CLAIM LINES FOR CLAIM NUMBER" in l.upper():
+                if sep:
+                    claim_number = rest.strip()
+                continue
+
+            ln_ctrl = lookup_segment(headlessCamel(tl), True)
+            if ln_ctrl is not None and ln_ctrl["level"] != 0:
+                continue
+
+            section["end"] = divider_at
+            sections.append(section)
+            name = None
+            if ln_ctrl is not None:
+                name = ln_ctrl["name"]
+            section = index_entry(tl, name, divider_at, claim_number)
+
+        elif line_type == "HEADER":
+            if divider in l:
+                # closing divider
+                line_type = "BODY"
+
+        elif "CLAIM NUMBER" in l.upper():
+            label, sep, value = l.partition(":")
+            if sep:
+                claim_number = value.strip()
+
+    section["end"] = os.path.getsize(inPath)
+    sections.append(section)
+
+    return [s for s in sections if s["end"] > s["start"]]
+
+
+def scan_lines(inPath, reader="file"):
+    # (byte offset, rstrip()'d line) for the lines of inPath that
+    # cms_section_index needs to see
+    # "file" reads every line. "mmap" only hands out the divider lines,
+    # the line after each divider and lines with CLAIM NUMBER in them.
+    # Other lines never change what cms_section_index records
+
+    with open_lines(inPath, reader, mode='rb') as lines:
+        if isinstance(lines, MappedLines):
+            wanted = numpy.union1d(numpy.union1d(lines.divider_lines(),
+                                                 lines.title_lines()),
+                                   lines.find(CLAIM_NUMBER))
+            for n in wanted.tolist():
+                yield lines.offset(n), lines.line(n)
+        else:
+            pos = 0
+            for l in lines:
+                yield pos, l.rstrip()
+                pos += len(l)
+
+
+def index_entry(title, name, start, claim_number):
+    # One cms_section_index() entry. "end" is added when the next
+    # section is found
+
+    return collections.OrderedDict([("title", title),
+                                    ("name", name),
+                                    ("start", start),
+                                    ("claimNumber", claim_number),
+                                    ("claimHeaders", [])])
+
+
+def section_title(ln):
+    # For a CMSLine that starts a top level section: its SEG_DEF entry
+    # (None if the title is not in SEG_DEF). False for any other line
+    # Same test as cms_section_index makes on the title text
+
+    if ln.type != "HEADER" or ln.level != 0 or ln.line is None:
+        return False
+    ln_ctrl = lookup_segment(headlessCamel(ln.line), True)
+    if ln_ctrl is not None and ln_ctrl["level"] != 0:
+        return False
+    return ln_ctrl
+
+
+def cms_section_lines(f, section, size):
+    # Lines of one section from the open file f
+    # size = file size. Adds an END_TITLE header after any section
+    # that did not run to the end of the file
+
+    for l in range_lines(f, section["start"], section["end"]):
+        yield l
+
+    if section["end"] < size:
+        yield divider + "\n"
+        yield END_TITLE + "\n"
+        yield divider + "\n"
+
+
+def range_lines(f, start, end):
+    # Lines of the open file f from byte offset start up to end
+
+    f.seek(start)
+    pos = start
+    while pos < end:
+        l = f.readline()
+        if not l:
+            break
+        pos += len(l)
+        yield l
+
+
+def cms_section_names(index):
+    # The out_dict keys in index, in the order a full parse writes them
+
+    names = []
+    for section in index:
+        if section["name"] is not None and section["name"] not in names:
+            names.append(section["name"])
+    return names
+
+
+def last_sections(index, names=None):
+    # The last section in index written to each out_dict key in names
+    # (every key if names is None), keyed by name
+
+    if names is None:
+        names = cms_section_names(index)
+
+    last = collections.OrderedDict()
+    for section in index:
+        if section["name"] in names:
+            last[section["name"]] = section
+    return last
+
+
+def cms_section_parse(inPath, names=None, index=None):
+    # Parse the sections of inPath that write to the out_dict keys in
+    # names (eg. ["patient", "medications", "claims"])
+    # names=None parses every section
+    # index = cms_section_index(inPath) if you already have it
+
+    # Returns an OrderedDict with the same keys, values and key order
+    # as cms_stream_parse(inPath) restricted to names.
+    # A title that repeats overwrites the earlier one in a full parse,
+    # so only the last section written to each key is parsed.
+
+    if index is None:
+        index = cms_section_index(inPath)
+
+    last = last_sections(index, names)
+
+    out_dict = collections.OrderedDict()
+    for name in cms_section_names(index):
+        if name in last:
+            out_dict[name] = None
+
+    size = os.path.getsize(inPath)
+    with open(inPath, 'rb') as f:
+        for section in sorted(last.values(), key=lambda s: s["start"]):
+            lines = cms_section_lines(f, section, size)
+            ln_list = CMSLineWindow(cms_line_iter(lines,
+                                                  section["claimNumber"]))
+            section_dict = parse_lines(ln_list)
+            if section["name"] in section_dict:
+                out_dict[section["name"]] = section_dict[section["name"]]
+            else:
+                del out_dict[section["name"]]
+
+    return out_dict
@@ -488,3 +488,75 @@ FLD_TRANSLATE = [{"input": "Emergency Contact",
                 {"input": "emergency_contact.Address Line 2",
                  "output": "line_2"},
                 ]
+
+# Field types for CMSParser(normalize=True). Keys are the field names
+# as they are written to the out_dict. The value is turned in to:
+# "currency" = int cents ("$1,234.56" -> 123456)
+# "count" = int ("  3" -> 3)
+# Values that do not fit (eg. "* Not Available *") are left as text
+FLD_TYPES = {"amountCharged": "currency",
+             "medicareApproved": "currency",
+             "providerPaid": "currency",
+             "youMayBeBilled": "currency",
+             "submittedAmountCharges": "currency",
+             "allowedAmount": "currency",
+             "non-Covered": "currency",
+             "lineNumber": "count",
+             "quantityBilledUnits": "count",
+             "fillNumber": "count",
+             "days'Supply": "count",
+             }
+
+# Labels and section titles found in the MyMedicare.gov download.
+# headlessCamel() works these out once at import (see CAMEL_TABLE in
+# cms_parser_utilities). Labels not listed here are still camel cased,
+# they just go through the LRU cache instead.
+CMS_LABELS = (
+    # Section titles
+    "MYMEDICARE.GOV PERSONAL HEALTH INFORMATION",
+    "**********CONFIDENTIAL***********",
+    "Demographic", "Emergency Contact", "Self Reported Medical Conditions",
+    "Self Reported Allergies", "Self Reported Implantable Device",
+    "Self Reported Immunizations", "Self Reported Labs and Tests",
+    "Self Reported Vital Statistics", "Family Medical History", "Drugs",
+    "Preventive Services", "Providers", "Pharmacies", "Plans",
+    "Employer Subsidy", "Primary Insurance", "Other Insurance",
+    "Claim Summary", "Claim Lines for Claim Number", "Part D Claims",
+    # Field labels
+    "Source", "Name", "Date of Birth", "DOB", "DOD", "Address Type",
+    "Address Line 1", "Address Line 2", "City", "State", "Zip",
+    "Phone Number", "Email", "Email Address", "Part A Effective Date",
+    "Part B Effective Date", "Contact Name", "Relationship", "Home Phone",
+    "Work Phone", "Mobile Phone", "Condition Name",
+    "Medical Condition Start Date", "Medical Condition End Date",
+    "Allergy Name", "Type", "Reaction", "Severity", "Diagnosed",
+    "Treatment", "First Episode Date", "Last Episode Date",
+    "Last Treatment Date", "Comments", "Device Name", "Date Implanted",
+    "Immunization Name", "Date Administered", "Method",
+    "Were you vaccinated in the US", "Booster 1 Date", "Booster 2 Date",
+    "Booster 3 Date",
+    "Test/Lab Type", "Date Taken", "Administered by", "Requesting Doctor",
+    "Reason Test/Lab Requested", "Results", "Vital Statistic Type",
+    "Date", "Time", "Reading/Value", "Family Member", "Age", "Drug Name",
+    "Supply", "Orig Drug Entry", "Description", "Last Date of Service",
+    "Next Eligible Date", "Provider Name", "Provider Address",
+    "Specialty", "Medicare Provider", "Pharmacy Name", "Plan Period",
+    "Contract ID/Plan ID", "Plan Name", "Marketing Name", "Plan Address",
+    "Plan Type", "Effective Date", "Termination Date", "Policy Number",
+    "Insurer Name", "Insurer Address", "MSP Type", "Claim Number",
+    "Provider", "Provider Billing Address", "Service Start Date",
+    "Service End Date", "Amount Charged", "Medicare Approved",
+    "Provider Paid", "You May be Billed", "Claim Type", "Diagnosis Code 1",
+    "Diagnosis Code 2", "Diagnosis Code 3", "Diagnosis Code 4",
+    "Diagnosis Code 5", "Line number", "Date of Service From",
+    "Date of Service To", "Procedure Code/Description",
+    "Modifier 1/Description", "Modifier 2/Description",
+    "Modifier 3/Description", "Modifier 4/Description",
+    "Quantity Billed/Units", "Submitted Amount/Charges", "Allowed Amount",
+    "Non-Covered", "Place of Service/Description",
+    "Type of Service/Description", "Rendering Provider No",
+    "Rendering Provider NPI", "Claim Service Date",
+    "Pharmacy Service Provider",
+    "Pharmacy Phone", "Drug Code", "Fill Number", "Days' Supply",
+    "Prescriber Identifer", "Prescriber Name", "Prescription Date",
+    )
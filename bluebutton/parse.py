@@ -4,6 +4,7 @@ convert bluebutton to json
 """
 
 import json
+import logging
 import re
 import os, sys
 from datetime import datetime, date, timedelta
@@ -11,11 +12,16 @@ from datetime import datetime, date, timedelta
 import collections
 
 from cms_parser import *
+from cms_reader import open_lines
 from file_def_cms import *
 
 #inPath="va_sample_file.txt"
 #OutPath="va_sample_file.json"
 
+# Per line diagnostics from the parsers are logged at DEBUG level
+# instead of printed. Nothing is written to the console by default
+parse_log = logging.getLogger("bluebutton.parse")
+
 sections=("MYMEDICARE.GOV PERSONAL HEALTH INFORMATION",
 "DEMOGRAPHIC",
 "MY HEALTHEVET PERSONAL HEALTH INFORMATION",
@@ -110,11 +116,11 @@ def age(dob):
         return today.year - dob.year
 
 
-def simple_parse(inPath):
+def simple_parse(inPath, reader="file"):
     line = []
     items = []
     generic_dict = collections.OrderedDict()
-    with open(inPath, 'r') as f:
+    with open_lines(inPath, reader) as f:
         for i, l in enumerate(f):
             generic_dict = {}
             line = l.split(":")
@@ -137,7 +143,7 @@ def simple_parse(inPath):
     return items
 
 
-def section_parse(inPath):
+def section_parse(inPath, reader="file"):
     # print "in Section Parse"
     line = []
     items = []
@@ -148,7 +154,7 @@ def section_parse(inPath):
     segment_dict = collections.OrderedDict()
     segment_source = ""
 
-    with open(inPath, 'r') as f:
+    with open_lines(inPath, reader) as f:
         for i, l in enumerate(f):
             generic_dict = {}
             # print "input: %s" % l
@@ -156,7 +162,7 @@ def section_parse(inPath):
             if len(line) > 1:
                 k = line[0]
                 v = line[1]
-                print "Line %s: %s" % (i, line)
+                parse_log.debug("Line %s: %s", i, line)
                 if v[0] == " ":
                     v = v.lstrip()
                 v = v.rstrip()
@@ -165,7 +171,7 @@ def section_parse(inPath):
                     v = segment_source
                 if current_segment == "header":
                     if k[2] == "/":
-                        print "got the date line"
+                        parse_log.debug("got the date line")
                         v = {"value": parse_time(l)}
                         k = "effectiveTime"
                 generic_dict[k] = v
@@ -191,9 +197,10 @@ def section_parse(inPath):
     f.close()
     return segments
 
-def bb_file_parse(inPath):
+def bb_file_parse(inPath, reader="file"):
     # Parse a CMS BlueButton
     # Using a redefined Parsing process
+    # reader = "file" or "mmap" (see cms_reader.open_lines)
 
     # Set default variables on entry
     k = " "
@@ -215,7 +222,7 @@ def bb_file_parse(inPath):
     line_dict = collections.OrderedDict()
 
     # Open the file for reading
-    with open(inPath, 'r') as f:
+    with open_lines(inPath, reader) as f:
 
         # get the line from the input file
         for i, l in enumerate(f):
@@ -245,7 +252,7 @@ def bb_file_parse(inPath):
                 # print "empty line %s[%s] - skipping to next line" % (i,l)
                 continue
 
-            print "Line [%s:%s]" % (i,l)
+            parse_log.debug("Line [%s:%s]", i, l)
             # From now on We are dealing with a non-blank line
             # Segment titles are wrapped by lines of minus signs (divider)
             # So let's check if we have found a divider
@@ -273,7 +280,8 @@ def bb_file_parse(inPath):
                         if i > 3:
                             # if close_segment is set we need to
                             # write the dict to items
-                            print "Write Hdr segment: %s" % current_segment
+                            parse_log.debug("Write Hdr segment: %s",
+                                            current_segment)
                             # print segment_dict
                             items[current_segment] = segment_dict
                             # reset the segment_dict
@@ -339,7 +347,8 @@ def bb_file_parse(inPath):
                 if k != seg_returned["name"]:
                     # check if the key = the section name
                     # If it does don't write key and value
-                    print "Adding to generic/segment-k=v:%s=%s" % (k, v)
+                    parse_log.debug("Adding to generic/segment-k=v:%s=%s",
+                                    k, v)
                     generic_dict[k] = v
                     segment_dict[k] = v
 
@@ -347,17 +356,17 @@ def bb_file_parse(inPath):
 
                 if seg_returned['end_match'] in k:
                     # We found the last line in a segment
-                    print "End Found: %s is in %s" % \
-                          (seg_returned['end_match'], k)
+                    parse_log.debug("End Found: %s is in %s",
+                                    seg_returned['end_match'], k)
                     close_segment = True
 
                 if close_segment:
                     # Update the source field in the segment
                     if current_segment != "header":
-                        print "source: %s" % segment_source
+                        parse_log.debug("source: %s", segment_source)
                         segment_dict["source"] = segment_source
                     # write the segment to items
-                    print "writing %s" % current_segment
+                    parse_log.debug("writing %s", current_segment)
                     items[current_segment] = segment_dict
                     segment_dict = collections.OrderedDict()
                     close_segment = False
@@ -417,15 +426,6 @@ def find_segment(title):
             break
     return result
 
-def parse_time(t):
-    # convert time to  json format
-    t = t.strip()
-    time_value = datetime.strptime(t, "%m/%d/%Y %I:%M %p")
-    # print time_value
-    return_value = time_value.strftime("%Y%m%d%H%M%S+0500")
-    # print return_value
-    return return_value
-
 def segment_prefill(seg):
     # Receive the Segment information for a header line
     # get the seg["prefill"] and iterate through the dict
@@ -535,7 +535,7 @@ def build_mds_readings(items):
             mdsdict.update(items[i])
             j = 0
             while not items[i+j].has_key('Prescription Number'):
-                print items[i+j]
+                parse_log.debug("%s", items[i+j])
                 j += 1
                 mdsdict.update(items[i+j])
                 mdsdictlist.append(mdsdict)
@@ -583,12 +583,96 @@ def build_simple_demographics_readings(items):
 
 def tojson(items):
     """tojson"""
-    itemsjson = json.dumps(items, indent=4)
+    itemsjson = json.dumps(items, indent=4, default=to_json_default)
     return itemsjson
 
 
-def write_file(write_dict,Outfile):
+def write_file(write_dict, Outfile, indent=4):
     f = open(Outfile, 'w')
-    f.write(tojson(write_dict))
+    write_json(write_dict, f, indent)
     f.close()
 
+
+def write_json(items, f, indent=4, stream_levels=2):
+    """
+    write_json
+    Stream items to the open file f as json without building the whole
+    json string in memory. The text is the same as json.dumps(items,
+    indent=indent). Use indent=None for compact output.
+
+    items can be a dict, a list or an iterator of (key, value) pairs.
+    Pairs are written in the order they are produced. The top level and
+    the lists or dicts inside it (eg. each claim in "claims") are
+    written one member at a time. Anything deeper is written with a
+    json.dumps call per member.
+    """
+    _write_json_value(items, f, indent, 0, stream_levels)
+
+
+def _write_json_value(value, f, indent, level, stream_levels):
+    # Write one json value at nesting level using the json.dumps layout
+
+    if level < stream_levels:
+        if isinstance(value, dict):
+            _write_json_members(value.iteritems(), True, f, indent, level,
+                                stream_levels)
+            return
+        elif isinstance(value, (list, tuple)) or hasattr(value, "to_list"):
+            # to_list: a list parsed as it is read (cms_claims.LazyClaims)
+            _write_json_members(iter(value), False, f, indent, level,
+                                stream_levels)
+            return
+        elif hasattr(value, "next"):
+            # an iterator of (key, value) pairs
+            _write_json_members(value, True, f, indent, level,
+                                stream_levels)
+            return
+
+    # to_json_default writes cms_model records as their to_dict()
+    text = json.dumps(value, indent=indent, default=to_json_default)
+    if indent is not None and level > 0:
+        # json.dumps starts from level 0. Strings are escaped so every
+        # newline belongs to the layout and can be re-indented
+        text = text.replace("\n", "\n" + (" " * (indent * level)))
+    f.write(text)
+
+
+def _write_json_members(members, is_dict, f, indent, level, stream_levels):
+    # Write the members of a json object (is_dict) or array
+
+    if is_dict:
+        open_char, close_char = "{", "}"
+    else:
+        open_char, close_char = "[", "]"
+
+    if indent is None:
+        newline = ""
+        closing = ""
+    else:
+        newline = "\n" + (" " * (indent * (level + 1)))
+        closing = "\n" + (" " * (indent * level))
+
+    first = True
+    for member in members:
+        if first:
+            f.write(open_char)
+            first = False
+        else:
+            f.write(", ")
+        f.write(newline)
+
+        if is_dict:
+            k, v = member
+            # let json turn non-string keys (eg. line numbers) in to
+            # strings the same way json.dumps does
+            f.write(json.dumps({k: None})[1:-len(": null}")] + ": ")
+        else:
+            v = member
+        _write_json_value(v, f, indent, level + 1, stream_levels)
+
+    if first:
+        # nothing written so this is an empty object or array
+        f.write(open_char + close_char)
+    else:
+        f.write(closing + close_char)
+
@@ -0,0 +1,51 @@
+"""
+python-bluebutton
+FILE: conftest
+
+pytest setup. The bluebutton modules import each other by module name
+(from cms_parser import ...) so the package directory goes on sys.path.
+
+"""
+__author__ = 'Mark Scrimshire:@ekivemark'
+
+import json
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "bluebutton"))
+
+from cms_generator import cms_generate
+from cms_parser_utilities import to_json_default
+
+SAMPLE = os.path.join(os.path.dirname(HERE), "BlueButtonText-2.txt")
+
+
+@pytest.fixture
+def sample():
+    # The MyMedicare.gov sample file that ships with the repo
+    return SAMPLE
+
+
+@pytest.fixture(scope="session")
+def partd_file(tmpdir_factory):
+    # A cms_generator file with Part D claims and more claims than the
+    # sample, so claim chunking and the Part D code paths get used
+    path = str(tmpdir_factory.mktemp("generated").join("partd.txt"))
+    cms_generate(path, seed=3, claims=12, part_d_claims=6)
+    return path
+
+
+@pytest.fixture(params=["sample", "partd"])
+def cms_file(request):
+    # Each test using this runs on the sample and on partd_file
+    if request.param == "sample":
+        return SAMPLE
+    return request.getfixturevalue("partd_file")
+
+
+def as_json(out_dict):
+    # out_dict as json, so comparisons check key order and types too
+    return json.dumps(out_dict, default=to_json_default)
@@ -0,0 +1,35 @@
+"""
+python-bluebutton
+FILE: test_camel
+
+"""
+__author__ = 'Mark Scrimshire:@ekivemark'
+
+from multiprocessing.pool import ThreadPool
+
+from cms_parser_utilities import (headlessCamel, camel_cache_clear,
+                                  camel_cache_info, camel_case)
+
+
+def test_headless_camel_matches_camel_case():
+    for label in ("Claim Number", "Amount Charged", "Not A Known Label",
+                  u"Unicode Label"):
+        assert headlessCamel(label) == camel_case(label)
+
+
+def test_camel_stats_from_threads():
+    camel_cache_clear()
+    labels = ["Claim Number", "Some Other Label %d"] * 500
+
+    def work(n):
+        for label in labels:
+            headlessCamel(label if "%" not in label else label % (n % 7))
+        return len(labels) / 2
+
+    calls = sum(ThreadPool(8).map(work, range(16)))
+    info = camel_cache_info()
+    # the LRU counts are kept under CAMEL_LOCK so they are exact
+    assert info["hits"] + info["misses"] == calls
+    assert info["misses"] == 7
+    # table hits are counted without the lock and may lose a few
+    assert 0 < info["table_hits"] <= calls
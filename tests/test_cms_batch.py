@@ -0,0 +1,50 @@
+"""
+python-bluebutton
+FILE: test_cms_batch
+
+"""
+__author__ = 'Mark Scrimshire:@ekivemark'
+
+import os
+import shutil
+
+import pytest
+
+from cms_batch import batch_jobs, cms_batch
+
+
+def test_batch_jobs_output_names():
+    jobs = batch_jobs(["in/a.txt", "in/b.txt"], "out")
+    assert [j[1] for j in jobs] == [os.path.join("out", "a.json"),
+                                    os.path.join("out", "b.json")]
+
+
+def test_batch_jobs_same_name_fails():
+    with pytest.raises(ValueError) as e:
+        batch_jobs(["a/claims.txt", "b/claims.txt"], "out")
+    assert "a/claims.txt" in str(e.value)
+    assert "b/claims.txt" in str(e.value)
+
+
+def test_cms_batch_in_process(sample, tmpdir):
+    indir = tmpdir.mkdir("in")
+    shutil.copy(sample, str(indir))
+    outdir = tmpdir.join("out")
+    summary = cms_batch(str(indir), str(outdir), workers=1)
+    assert summary["files"] == 1
+    assert summary["ok"] == 1
+    assert outdir.join("BlueButtonText-2.json").check()
+
+
+def test_cms_batch_cache(sample, tmpdir):
+    indir = tmpdir.mkdir("in")
+    shutil.copy(sample, str(indir))
+    cache_dir = str(tmpdir.join("cache"))
+    first = cms_batch(str(indir), str(tmpdir.join("out1")), workers=1,
+                      cache_dir=cache_dir)
+    second = cms_batch(str(indir), str(tmpdir.join("out2")), workers=1,
+                       cache_dir=cache_dir)
+    assert (first["cache_hits"], first["cache_misses"]) == (0, 1)
+    assert (second["cache_hits"], second["cache_misses"]) == (1, 0)
+    assert tmpdir.join("out1", "BlueButtonText-2.json").read() == \
+        tmpdir.join("out2", "BlueButtonText-2.json").read()
@@ -0,0 +1,77 @@
+"""
+python-bluebutton
+FILE: test_cms_cache
+
+"""
+__author__ = 'Mark Scrimshire:@ekivemark'
+
+import errno
+import json
+import os
+
+import cms_cache
+from cms_cache import ParseCache
+from cms_parser import cms_stream_parse
+
+
+def test_hit_matches_miss(sample, tmpdir):
+    cache = ParseCache(str(tmpdir))
+    miss = cache.parse(sample)
+    hit = cache.parse(sample)
+    assert cache.stats["misses"] == 1
+    assert cache.stats["hits"] == 1
+    assert cache.stats["writes"] == 1
+    assert json.dumps(hit) == json.dumps(miss)
+    assert json.dumps(hit) == json.dumps(cms_stream_parse(sample))
+
+
+def test_put_does_not_list_the_directory_every_time(tmpdir, monkeypatch):
+    cache = ParseCache(str(tmpdir))
+    scans = []
+    entries = cache.entries
+    monkeypatch.setattr(cache, "entries",
+                        lambda: scans.append(1) or entries())
+    for n in range(50):
+        cache.put("key%d" % n, {"n": n})
+    assert len(scans) == 1
+    assert cache.info()["entries"] == 50
+
+
+def test_evicts_least_recently_used(tmpdir):
+    cache = ParseCache(str(tmpdir), max_bytes=100)
+    for n in range(10):
+        cache.put("key%d" % n, {"value": "x" * 20})
+        # mtimes one second apart so the order is certain
+        os.utime(cache.path("key%d" % n), (n, n))
+    assert cache.info()["bytes"] <= 100
+    assert cache.get("key9") is not None
+    assert cache.get("key0") is None
+    assert cache.stats["evictions"] > 0
+
+
+def test_failed_write_does_not_fail_the_parse(sample, tmpdir, monkeypatch):
+    cache = ParseCache(str(tmpdir))
+
+    def disk_full(*args, **kwargs):
+        raise IOError(errno.ENOSPC, "No space left on device")
+
+    monkeypatch.setattr(cms_cache.json, "dump", disk_full)
+    out_dict = cache.parse(sample)
+    assert json.dumps(out_dict) == json.dumps(cms_stream_parse(sample))
+    assert cache.stats["errors"] == 1
+    assert cache.stats["writes"] == 0
+    # no entry and no temporary file left behind
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test_unwritable_directory_does_not_fail_the_parse(sample, tmpdir,
+                                                      monkeypatch):
+    cache = ParseCache(str(tmpdir))
+
+    def no_temp(*args, **kwargs):
+        raise OSError(errno.EACCES, "Permission denied")
+
+    monkeypatch.setattr(cms_cache.tempfile, "mkstemp", no_temp)
+    assert json.dumps(cache.parse(sample)) == \
+        json.dumps(cms_stream_parse(sample))
+    assert cache.stats["errors"] == 1
@@ -0,0 +1,52 @@
+"""
+python-bluebutton
+FILE: test_cms_claims
+
+"""
+__author__ = 'Mark Scrimshire:@ekivemark'
+
+from conftest import as_json
+import cms_claims
+from cms_claims import cms_lazy_parse, cms_claim
+from cms_parser import cms_stream_parse
+from cms_parser_utilities import to_json
+from parse import tojson
+
+
+def test_lazy_parse_matches_stream_parse(cms_file):
+    full = cms_stream_parse(cms_file)
+    lazy = cms_lazy_parse(cms_file)
+    assert as_json(lazy) == as_json(full)
+    assert list(lazy.keys()) == list(full.keys())
+    assert len(lazy["claims"]) == len(full["claims"])
+    assert lazy["claims"].to_list() == full["claims"]
+    # backwards, so the later claims are parsed before the first
+    claims = lazy["claims"]
+    for n in reversed(range(len(claims))):
+        assert claims[n] == full["claims"][n]
+
+
+def test_lazy_claims_serialize(sample):
+    full = cms_stream_parse(sample)
+    lazy = cms_lazy_parse(sample)
+    assert to_json(lazy) == to_json(full)
+    assert tojson(lazy) == tojson(full)
+
+
+def test_lazy_claims_work_out_skip_once(sample, monkeypatch):
+    calls = []
+    head_skip = cms_claims.head_skip
+    monkeypatch.setattr(cms_claims, "head_skip",
+                        lambda *args: calls.append(1) or head_skip(*args))
+    claims = cms_lazy_parse(sample)["claims"]
+    claims.to_list()
+    assert len(calls) == 1
+
+
+def test_claim_by_number(cms_file):
+    full = cms_stream_parse(cms_file)
+    for claim in full["claims"]:
+        if "claimNumber" in claim and "claim" in claim:
+            assert cms_claim(cms_file, claim["claimNumber"]) == claim
+    assert cms_claim(cms_file, "no such claim") is None
+
@@ -0,0 +1,128 @@
+"""
+python-bluebutton
+FILE: test_cms_events
+
+"""
+__author__ = 'Mark Scrimshire:@ekivemark'
+
+from cms_events import CMSHandler, SECTION_KEYS, cms_events
+from cms_parser import cms_stream_parse
+
+# Sections the out_dict keeps as one entry per item in the file
+LIST_SECTIONS = ("emergencyContact", "medicalConditions", "Allergies",
+                 "ImplantableDevices", "vitals", "medications",
+                 "preventiveServices", "providers", "pharmacies")
+
+
+class Recorder(CMSHandler):
+    # Checks the start/end calls pair up as they arrive and keeps
+    # what the tests look at
+
+    def __init__(self):
+        self.documents = 0
+        self.open = []
+        self.sections = []
+        self.claims = []
+        self.items = []
+        self.fields = []
+
+    def start_document(self, inPath):
+        assert self.open == []
+        self.documents += 1
+
+    def end_document(self):
+        assert self.open == []
+
+    def start_section(self, name, title):
+        assert self.open == []
+        self.open.append(("section", name))
+        self.sections.append(name)
+
+    def end_section(self, name):
+        assert self.open == [("section", name)]
+        self.open.pop()
+
+    def start_claim(self, claim_number, kind):
+        assert self.open == [("section", "claims")]
+        assert kind in ("claim", "partDClaim")
+        self.open.append(("claim", claim_number, kind))
+        self.claims.append([claim_number, kind, 0])
+
+    def end_claim(self, claim_number, kind):
+        assert self.open[-1] == ("claim", claim_number, kind)
+        self.open.pop()
+
+    def start_item(self, path):
+        assert self.open[-1][0] in ("section", "claim")
+        assert path[0] == self.open[0][1]
+        self.open.append(("item", path))
+        self.items.append(path)
+        if self.open[-2][0] == "claim":
+            assert path == ("claims", self.open[-2][2], "details")
+            self.claims[-1][2] += 1
+
+    def end_item(self, path):
+        assert self.open[-1] == ("item", path)
+        self.open.pop()
+
+    def field(self, key, value, path):
+        assert self.open
+        assert path[0] == self.open[0][1]
+        self.fields.append((key, value, path, self.open[-1][0]))
+
+
+def test_events_pair_up(cms_file):
+    handler = cms_events(cms_file, Recorder())
+    assert handler.documents == 1
+    assert handler.open == []
+    assert handler.sections == list(cms_stream_parse(cms_file))
+
+
+def test_claims_match_stream_parse(cms_file):
+    handler = cms_events(cms_file, Recorder())
+    claims = cms_stream_parse(cms_file)["claims"]
+    assert [c[0] for c in handler.claims] == \
+        [c["claimNumber"] for c in claims]
+    assert [c[1] == "partDClaim" for c in handler.claims] == \
+        ["partDClaim" in c for c in claims]
+
+
+def test_claim_lines_match_stream_parse(partd_file):
+    handler = cms_events(partd_file, Recorder())
+    claims = cms_stream_parse(partd_file)["claims"]
+    assert len([c for c in handler.claims if c[1] == "partDClaim"]) == 6
+    assert [c[2] for c in handler.claims] == \
+        [len(c.get("details", [])) for c in claims]
+
+
+def test_claim_with_no_header(sample):
+    # see the cms_events docstring: the last claim of the sample has no
+    # claim header, so its line is a second item of the claim before
+    handler = cms_events(sample, Recorder())
+    claims = cms_stream_parse(sample)["claims"]
+    lines = [c[2] for c in handler.claims]
+    details = [len(c.get("details", [])) for c in claims]
+    assert lines[:-1] == details[:-1]
+    assert (lines[-1], details[-1]) == (2, 1)
+
+
+def test_list_items_match_stream_parse(cms_file):
+    handler = cms_events(cms_file, Recorder())
+    out_dict = cms_stream_parse(cms_file)
+    for name in LIST_SECTIONS:
+        assert handler.items.count((name,)) == len(out_dict[name]), name
+    drugs = [v for k, v, path, inside in handler.fields
+             if path == ("medications",) and k == "drugName"]
+    assert drugs == [d["drugName"] for d in out_dict["medications"]]
+
+
+def test_source_and_category_belong_to_the_section(cms_file):
+    handler = cms_events(cms_file, Recorder())
+    fields = [f for f in handler.fields if f[0] in SECTION_KEYS]
+    assert fields
+    for key, value, path, inside in fields:
+        # never in an item or claim line. A group (eg. Employer Subsidy
+        # in insurance) can have its own
+        assert inside != "item"
+        assert "details" not in path
+    assert ("source", "MyMedicare.gov", ("claims",), "section") in fields
@@ -0,0 +1,55 @@
+"""
+python-bluebutton
+FILE: test_cms_feed
+
+"""
+__author__ = 'Mark Scrimshire:@ekivemark'
+
+import pytest
+
+from conftest import as_json
+from cms_feed import CMSFeedParser
+from cms_model import to_dict
+from cms_parser import cms_stream_parse
+
+
+def feed_file(inPath, size, parser=None):
+    # inPath fed to a CMSFeedParser size bytes at a time
+    if parser is None:
+        parser = CMSFeedParser()
+    with open(inPath, 'rb') as f:
+        data = f.read()
+    for n in range(0, len(data), size):
+        parser.feed(data[n:n + size])
+    return parser.close()
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 4096])
+def test_feed_matches_stream_parse(cms_file, size):
+    assert as_json(feed_file(cms_file, size)) == \
+        as_json(cms_stream_parse(cms_file))
+
+
+@pytest.mark.parametrize("size", [3, 4096])
+def test_feed_model(cms_file, size):
+    out_dict = feed_file(cms_file, size, CMSFeedParser(model=True))
+    assert as_json(to_dict(out_dict)) == \
+        as_json(cms_stream_parse(cms_file))
+
+
+def test_no_newline_at_the_end(partd_file, tmpdir):
+    path = tmpdir.join("no_newline.txt")
+    with open(partd_file, 'rb') as f:
+        path.write(f.read().rstrip())
+    assert as_json(feed_file(str(path), 64)) == \
+        as_json(cms_stream_parse(str(path)))
+
+
+def test_feed_after_close():
+    parser = CMSFeedParser()
+    parser.feed("")
+    out_dict = parser.close()
+    assert list(out_dict.keys()) == []
+    assert parser.close() is out_dict
+    with pytest.raises(ValueError):
+        parser.feed("more")
@@ -0,0 +1,71 @@
+"""
+python-bluebutton
+FILE: test_cms_incremental
+
+"""
+__author__ = 'Mark Scrimshire:@ekivemark'
+
+import shutil
+
+from conftest import as_json
+from cms_incremental import cms_incremental_parse, load_state, save_state
+from cms_parser import cms_stream_parse
+
+
+def test_first_and_second_run(cms_file):
+    full = as_json(cms_stream_parse(cms_file))
+    out_dict, state, report = cms_incremental_parse(cms_file,
+                                                    chunk_claims=2)
+    assert as_json(out_dict) == full
+    assert not any(r["reused"] for r in report)
+
+    out_dict, state, report = cms_incremental_parse(cms_file, state,
+                                                    chunk_claims=2)
+    assert as_json(out_dict) == full
+    assert all(r["reused"] for r in report)
+
+
+def test_changing_the_result_does_not_change_state(cms_file):
+    full = as_json(cms_stream_parse(cms_file))
+    out_dict, state, report = cms_incremental_parse(cms_file,
+                                                    chunk_claims=2)
+    for n in range(2):
+        out_dict["patient"]["name"] = "MUTATED"
+        out_dict["claims"][0]["claimNumber"] = "MUTATED"
+        out_dict["claims"][-1]["claimNumber"] = "MUTATED"
+        out_dict["claims"].append({})
+        out_dict, state, report = cms_incremental_parse(cms_file, state,
+                                                        chunk_claims=2)
+        assert all(r["reused"] for r in report)
+        assert as_json(out_dict) == full
+
+
+def test_partly_changed_file(partd_file, tmpdir):
+    path = str(tmpdir.join("download.txt"))
+    shutil.copy(partd_file, path)
+    out_dict, state, report = cms_incremental_parse(path, chunk_claims=2)
+
+    with open(path, 'rb') as f:
+        text = f.read()
+    # the same length, so only the medications piece changes
+    with open(path, 'wb') as f:
+        f.write(text.replace("Drug Name: ", "Drug Name: X", 1)
+                .replace("Drug Name: X", "Drug Name:X", 1))
+
+    out_dict, state, report = cms_incremental_parse(path, state,
+                                                    chunk_claims=2)
+    assert as_json(out_dict) == as_json(cms_stream_parse(path))
+    changed = [r["name"] for r in report if not r["reused"]]
+    assert changed == ["medications"]
+    assert len(report) > 2
+
+
+def test_state_file(sample, tmpdir):
+    statePath = str(tmpdir.join("state.json"))
+    assert load_state(statePath) is None
+    out_dict, state, report = cms_incremental_parse(sample)
+    save_state(state, statePath)
+    out_dict, state, report = cms_incremental_parse(sample,
+                                                    load_state(statePath))
+    assert all(r["reused"] for r in report)
+    assert as_json(out_dict) == as_json(cms_stream_parse(sample))
@@ -0,0 +1,99 @@
+"""
+python-bluebutton
+FILE: test_cms_model
+
+"""
+__author__ = 'Mark Scrimshire:@ekivemark'
+
+import collections
+import os
+
+import pytest
+
+from conftest import as_json
+from cms_benchmark import model_memory
+from cms_model import (Address, Claim, ClaimLine, Drug, PartDClaim,
+                       Values, cms_model_parse, to_dict, to_model)
+from cms_parser import cms_stream_parse
+
+
+def test_round_trip(cms_file):
+    full = as_json(cms_stream_parse(cms_file))
+    assert as_json(to_dict(cms_model_parse(cms_file))) == full
+    assert as_json(to_dict(to_model(cms_stream_parse(cms_file)))) == full
+
+
+def test_record_lookups(partd_file):
+    plain = cms_stream_parse(partd_file)
+    model = cms_model_parse(partd_file)
+    assert model["claims"] == plain["claims"]
+
+    for record, entry in zip(model["claims"], plain["claims"]):
+        assert record.keys() == list(entry.keys())
+        for key, value in entry.items():
+            assert key in record
+            assert record[key] == value
+            assert record.get(key) == value
+        assert "noSuchKey" not in record
+        assert record.get("noSuchKey", "default") == "default"
+        with pytest.raises(KeyError):
+            record["noSuchKey"]
+
+    claim = model["claims"][1]
+    assert isinstance(claim, Claim)
+    assert claim.claimNumber == plain["claims"][1]["claimNumber"]
+    assert isinstance(claim.charges, Values)
+    assert claim.charges["amountCharged"] == \
+        plain["claims"][1]["charges"]["amountCharged"]
+    assert claim.charges.get("noSuchCharge") is None
+    assert isinstance(model["medications"][0], Drug)
+    assert model["medications"][0].drugName == \
+        plain["medications"][0]["drugName"]
+
+
+def test_renamed_fields(partd_file):
+    plain = cms_stream_parse(partd_file)["claims"]
+    model = cms_model_parse(partd_file)["claims"]
+    lines = [(r, e) for r, e in zip(model, plain) if "details" in e]
+    line, entry = lines[0][0].details[0], lines[0][1]["details"][0]
+    assert isinstance(line, ClaimLine)
+    assert line.nonCovered == entry["non-Covered"]
+    assert line["non-Covered"] == entry["non-Covered"]
+
+    part_d = [(r, e) for r, e in zip(model, plain) if "partDClaim" in e]
+    assert part_d
+    for record, entry in part_d:
+        assert isinstance(record, PartDClaim)
+        assert record.daysSupply == entry["days'Supply"]
+
+
+def test_keys_with_no_field_go_in_extra():
+    entry = collections.OrderedDict([("claimNumber", "1"),
+                                     ("diagnosisCode5", "9593"),
+                                     ("claimType", "PartB")])
+    claim = Claim.from_dict(entry)
+    assert claim.extra == {"diagnosisCode5": "9593"}
+    assert claim["diagnosisCode5"] == "9593"
+    assert claim.claimType == "PartB"
+    assert claim.to_dict() == entry
+    assert list(claim.to_dict().keys()) == list(entry.keys())
+    # records with the same keys share one layout tuple
+    assert Claim.from_dict(entry).layout is claim.layout
+
+
+def test_records_by_field_name():
+    address = Address(state="MD", city="BALTIMORE")
+    assert address.city == "BALTIMORE"
+    assert address.zip is None
+    # in field order, not argument order
+    assert list(address.to_dict().items()) == [("city", "BALTIMORE"),
+                                               ("state", "MD")]
+    with pytest.raises(TypeError):
+        Address(county="HOWARD")
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/statm"),
+                    reason="model_memory reads /proc")
+def test_records_take_less_memory(tmpdir):
+    sizes = dict(model_memory(50, workdir=str(tmpdir)))
+    assert sizes["records"] * 3 < sizes["dicts"]
@@ -0,0 +1,35 @@
+"""
+python-bluebutton
+FILE: test_cms_parallel
+
+"""
+__author__ = 'Mark Scrimshire:@ekivemark'
+
+import pytest
+
+from conftest import as_json
+from cms_parallel import cms_parallel_parse, parallel_tasks
+from cms_parser import cms_stream_parse
+from cms_sections import cms_section_index
+
+
+@pytest.mark.parametrize("pool", ["process", "thread"])
+def test_pool_matches_stream_parse(cms_file, pool):
+    assert as_json(cms_parallel_parse(cms_file, workers=2, pool=pool)) == \
+        as_json(cms_stream_parse(cms_file))
+
+
+@pytest.mark.parametrize("chunk_claims", [1, 2, 5])
+def test_claim_chunks_match_stream_parse(cms_file, chunk_claims):
+    index = cms_section_index(cms_file)
+    tasks = parallel_tasks(cms_file, index, chunk_claims)
+    assert len([t for t in tasks if t["head"] is not None]) > 0
+    assert as_json(cms_parallel_parse(cms_file, workers=1,
+                                      chunk_claims=chunk_claims,
+                                      index=index)) == \
+        as_json(cms_stream_parse(cms_file))
+
+
+def test_unknown_pool(sample):
+    with pytest.raises(ValueError):
+        cms_parallel_parse(sample, pool="cluster")
@@ -0,0 +1,59 @@
+"""
+python-bluebutton
+FILE: test_cms_parser
+
+"""
+__author__ = 'Mark Scrimshire:@ekivemark'
+
+import copy
+import json
+from multiprocessing.pool import ThreadPool
+
+from cms_generator import cms_generate
+from cms_parser import CMSParser, cms_stream_parse, SEG_DEF
+
+
+def test_parser_matches_stream_parse(sample):
+    assert json.dumps(CMSParser().parse(sample)) == \
+        json.dumps(cms_stream_parse(sample))
+
+
+def test_parser_copies_seg_def(sample):
+    seg_def = copy.deepcopy(SEG_DEF)
+    seg_def[0]["pre"]["originator"] = "CHANGED"
+    parser = CMSParser(seg_def)
+    seg_def[0]["pre"]["originator"] = "LATER"
+    assert parser.parse(sample)["header"]["originator"] == "CHANGED"
+    assert cms_stream_parse(sample)["header"]["originator"] != "CHANGED"
+
+
+def test_results_do_not_share_prefill(sample):
+    parser = CMSParser()
+    first = parser.parse(sample)
+    first["header"]["comments"].append("changed")
+    second = parser.parse(sample)
+    assert "changed" not in second["header"]["comments"]
+
+
+def test_one_parser_in_many_threads(sample, partd_file, tmpdir):
+    paths = [sample, partd_file]
+    for seed in range(2):
+        path = str(tmpdir.join("generated%d.txt" % seed))
+        cms_generate(path, seed=seed, claims=20, part_d_claims=seed * 4)
+        paths.append(path)
+    expected = dict((path, json.dumps(cms_stream_parse(path)))
+                    for path in paths)
+
+    parser = CMSParser()
+    pool = ThreadPool(8)
+    try:
+        results = pool.map(parser.parse, paths * 8, 1)
+    finally:
+        pool.close()
+        pool.join()
+
+    for path, out_dict in zip(paths * 8, results):
+        assert json.dumps(out_dict) == expected[path]
+    # every result has its own prefill
+    assert len(set(id(r["header"]["comments"]) for r in results)) == \
+        len(results)
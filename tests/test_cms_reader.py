@@ -0,0 +1,45 @@
+"""
+python-bluebutton
+FILE: test_cms_reader
+
+"""
+__author__ = 'Mark Scrimshire:@ekivemark'
+
+import pytest
+
+from conftest import as_json
+from cms_parser import cms_file_read, cms_stream_parse, parse_lines
+from cms_reader import MappedLines, open_lines
+
+numpy = pytest.importorskip("numpy")
+
+
+def test_mapped_lines_match_the_file(cms_file):
+    with open(cms_file, 'rb') as f:
+        lines = f.readlines()
+    with MappedLines(cms_file) as m:
+        assert list(m) == lines
+    with MappedLines(cms_file, skip_blank=True) as m:
+        assert list(m) == [l.rstrip() for l in lines if l.strip()]
+        assert [m.line(n) for n in m.divider_lines()] == \
+            [l.rstrip() for l in lines if l.startswith("----------")]
+
+
+def test_mapped_lines_empty_file(tmpdir):
+    path = tmpdir.join("empty.txt")
+    path.write("")
+    with MappedLines(str(path)) as m:
+        assert list(m) == []
+        assert len(m.find("CLAIM NUMBER")) == 0
+
+
+def test_mmap_parse_matches_file_parse(cms_file):
+    full = as_json(cms_stream_parse(cms_file))
+    assert as_json(cms_stream_parse(cms_file, reader="mmap")) == full
+    assert as_json(parse_lines(cms_file_read(cms_file,
+                                             reader="mmap"))) == full
+
+
+def test_unknown_reader(sample):
+    with pytest.raises(ValueError):
+        open_lines(sample, "numpy")
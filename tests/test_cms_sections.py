@@ -0,0 +1,34 @@
+"""
+python-bluebutton
+FILE: test_cms_sections
+
+"""
+__author__ = 'Mark Scrimshire:@ekivemark'
+
+import collections
+
+from conftest import as_json
+from cms_parser import cms_stream_parse
+from cms_sections import (cms_section_index, cms_section_names,
+                          cms_section_parse)
+
+
+def test_every_section_matches_stream_parse(cms_file):
+    full = as_json(cms_stream_parse(cms_file))
+    assert as_json(cms_section_parse(cms_file)) == full
+    index = cms_section_index(cms_file)
+    assert as_json(cms_section_parse(cms_file, index=index)) == full
+
+
+def test_some_sections(cms_file):
+    full = cms_stream_parse(cms_file)
+    names = ["patient", "medications", "claims"]
+    part = cms_section_parse(cms_file, names)
+    assert list(part.keys()) == [k for k in full if k in names]
+    assert as_json(part) == \
+        as_json(collections.OrderedDict((k, full[k]) for k in part))
+
+
+def test_section_names(cms_file):
+    index = cms_section_index(cms_file)
+    assert cms_section_names(index) == list(cms_stream_parse(cms_file))
@@ -0,0 +1,20 @@
+"""
+python-bluebutton
+FILE: test_cms_stream
+
+"""
+__author__ = 'Mark Scrimshire:@ekivemark'
+
+from conftest import as_json
+from cms_parser import cms_file_read, cms_stream_parse, parse_lines
+
+
+def test_stream_parse_matches_read_then_parse(cms_file):
+    assert as_json(cms_stream_parse(cms_file)) == \
+        as_json(parse_lines(cms_file_read(cms_file)))
+
+
+def test_partd_file_has_partd_claims(partd_file):
+    claims = cms_stream_parse(partd_file)["claims"]
+    assert len([c for c in claims if "partDClaim" in c]) == 6
+    assert len([c for c in claims if "claim" in c]) > 7
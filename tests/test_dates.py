@@ -0,0 +1,32 @@
+"""
+python-bluebutton
+FILE: test_dates
+
+parse_date / parse_time against strptime
+
+"""
+__author__ = 'Mark Scrimshire:@ekivemark'
+
+import pytest
+
+import cms_benchmark
+from cms_benchmark import clear_date_caches
+from cms_parser_utilities import parse_date, parse_time
+
+
+def test_matches_strptime_in_any_order():
+    assert cms_benchmark.check_dates() == []
+
+
+def test_date_then_time_of_the_same_text():
+    clear_date_caches()
+    assert parse_date("3/4/2015") == "20150304"
+    with pytest.raises(ValueError):
+        parse_time("3/4/2015")
+
+
+def test_time_then_date_of_the_same_text():
+    clear_date_caches()
+    assert parse_time("3/4/2015 10:47 AM") == "20150304104700+0500"
+    with pytest.raises(ValueError):
+        parse_date("3/4/2015 10:47 AM")
@@ -0,0 +1,34 @@
+"""
+python-bluebutton
+FILE: test_iter_claims
+
+"""
+__author__ = 'Mark Scrimshire:@ekivemark'
+
+import json
+
+import pytest
+
+from cms_claims import iter_claims
+from cms_parser import cms_stream_parse
+
+
+@pytest.mark.parametrize("reader", ["file", "mmap"])
+def test_iter_claims_matches_stream_parse(cms_file, reader):
+    assert json.dumps(list(iter_claims(cms_file, reader))) == \
+        json.dumps(cms_stream_parse(cms_file)["claims"])
+
+
+def test_part_d_claims_come_out_on_their_own(partd_file):
+    claims = list(iter_claims(partd_file))
+    part_d = [c for c in claims if "partDClaim" in c]
+    assert len(part_d) == 6
+    for claim in part_d:
+        assert "details" not in claim
+
+
+def test_claims_come_out_one_at_a_time(sample):
+    claims = iter_claims(sample)
+    first = next(claims)
+    assert first == cms_stream_parse(sample)["claims"][0]
+    claims.close()
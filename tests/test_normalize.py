@@ -0,0 +1,65 @@
+"""
+python-bluebutton
+FILE: test_normalize
+
+"""
+__author__ = 'Mark Scrimshire:@ekivemark'
+
+import pytest
+
+from cms_parser import CMSParser, cms_stream_parse
+from cms_parser_utilities import parse_cents, parse_count
+
+
+def test_parse_cents():
+    assert parse_cents("$1,234.56") == 123456
+    assert parse_cents("-$5.00") == -500
+    assert parse_cents("$0.07") == 7
+    assert parse_cents("5.5") == 550
+    for v in ["* Not Available *", "$", "", "$1.234", "abc"]:
+        assert parse_cents(v) is None
+
+
+def test_parse_count():
+    assert parse_count("  3") == 3
+    assert parse_count("1.5") is None
+
+
+def test_normalize(cms_file):
+    claims = CMSParser(normalize=True).parse(cms_file)["claims"]
+    text = cms_stream_parse(cms_file)["claims"]
+    charges = [(c["charges"], t["charges"]) for c, t in zip(claims, text)
+               if "charges" in c]
+    assert charges
+    for c, t in charges:
+        for k, v in c.items():
+            if isinstance(v, int):
+                assert v == parse_cents(t[k])
+            else:
+                assert v == t[k] and parse_cents(v) is None
+
+
+def test_keep_raw(cms_file):
+    raw = CMSParser(normalize=True, keep_raw=True).parse(cms_file)["claims"]
+    text = cms_stream_parse(cms_file)["claims"]
+    kept = 0
+    for r, t in zip(raw, text):
+        for k, v in t.get("charges", {}).items():
+            if isinstance(r["charges"][k], dict):
+                assert r["charges"][k] == {"value": parse_cents(v),
+                                           "raw": v}
+                kept += 1
+    assert kept
+
+
+def test_text_by_default(sample):
+    assert CMSParser().parse(sample) == cms_stream_parse(sample)
+    # fld_types is only used with normalize=True
+    CMSParser(fld_types={"amountCharged": "money"})
+
+
+def test_normalize_bad_type():
+    with pytest.raises(ValueError) as e:
+        CMSParser(normalize=True, fld_types={"amountCharged": "money"})
+    assert "amountCharged" in str(e.value)
+    assert "money" in str(e.value)